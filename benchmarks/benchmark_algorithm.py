@@ -0,0 +1,186 @@
+""" A benchmark of the optimization algorithm on synthetic fleets of devices.
+
+Usage (from the root of the repository):
+    python -m benchmarks.benchmark_algorithm
+    python -m benchmarks.benchmark_algorithm --devices 10 100 500 --save benchmarks/baseline.json
+    python -m benchmarks.benchmark_algorithm --compare benchmarks/baseline.json
+
+For each case, the solver is timed and the number of iterations per second, the objective compared to
+the exact algorithm (for the small fleets) and the peak memory are reported. The results can be saved
+as a JSON baseline and compared with a previous baseline. The exit code is 1 if a regression is found.
+"""
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from custom_components.solar_optimizer.core import ALGORITHM_MODE_EXACT, DeviceSnapshot, SimulatedAnnealingAlgorithm
+
+BASELINE_VERSION = 1
+
+# The house consumption without the managed devices
+BASE_CONSUMPTION = 500
+
+
+def benchmark_device(name: str, power_max: float, power_min: int = -1, power_step: int = 0, current_power: float = 0, priority: int = 4) -> DeviceSnapshot:
+    """A device of the benchmark. It is active if it has a current power"""
+    return DeviceSnapshot(name, name, power_max, power_min, power_step, current_power, is_active=current_power > 0, priority=priority)
+
+
+def build_fleet(nb_devices: int, variable_ratio: float, power_step: int, rng: random.Random) -> list[DeviceSnapshot]:
+    """Build a fleet of on/off and variable power devices. About a quarter of the devices are active"""
+    devices = []
+    for i in range(nb_devices):
+        priority = rng.choice((1, 2, 4, 8, 16))
+        if rng.random() < variable_ratio:
+            power_max = rng.randrange(10, 40) * power_step
+            current_power = rng.randrange(1, power_max // power_step + 1) * power_step if rng.random() < 0.25 else 0
+            devices.append(benchmark_device(f"variable_{i}", power_max, power_step, power_step, current_power, priority))
+        else:
+            power_max = rng.randrange(2, 60) * 50
+            current_power = power_max if rng.random() < 0.25 else 0
+            devices.append(benchmark_device(f"onoff_{i}", power_max, current_power=current_power, priority=priority))
+    return devices
+
+
+def build_situation(devices: list[DeviceSnapshot], rng: random.Random) -> tuple[float, float]:
+    """Returns the (net power consumption, solar production) with a production between 20% and 80% of the max power of the fleet"""
+    production = round(rng.uniform(0.2, 0.8) * sum(device.power_max for device in devices))
+    consumption = BASE_CONSUMPTION + sum(device.current_power for device in devices) - production
+    return consumption, production
+
+
+def run_case(nb_devices: int, variable_ratio: float, power_step: int, iterations: int, args) -> dict:
+    """Run one case of the benchmark and returns its metrics"""
+    rng = random.Random(args.seed + nb_devices)
+    devices = build_fleet(nb_devices, variable_ratio, power_step, rng)
+    consumption, production = build_situation(devices, rng)
+    problem = (devices, consumption, production, 1, 1, 0, 0, args.priority_weight)
+
+    algo = SimulatedAnnealingAlgorithm(args.initial_temp, args.min_temp, args.cooling_factor, iterations, max_duration_sec=3600, chains=args.chains, seed=args.seed)
+    durations = []
+    objectives = []
+    nb_iterations = 0
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        _, objective, _ = algo.recuit_simule(*problem)
+        durations.append(time.perf_counter() - start)
+        objectives.append(objective)
+        nb_iterations += algo.nombre_iterations_effectuees
+
+    # The memory is measured in a separate run because tracemalloc slows down the algorithm
+    tracemalloc.start()
+    algo.recuit_simule(*problem)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    reference_objective = None
+    if nb_devices <= args.reference_max_devices:
+        exact = SimulatedAnnealingAlgorithm(args.initial_temp, args.min_temp, args.cooling_factor, iterations, max_duration_sec=3600, mode=ALGORITHM_MODE_EXACT, exact_max_devices=nb_devices, seed=args.seed)
+        _, reference_objective, _ = exact.recuit_simule(*problem)
+        # None if the exact algorithm falls back to the simulated annealing
+        if exact.nombre_iterations_effectuees > 0:
+            reference_objective = None
+
+    objective = sum(objectives) / len(objectives)
+    duration = sum(durations)
+    return {
+        "devices": nb_devices,
+        "variable_ratio": variable_ratio,
+        "power_step": power_step,
+        "iterations": iterations,
+        "duration_ms": round(1000 * duration / args.repeat, 3),
+        "iterations_per_sec": round(nb_iterations / duration) if duration > 0 else None,
+        "objective": round(objective, 3),
+        "reference_objective": round(reference_objective, 3) if reference_objective is not None else None,
+        "gap": round(objective - reference_objective, 3) if reference_objective is not None else None,
+        "peak_memory_kb": round(peak_memory / 1024, 1),
+    }
+
+
+def case_key(result: dict) -> tuple:
+    """The key which identifies a case in a baseline"""
+    return (result["devices"], result["variable_ratio"], result["power_step"], result["iterations"])
+
+
+def compare(results: list[dict], baseline: dict, tolerance: float, quality_tolerance: float) -> list[str]:
+    """Returns the regressions of results compared to the baseline"""
+    regressions = []
+    previous = {case_key(result): result for result in baseline["results"]}
+    for result in results:
+        if (old := previous.get(case_key(result))) is None:
+            continue
+        name = "devices={} variable_ratio={} power_step={} iterations={}".format(*case_key(result))
+        if old["iterations_per_sec"] and result["iterations_per_sec"] < old["iterations_per_sec"] * (1 - tolerance):
+            regressions.append(f"{name}: {result['iterations_per_sec']} iterations/sec instead of {old['iterations_per_sec']}")
+        if old["gap"] is not None and result["gap"] is not None and result["gap"] > old["gap"] + quality_tolerance:
+            regressions.append(f"{name}: gap to the exact objective is {result['gap']} instead of {old['gap']}")
+        if result["peak_memory_kb"] > old["peak_memory_kb"] * (1 + tolerance):
+            regressions.append(f"{name}: peak memory is {result['peak_memory_kb']} kB instead of {old['peak_memory_kb']} kB")
+    return regressions
+
+
+def print_results(results: list[dict]):
+    """Print the results as a table"""
+    columns = ("devices", "variable_ratio", "power_step", "iterations", "duration_ms", "iterations_per_sec", "objective", "reference_objective", "gap", "peak_memory_kb")
+    print(" | ".join(columns))
+    for result in results:
+        print(" | ".join(str(result[column]) if result[column] is not None else "-" for column in columns))
+
+
+def parse_args(argv=None):
+    """Parse the command line"""
+    parser = argparse.ArgumentParser(description="Benchmark of the Solar Optimizer algorithm on synthetic fleets of devices")
+    parser.add_argument("--devices", type=int, nargs="+", default=[10, 50, 100, 500], help="the number of devices of the fleets")
+    parser.add_argument("--variable-ratios", type=float, nargs="+", default=[0.3], help="the ratio of variable power devices")
+    parser.add_argument("--power-steps", type=int, nargs="+", default=[100], help="the power step of the variable power devices")
+    parser.add_argument("--iterations", type=int, nargs="+", default=[1000, 5000], help="the max number of iterations")
+    parser.add_argument("--repeat", type=int, default=3, help="the number of runs of each case")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--initial-temp", type=float, default=1000)
+    parser.add_argument("--min-temp", type=float, default=0.05)
+    parser.add_argument("--cooling-factor", type=float, default=0.999, help="close to 1 so that the max number of iterations is reached")
+    parser.add_argument("--chains", type=int, default=1)
+    parser.add_argument("--priority-weight", type=int, default=0)
+    parser.add_argument("--reference-max-devices", type=int, default=50, help="the exact objective is calculated up to this number of devices")
+    parser.add_argument("--save", help="save the results as a JSON baseline in this file")
+    parser.add_argument("--compare", help="compare the results with the JSON baseline of this file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="the accepted relative loss of iterations/sec and memory")
+    parser.add_argument("--quality-tolerance", type=float, default=10, help="the accepted increase of the gap to the exact objective")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    """Run the benchmark"""
+    args = parse_args(argv)
+    results = [
+        run_case(nb_devices, variable_ratio, power_step, iterations, args)
+        for nb_devices in args.devices
+        for variable_ratio in args.variable_ratios
+        for power_step in args.power_steps
+        for iterations in args.iterations
+    ]
+    print_results(results)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump({"version": BASELINE_VERSION, "python": platform.python_version(), "results": results}, file, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if regressions := compare(results, baseline, args.tolerance, args.quality_tolerance):
+            print("Regressions:")
+            for regression in regressions:
+                print(" - " + regression)
+            return 1
+        print("No regression")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
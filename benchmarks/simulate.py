@@ -0,0 +1,136 @@
+""" Accelerated-time simulation of Solar Optimizer on a recorded day (or more).
+
+Usage (from the root of the repository, with the test requirements installed):
+    python -m benchmarks.simulate config.json series.csv
+    python -m benchmarks.simulate config.json history.csv --production-entity-id sensor.solar --consumption-entity-id sensor.house
+    python -m benchmarks.simulate config.json series.csv --step-sec 60 --output report.json
+
+The series is a CSV file with time, production and consumption columns (in W, the consumption of the house without the
+managed devices) or an export of the Home Assistant history. The configuration is a JSON file:
+    {
+        "algorithm": {"max_iteration_number": 1000},
+        "sell_cost": 0.06, "buy_cost": 0.25,
+        "central": {"raz_time": "05:00"},
+        "devices": [
+            {"name": "Pool pump", "entity_id": "switch.pool_pump", "power_max": 1500, "duration_min": 60},
+            {"name": "Car charger", "entity_id": "switch.car", "power_entity_id": "number.car_amps", "power_max": 3680,
+             "power_min": 690, "power_step": 230, "change_power_service": "number/set_value", "convert_power_divide_factor": 230}
+        ]
+    }
+The devices take the keys of their configuration entries. By default, a device is activated with the turn_on and
+turn_off services of the domain of its entity and is always usable.
+
+The summary of the simulation (energies, self-consumption, switches by device and CPU time by cycle) is printed.
+The full report with the decisions of each cycle is written in the output file.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from datetime import timedelta
+
+from homeassistant import loader
+from homeassistant.setup import async_setup_component
+from pytest_homeassistant_custom_component.common import MockConfigEntry, async_test_home_assistant
+
+from custom_components.solar_optimizer.const import (
+    DOMAIN,
+    CONF_NAME,
+    CONF_DEVICE_TYPE,
+    CONF_DEVICE_CENTRAL,
+    CONF_DEVICE,
+    CONF_POWERED_DEVICE,
+    CONF_ENTITY_ID,
+    CONF_POWER_ENTITY_ID,
+    CONF_REFRESH_PERIOD_SEC,
+    CONF_POWER_CONSUMPTION_ENTITY_ID,
+    CONF_POWER_PRODUCTION_ENTITY_ID,
+    CONF_SELL_COST_ENTITY_ID,
+    CONF_BUY_COST_ENTITY_ID,
+    CONF_SELL_TAX_PERCENT_ENTITY_ID,
+    CONF_CHECK_USABLE_TEMPLATE,
+    CONF_DURATION_MIN,
+    CONF_DURATION_STOP_MIN,
+    CONF_ACTION_MODE,
+    CONF_ACTION_MODE_ACTION,
+    CONF_ACTIVATION_SERVICE,
+    CONF_DEACTIVATION_SERVICE,
+)
+from custom_components.solar_optimizer.coordinator import SolarOptimizerCoordinator
+from custom_components.solar_optimizer.simulation import Simulation, load_series
+
+CENTRAL_DEFAULTS = {
+    CONF_NAME: "Configuration",
+    CONF_DEVICE_TYPE: CONF_DEVICE_CENTRAL,
+    CONF_REFRESH_PERIOD_SEC: 60,
+    CONF_POWER_CONSUMPTION_ENTITY_ID: "sensor.simulated_power_consumption",
+    CONF_POWER_PRODUCTION_ENTITY_ID: "sensor.simulated_power_production",
+    CONF_SELL_COST_ENTITY_ID: "input_number.simulated_sell_cost",
+    CONF_BUY_COST_ENTITY_ID: "input_number.simulated_buy_cost",
+    CONF_SELL_TAX_PERCENT_ENTITY_ID: "input_number.simulated_sell_tax_percent",
+}
+
+
+def device_entry_data(device: dict) -> dict:
+    """The data of the configuration entry of a simulated device"""
+    domain = device[CONF_ENTITY_ID].split(".")[0]
+    return {
+        CONF_DEVICE_TYPE: CONF_POWERED_DEVICE if device.get(CONF_POWER_ENTITY_ID) else CONF_DEVICE,
+        CONF_CHECK_USABLE_TEMPLATE: "{{ True }}",
+        CONF_DURATION_MIN: 1,
+        CONF_DURATION_STOP_MIN: 1,
+        CONF_ACTION_MODE: CONF_ACTION_MODE_ACTION,
+        CONF_ACTIVATION_SERVICE: f"{domain}/turn_on",
+        CONF_DEACTIVATION_SERVICE: f"{domain}/turn_off",
+        **device,
+    }
+
+
+async def async_simulate(config: dict, args) -> dict:
+    """Configure Solar Optimizer in a test Home Assistant and run the simulation"""
+    async with async_test_home_assistant() as hass:
+        # the times without time zone are in the time zone of Home Assistant
+        series = load_series(args.series, args.production_entity_id, args.consumption_entity_id)
+        # let the integration of the repository be loaded
+        hass.data.pop(loader.DATA_CUSTOM_COMPONENTS, None)
+        SolarOptimizerCoordinator.reset()
+        assert await async_setup_component(hass, DOMAIN, {DOMAIN: {"algorithm": config.get("algorithm", {})}})
+
+        entries = [{**CENTRAL_DEFAULTS, **config.get("central", {})}] + [device_entry_data(device) for device in config["devices"]]
+        for data in entries:
+            entry = MockConfigEntry(domain=DOMAIN, title=data[CONF_NAME], unique_id=data[CONF_NAME], data=data)
+            entry.add_to_hass(hass)
+            await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+
+        simulation = Simulation(hass, SolarOptimizerCoordinator.get_coordinator(), config.get("sell_cost", 1), config.get("buy_cost", 1))
+        report = await simulation.async_run(series, timedelta(seconds=args.step_sec))
+        await hass.async_stop(force=True)
+    return report
+
+
+def main(argv=None) -> int:
+    """Run the simulation and print its summary"""
+    parser = argparse.ArgumentParser(description="Simulate Solar Optimizer in accelerated time on recorded series")
+    parser.add_argument("config", help="the JSON file of the configuration of the simulation")
+    parser.add_argument("series", help="the CSV file of the production and consumption series")
+    parser.add_argument("--production-entity-id", help="the production entity of a Home Assistant history export")
+    parser.add_argument("--consumption-entity-id", help="the consumption entity of a Home Assistant history export")
+    parser.add_argument("--step-sec", type=int, default=60, help="the simulated time between two cycles")
+    parser.add_argument("--output", help="the JSON file of the full report with the decisions of each cycle")
+    args = parser.parse_args(argv)
+
+    with open(args.config, encoding="utf-8") as file:
+        config = json.load(file)
+    report = asyncio.run(async_simulate(config, args))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    print(json.dumps({key: value for key, value in report.items() if key != "decisions"}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
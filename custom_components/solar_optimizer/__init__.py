@@ -2,10 +2,11 @@
 
 import logging
 import asyncio
+from functools import partial
 import voluptuous as vol
 
 from homeassistant.const import EVENT_HOMEASSISTANT_START, SERVICE_RELOAD
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, ServiceCall, ServiceResponse, SupportsResponse
 from homeassistant.setup import async_setup_component
 
 
@@ -30,6 +31,7 @@ from .const import (
     SERVICE_RESET_ON_TIME,
     SERVICE_START_DEVICE,
     SERVICE_STOP_DEVICE,
+    SERVICE_GET_CAPTURED_CYCLES,
     validate_time_format,
     name_to_unique_id,
     CONF_NAME,
@@ -37,6 +39,9 @@ from .const import (
     CONF_BATTERY_SOC_THRESHOLD,
     CONF_MAX_ON_TIME_PER_DAY_MIN,
     CONF_MIN_ON_TIME_PER_DAY_MIN,
+    ALGORITHM_MODE_ANNEALING,
+    ALGORITHM_MODES,
+    PRIORITIES,
 )
 from .coordinator import SolarOptimizerCoordinator
 
@@ -56,6 +61,26 @@ CONFIG_SCHEMA = vol.Schema(
                         vol.Required(
                             "max_iteration_number", default=1000
                         ): cv.positive_int,
+                        vol.Required("max_duration_sec", default=5): vol.Coerce(float),
+                        vol.Required("mode", default=ALGORITHM_MODE_ANNEALING): vol.In(ALGORITHM_MODES),
+                        vol.Required("exact_max_devices", default=20): cv.positive_int,
+                        vol.Required("chains", default=1): cv.positive_int,
+                        vol.Required("adaptive_schedule", default=False): cv.boolean,
+                        vol.Required("iterations_per_device", default=50): cv.positive_int,
+                        vol.Required("max_iterations_without_improvement", default=200): cv.positive_int,
+                        vol.Required("fast_paths", default=True): cv.boolean,
+                        vol.Required("warm_start", default=True): cv.boolean,
+                        vol.Required("cache_size", default=32): cv.positive_int,
+                        vol.Required("cache_ttl_sec", default=60): vol.Coerce(float),
+                        vol.Required("cache_power_bucket", default=50): vol.Coerce(float),
+                        vol.Required("refresh_min_interval_sec", default=10): vol.Coerce(float),
+                        vol.Required("refresh_min_power_change", default=50): vol.Coerce(float),
+                        vol.Required("action_timeout_sec", default=10): vol.Coerce(float),
+                        vol.Required("max_concurrent_actions", default=5): cv.positive_int,
+                        vol.Optional("seed"): cv.positive_int,
+                        vol.Required("replay_buffer_size", default=20): cv.positive_int,
+                        vol.Required("publish_enable_state_events", default=False): cv.boolean,
+                        vol.Optional("refresh_on_usable_priority"): vol.In(PRIORITIES),
                     }
                 ),
             }
@@ -180,7 +205,9 @@ async def async_setup(
         if device is None:
             _LOGGER.warning("start_device: device '%s' not found", device_id)
             return
-        await device.start_forced(duration_hours=float(duration) if duration is not None else None)
+        await coordinator.async_run_device_action(
+            device, partial(device.start_forced, duration_hours=float(duration) if duration is not None else None)
+        )
         hass.async_create_task(coordinator.async_refresh())
 
     hass.services.async_register(DOMAIN, SERVICE_START_DEVICE, _handle_start_device)
@@ -196,11 +223,23 @@ async def async_setup(
         if device is None:
             _LOGGER.warning("stop_device: device '%s' not found", device_id)
             return
-        await device.stop_forced()
+        await coordinator.async_run_device_action(device, device.stop_forced)
         hass.async_create_task(coordinator.async_refresh())
 
     hass.services.async_register(DOMAIN, SERVICE_STOP_DEVICE, _handle_stop_device)
 
+    async def _handle_get_captured_cycles(_: ServiceCall) -> ServiceResponse:
+        """Handle solar_optimizer.get_captured_cycles service call. The cycles could be replayed offline"""
+        coordinator = SolarOptimizerCoordinator.get_coordinator()
+        if coordinator is None:
+            _LOGGER.error("get_captured_cycles: coordinator not found")
+            return {"cycles": []}
+        return {"cycles": coordinator.captured_cycles}
+
+    hass.services.async_register(
+        DOMAIN, SERVICE_GET_CAPTURED_CYCLES, _handle_get_captured_cycles, supports_response=SupportsResponse.ONLY
+    )
+
     await async_setup_reload_service(hass, DOMAIN, PLATFORMS)
 
     hass.bus.async_listen_once("homeassistant_started", coordinator.on_ha_started)
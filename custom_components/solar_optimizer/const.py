@@ -11,6 +11,18 @@ from homeassistant.core import HomeAssistant, HomeAssistantError
 from homeassistant.util import dt as dt_util
 from homeassistant.helpers.template import Template, is_template_string
 
+# The algorithm modes are defined by the optimization core
+from .core.const import (  # pylint: disable=unused-import
+    ALGORITHM_MODE_ANNEALING,
+    ALGORITHM_MODE_EXACT,
+    ALGORITHM_MODES,
+    FAST_PATHS,
+    FAST_PATH_NO_USABLE_DEVICES,
+    FAST_PATH_NO_SURPLUS,
+    FAST_PATH_SURPLUS_ABOVE_MAX_POWER,
+    FAST_PATH_SURPLUS_BELOW_MIN_POWER,
+)
+
 SOLAR_OPTIMIZER_DOMAIN = DOMAIN = "solar_optimizer"
 PLATFORMS: list[Platform] = [Platform.SENSOR, Platform.SWITCH, Platform.SELECT]
 
@@ -32,6 +44,9 @@ EVENT_TYPE_SOLAR_OPTIMIZER_ENABLE_STATE_CHANGE = (
     "solar_optimizer_enable_state_change_event"
 )
 
+# The internal signal of the enable state change of one device. Formatted with the unique_id of the device
+SIGNAL_ENABLE_STATE_CHANGE = "solar_optimizer_enable_state_change_{}"
+
 DEVICE_MODEL = "Solar Optimizer device"
 INTEGRATION_MODEL = "Solar Optimizer"
 DEVICE_MANUFACTURER = "JM. COLLIN"
@@ -39,6 +54,7 @@ DEVICE_MANUFACTURER = "JM. COLLIN"
 SERVICE_RESET_ON_TIME = "reset_on_time"
 SERVICE_START_DEVICE = "start_device"
 SERVICE_STOP_DEVICE = "stop_device"
+SERVICE_GET_CAPTURED_CYCLES = "get_captured_cycles"
 
 TIME_REGEX = r"^(?:[01]\d|2[0-3]):[0-5]\d$"
 CONFIG_VERSION = 2
@@ -1,15 +1,24 @@
 """ The data coordinator class """
 
+import asyncio
 import logging
 import math
+import random
+import time as time_module
+from collections import OrderedDict, deque
 from datetime import datetime, timedelta, time
-from typing import Any
+from functools import partial
+from types import MappingProxyType
+from typing import Any, Callable
 
-from homeassistant.core import HomeAssistant, Event, EventStateChangedData
+from homeassistant.core import HomeAssistant, Event, EventStateChangedData, State, callback
 from homeassistant.components.select import SelectEntity
 
+from homeassistant.helpers.debounce import Debouncer
 from homeassistant.helpers.event import (
     async_track_state_change_event,
+    async_track_time_change,
+    async_track_time_interval,
 )
 
 from homeassistant.helpers.update_coordinator import (
@@ -23,17 +32,41 @@ from homeassistant.util.unit_conversion import (
 
 from homeassistant.config_entries import ConfigEntry
 
-from .const import DEFAULT_REFRESH_PERIOD_SEC, name_to_unique_id, SOLAR_OPTIMIZER_DOMAIN, DEFAULT_RAZ_TIME
+from .const import (
+    DEFAULT_REFRESH_PERIOD_SEC,
+    name_to_unique_id,
+    SOLAR_OPTIMIZER_DOMAIN,
+    DEFAULT_RAZ_TIME,
+    ALGORITHM_MODE_ANNEALING,
+    PRIORITY_MAP,
+)
 from .managed_device import ManagedDevice
-from .simulated_annealing_algo import SimulatedAnnealingAlgorithm
+from .core import GridSnapshot, SimulatedAnnealingAlgorithm
 
 _LOGGER = logging.getLogger(__name__)
 
+# The battery SOC is rounded to this step in the optimization result cache key
+SOC_BUCKET_PERCENT = 5
+
+# The number of refresh cycles used for the rolling statistics of the cycle durations
+CYCLE_STATISTICS_SIZE = 100
+
+# The period of the shared ticker which accumulates the on time of the devices
+ON_TIME_TICK_PERIOD = timedelta(minutes=1)
+
 
 def get_safe_float(hass, entity_id: str, unit: str = None):
     """Get a safe float state value for an entity.
     Return None if entity is not available"""
-    if entity_id is None or not (state := hass.states.get(entity_id)) or state.state == "unknown" or state.state == "unavailable":
+    if entity_id is None:
+        return None
+    return get_safe_float_from_state(hass.states.get(entity_id), unit)
+
+
+def get_safe_float_from_state(state: State | None, unit: str = None):
+    """Get a safe float value of a state, converted to unit if it is a power.
+    Return None if the state is not available"""
+    if not state or state.state == "unknown" or state.state == "unavailable":
         return None
 
     float_val = float(state.state)
@@ -47,6 +80,141 @@ def get_safe_float(hass, entity_id: str, unit: str = None):
     return None if math.isinf(float_val) or not math.isfinite(float_val) else float_val
 
 
+class InputSnapshot:
+    """An immutable snapshot of the states read by a refresh cycle. Each entity is read once, so that the coordinator,
+    the devices and the solver see the same consistent situation. The values of the power entities and of the
+    numeric entities are converted once when the snapshot is taken. The other entities (the power entities of the
+    devices, which could be a light or a fan) are converted on demand"""
+
+    __slots__ = ("_states", "_values", "_powers")
+
+    def __init__(self, hass: HomeAssistant, entity_ids, power_entity_ids, numeric_entity_ids=()):
+        states = {}
+        for entity_id in entity_ids:
+            if entity_id is not None and entity_id not in states:
+                states[entity_id] = hass.states.get(entity_id)
+        self._states = MappingProxyType(states)
+        self._values = MappingProxyType(
+            {
+                entity_id: get_safe_float_from_state(states[entity_id])
+                for entity_id in (*power_entity_ids, *numeric_entity_ids)
+                if entity_id in states
+            }
+        )
+        self._powers = MappingProxyType(
+            {entity_id: get_safe_float_from_state(states[entity_id], "W") for entity_id in power_entity_ids if entity_id in states}
+        )
+
+    def get_state(self, entity_id: str) -> State | None:
+        """The state of entity_id when the snapshot has been taken"""
+        return self._states.get(entity_id)
+
+    def get_float(self, entity_id: str) -> float | None:
+        """The float value of entity_id or None if it is not available or not a number"""
+        if entity_id in self._values:
+            return self._values[entity_id]
+        return self._convert(entity_id, None)
+
+    def get_power(self, entity_id: str) -> float | None:
+        """The power of entity_id in W or None if it is not available or not a number"""
+        if entity_id in self._powers:
+            return self._powers[entity_id]
+        return self._convert(entity_id, "W")
+
+    def _convert(self, entity_id: str, unit: str | None) -> float | None:
+        """Convert the state of an entity which has not been converted when the snapshot has been taken"""
+        try:
+            return get_safe_float_from_state(self._states.get(entity_id), unit)
+        except ValueError:
+            return None
+
+    @property
+    def entity_ids(self) -> tuple[str, ...]:
+        """The entity ids read by the snapshot"""
+        return tuple(self._states)
+
+
+class OptimizationCache:
+    """A bounded LRU cache of the optimization results. An entry older than ttl_sec is never returned"""
+
+    def __init__(self, max_size: int, ttl_sec: float):
+        self._max_size = max_size
+        self._ttl_sec = ttl_sec
+        self._entries: OrderedDict[tuple, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def is_enabled(self) -> bool:
+        """True if the results should be cached"""
+        return self._max_size > 0
+
+    def get(self, key: tuple, now: float) -> Any | None:
+        """Returns the cached result for key or None if there is no fresh result"""
+        entry = self._entries.get(key)
+        if entry is None or now - entry[0] > self._ttl_sec:
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: tuple, value: Any, now: float):
+        """Store a result and evict the least recently used ones"""
+        self._entries[key] = (now, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Forget all the cached results"""
+        self._entries.clear()
+
+
+class CycleStatistics:
+    """The durations of the last refresh cycles with their rolling p50, p95 and max"""
+
+    STEPS = ("state", "solver", "actuation", "total")
+
+    def __init__(self, size: int):
+        self._durations_ms: dict[str, deque[float]] = {step: deque(maxlen=size) for step in self.STEPS}
+        self._iterations: int = 0
+        self._acceptance_ratio: float | None = None
+        self.cycles = 0
+
+    def add(self, durations_ms: dict[str, float], iterations: int, acceptance_ratio: float | None):
+        """Add the durations (by step) of a cycle"""
+        for step in self.STEPS:
+            self._durations_ms[step].append(durations_ms[step])
+        self._iterations = iterations
+        self._acceptance_ratio = acceptance_ratio
+        self.cycles += 1
+
+    @staticmethod
+    def percentile(values: list[float], ratio: float) -> float:
+        """The nearest-rank percentile of sorted values"""
+        return values[max(0, math.ceil(ratio * len(values)) - 1)]
+
+    def as_attributes(self) -> dict[str, Any]:
+        """The statistics as state attributes"""
+        attributes = {}
+        for step, durations in self._durations_ms.items():
+            if not durations:
+                continue
+            values = sorted(durations)
+            attributes[f"{step}_ms"] = round(durations[-1], 1)
+            attributes[f"{step}_p50_ms"] = round(self.percentile(values, 0.5), 1)
+            attributes[f"{step}_p95_ms"] = round(self.percentile(values, 0.95), 1)
+            attributes[f"{step}_max_ms"] = round(values[-1], 1)
+        attributes["iterations"] = self._iterations
+        attributes["acceptance_ratio"] = round(self._acceptance_ratio, 3) if self._acceptance_ratio is not None else None
+        attributes["cycles"] = self.cycles
+        return attributes
+
+
 class SolarOptimizerCoordinator(DataUpdateCoordinator):
     """The coordinator class which is used to coordinate all update"""
 
@@ -56,6 +224,8 @@ class SolarOptimizerCoordinator(DataUpdateCoordinator):
         """Initialize the coordinator"""
         SolarOptimizerCoordinator.hass = hass
         self._devices: list[ManagedDevice] = []
+        self._devices_by_unique_id: dict[str, ManagedDevice] = {}
+        self._devices_by_name: dict[str, ManagedDevice] = {}
         self._power_consumption_entity_id: str = None
         self._power_production_entity_id: str = None
         self._subscribe_to_events: bool = False
@@ -68,6 +238,13 @@ class SolarOptimizerCoordinator(DataUpdateCoordinator):
         self._battery_soc_entity_id: str = None
         self._battery_charge_power_entity_id: str = None
         self._raz_time: time = None
+        # The on time sensors of all the devices are updated by one shared ticker, which also resets them at raz_time
+        self._on_time_sensors: list = []
+        self._unsub_on_time_tick = None
+        self._unsub_on_time_raz = None
+        # The best solution of the previous cycle (by device unique_id) and the power consumed without the managed devices
+        self._last_best_solution: dict[str, dict] | None = None
+        self._last_base_power: float | None = None
 
         self._central_config_done = False
         self._priority_weight_entity = None
@@ -78,16 +255,105 @@ class SolarOptimizerCoordinator(DataUpdateCoordinator):
         min_temp = 0.05
         cooling_factor = 0.95
         max_iteration_number = 1000
+        max_duration_sec = 5
+        mode = ALGORITHM_MODE_ANNEALING
+        exact_max_devices = 20
+        chains = 1
+        adaptive_schedule = False
+        iterations_per_device = 50
+        max_iterations_without_improvement = 200
+        fast_paths = True
+        self._warm_start = True
+        cache_size = 32
+        cache_ttl_sec = 60
+        self._cache_power_bucket = 50
+        refresh_min_interval_sec = 10
+        self._refresh_min_power_change = 50
+        self._action_timeout_sec = 10
+        self._max_concurrent_actions = 5
+        seed = None
+        replay_buffer_size = 20
+        self._publish_enable_state_events = False
+        refresh_on_usable_priority = None
 
         if config and (algo_config := config.get("algorithm")):
             init_temp = float(algo_config.get("initial_temp", 1000))
             min_temp = float(algo_config.get("min_temp", 0.05))
             cooling_factor = float(algo_config.get("cooling_factor", 0.95))
             max_iteration_number = int(algo_config.get("max_iteration_number", 1000))
+            max_duration_sec = float(algo_config.get("max_duration_sec", 5))
+            mode = algo_config.get("mode", ALGORITHM_MODE_ANNEALING)
+            exact_max_devices = int(algo_config.get("exact_max_devices", 20))
+            chains = int(algo_config.get("chains", 1))
+            adaptive_schedule = bool(algo_config.get("adaptive_schedule", False))
+            iterations_per_device = int(algo_config.get("iterations_per_device", 50))
+            max_iterations_without_improvement = int(algo_config.get("max_iterations_without_improvement", 200))
+            fast_paths = bool(algo_config.get("fast_paths", True))
+            self._warm_start = bool(algo_config.get("warm_start", True))
+            cache_size = int(algo_config.get("cache_size", 32))
+            cache_ttl_sec = float(algo_config.get("cache_ttl_sec", 60))
+            self._cache_power_bucket = float(algo_config.get("cache_power_bucket", 50))
+            refresh_min_interval_sec = float(algo_config.get("refresh_min_interval_sec", 10))
+            self._refresh_min_power_change = float(algo_config.get("refresh_min_power_change", 50))
+            self._action_timeout_sec = float(algo_config.get("action_timeout_sec", 10))
+            self._max_concurrent_actions = max(1, int(algo_config.get("max_concurrent_actions", 5)))
+            seed = algo_config.get("seed")
+            replay_buffer_size = int(algo_config.get("replay_buffer_size", 20))
+            self._publish_enable_state_events = bool(algo_config.get("publish_enable_state_events", False))
+            refresh_on_usable_priority = algo_config.get("refresh_on_usable_priority")
 
         self._algo = SimulatedAnnealingAlgorithm(
-            init_temp, min_temp, cooling_factor, max_iteration_number
+            init_temp,
+            min_temp,
+            cooling_factor,
+            max_iteration_number,
+            max_duration_sec,
+            mode,
+            exact_max_devices,
+            chains,
+            adaptive_schedule=adaptive_schedule,
+            iterations_per_device=iterations_per_device,
+            max_iterations_without_improvement=max_iterations_without_improvement,
+            fast_paths=fast_paths,
+        )
+        self._cache = OptimizationCache(cache_size, cache_ttl_sec)
+        self._cycle_statistics = CycleStatistics(CYCLE_STATISTICS_SIZE)
+        # Each optimization is seeded with a seed drawn from this generator. The inputs of the last
+        # optimizations are kept with their seed so that they could be replayed
+        self._seeds = random.Random(seed)
+        self._captured_cycles: deque[dict] = deque(maxlen=replay_buffer_size)
+
+        # The live index of the devices whose check_usable and check_active templates are true. It is updated by
+        # the template tracking of the devices. A device with a priority up to refresh_on_usable_priority which
+        # becomes usable triggers a refresh without waiting for the next cycle
+        self._template_trackers: dict[str, Callable[[], None]] = {}
+        self._usable_device_ids: set[str] = set()
+        self._active_device_ids: set[str] = set()
+        self._refresh_on_usable_priority = PRIORITY_MAP[refresh_on_usable_priority] if refresh_on_usable_priority else None
+        self._usable_refreshes = 0
+
+        # Bursts of consumption or production events are collapsed into one refresh: the first event refreshes
+        # immediately and the events received during refresh_min_interval_sec give one refresh at the end of it
+        self._event_debouncer = Debouncer(
+            hass,
+            _LOGGER,
+            cooldown=refresh_min_interval_sec,
+            immediate=True,
+            function=self._async_refresh_on_event,
+        )
+        # The refreshes when a high priority device becomes usable are limited in the same way. They are not
+        # consumption or production events and are not counted in the events statistics
+        self._usable_debouncer = Debouncer(
+            hass,
+            _LOGGER,
+            cooldown=refresh_min_interval_sec,
+            immediate=True,
+            function=self._async_refresh_out_of_band,
         )
+        # The consumption and production used by the last refresh (by entity_id)
+        self._last_refresh_powers: dict[str, float] = {}
+        self._events_received = 0
+        self._events_executed = 0
         self.config = config
 
     async def configure(self, config: ConfigEntry) -> None:
@@ -107,6 +373,8 @@ class SolarOptimizerCoordinator(DataUpdateCoordinator):
         if self._unsub_events is not None:
             self._unsub_events()
             self._unsub_events = None
+        self._event_debouncer.async_cancel()
+        self._usable_debouncer.async_cancel()
 
         if self._subscribe_to_events:
             self._unsub_events = async_track_state_change_event(
@@ -127,13 +395,87 @@ class SolarOptimizerCoordinator(DataUpdateCoordinator):
         self._raz_time = datetime.strptime(
             config.data.get("raz_time") or DEFAULT_RAZ_TIME, "%H:%M"
         ).time()
+        # raz_time could have changed
+        if self._unsub_on_time_raz is not None:
+            self._unsub_on_time_raz()
+            self._unsub_on_time_raz = self._track_raz_time()
         self._central_config_done = True
 
+    def register_on_time_sensor(self, sensor) -> Callable[[], None]:
+        """Register an on time sensor to the shared ticker. The ticker is started with the first sensor and
+        stopped with the last one. Returns the function which unregisters the sensor"""
+        self._on_time_sensors.append(sensor)
+        if self._unsub_on_time_tick is None:
+            self._unsub_on_time_tick = async_track_time_interval(self.hass, self._async_on_time_tick, ON_TIME_TICK_PERIOD)
+            self._unsub_on_time_raz = self._track_raz_time()
+
+        @callback
+        def unregister():
+            if sensor in self._on_time_sensors:
+                self._on_time_sensors.remove(sensor)
+            if not self._on_time_sensors and self._unsub_on_time_tick is not None:
+                self._unsub_on_time_tick()
+                self._unsub_on_time_raz()
+                self._unsub_on_time_tick = self._unsub_on_time_raz = None
+
+        return unregister
+
+    def _track_raz_time(self) -> Callable[[], None]:
+        """Listen to raz_time to reset the on time sensors"""
+        raz_time = self._raz_time or datetime.strptime(DEFAULT_RAZ_TIME, "%H:%M").time()
+        return async_track_time_change(
+            self.hass, self._async_on_raz_time, hour=raz_time.hour, minute=raz_time.minute, second=0
+        )
+
+    @callback
+    def _async_on_time_tick(self, _=None) -> None:
+        """Accumulate the on time of all the active devices in one pass, then write only the sensors which have changed"""
+        changed = [sensor for sensor in self._on_time_sensors if sensor.accumulate_on_time()]
+        for sensor in changed:
+            sensor.async_write_ha_state()
+
+    @callback
+    def _async_on_raz_time(self, _=None) -> None:
+        """Reset the on time of all the devices at raz_time"""
+        _LOGGER.info("Reset of the on time of %d devices", len(self._on_time_sensors))
+        changed = [sensor for sensor in self._on_time_sensors if sensor.reset_on_time()]
+        for sensor in changed:
+            sensor.async_write_ha_state()
+
+    @callback
+    def async_update_on_time(self) -> None:
+        """Accumulate the on time of all the devices now, with the clock of the devices, without waiting for the ticker"""
+        self._async_on_time_tick()
+
+    @callback
+    def async_reset_on_time(self) -> None:
+        """Reset the on time of all the devices now, without waiting for raz_time"""
+        self._async_on_raz_time()
+
     async def on_ha_started(self, _) -> None:
         """Listen the homeassistant_started event to initialize the first calculation"""
         _LOGGER.info("First initialization of Solar Optimizer")
 
     async def _async_on_change(self, event: Event[EventStateChangedData]) -> None:
+        """Refresh when the consumption or the production has significantly changed since the last refresh"""
+        self._events_received += 1
+
+        entity_id = event.data["entity_id"]
+        power = get_safe_float(self.hass, entity_id, "W")
+        last_power = self._last_refresh_powers.get(entity_id)
+        if power is not None and last_power is not None and abs(power - last_power) < self._refresh_min_power_change:
+            _LOGGER.debug("Change of %s is not significant (%s -> %s). No refresh", entity_id, last_power, power)
+            return
+
+        await self._event_debouncer.async_call()
+
+    async def _async_refresh_on_event(self) -> None:
+        """Refresh called by the event debouncer"""
+        self._events_executed += 1
+        await self._async_refresh_out_of_band()
+
+    async def _async_refresh_out_of_band(self) -> None:
+        """Refresh before the end of the refresh period"""
         await self.async_refresh()
         self._schedule_refresh()
 
@@ -141,132 +483,375 @@ class SolarOptimizerCoordinator(DataUpdateCoordinator):
         _LOGGER.info("Refreshing Solar Optimizer calculation")
 
         calculated_data = {}
+        debut_cycle = time_module.monotonic()
 
         # Check forced activation timers — stop and re-enable any device whose timer has expired
         for device in self._devices:
-            expired = await device.expire_forced_activation()
+            try:
+                async with asyncio.timeout(self._action_timeout_sec):
+                    expired = await device.expire_forced_activation()
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception("%s - the end of the forced activation of %s has failed", self, device.name)
+                continue
             if expired:
                 _LOGGER.info("Forced activation expired for %s — SO management re-enabled", device.name)
 
-        # Add a device state attributes
-        for _, device in enumerate(self._devices):
-            # Initialize current power depending or reality
-            device.set_current_power_with_device_state()
+        # The templates of the devices are rendered once for the whole cycle, until the actions which change
+        # the states of the devices. The cycle is also ended if the calculation stops before them
+        for device in self._devices:
+            device.start_render_cycle()
+        try:
+            # All the entities of the cycle are read at once
+            snapshot = self.take_snapshot()
+
+            # Add a device state attributes
+            for _, device in enumerate(self._devices):
+                # Initialize current power depending or reality
+                device.set_current_power_with_device_state(snapshot)
+
+            # Add a power_consumption and power_production
+            power_production = snapshot.get_power(self._power_production_entity_id)
+            if power_production is None:
+                _LOGGER.warning(
+                    "Power production is not valued. Solar Optimizer will be disabled"
+                )
+                return None
 
-        # Add a power_consumption and power_production
-        power_production = get_safe_float(self.hass, self._power_production_entity_id, "W")
-        if power_production is None:
-            _LOGGER.warning(
-                "Power production is not valued. Solar Optimizer will be disabled"
-            )
-            return None
+            if not self._smooth_production:
+                calculated_data["power_production"] = power_production
+            else:
+                self._last_production = round(
+                    0.5 * self._last_production + 0.5 * power_production
+                )
+                calculated_data["power_production"] = self._last_production
 
-        if not self._smooth_production:
-            calculated_data["power_production"] = power_production
-        else:
-            self._last_production = round(
-                0.5 * self._last_production + 0.5 * power_production
-            )
-            calculated_data["power_production"] = self._last_production
+            calculated_data["power_production_brut"] = power_production
 
-        calculated_data["power_production_brut"] = power_production
+            calculated_data["power_consumption"] = snapshot.get_power(self._power_consumption_entity_id)
 
-        calculated_data["power_consumption"] = get_safe_float(
-            self.hass, self._power_consumption_entity_id, "W"
-        )
+            self._last_refresh_powers = {
+                self._power_production_entity_id: power_production,
+                self._power_consumption_entity_id: calculated_data["power_consumption"],
+            }
 
-        calculated_data["sell_cost"] = get_safe_float(
-            self.hass, self._sell_cost_entity_id
-        )
+            calculated_data["sell_cost"] = snapshot.get_float(self._sell_cost_entity_id)
 
-        calculated_data["buy_cost"] = get_safe_float(
-            self.hass, self._buy_cost_entity_id
-        )
+            calculated_data["buy_cost"] = snapshot.get_float(self._buy_cost_entity_id)
 
-        calculated_data["sell_tax_percent"] = get_safe_float(
-            self.hass, self._sell_tax_percent_entity_id
-        )
+            calculated_data["sell_tax_percent"] = snapshot.get_float(self._sell_tax_percent_entity_id)
 
-        soc = get_safe_float(self.hass, self._battery_soc_entity_id)
-        calculated_data["battery_soc"] = soc if soc is not None else 0
+            soc = snapshot.get_float(self._battery_soc_entity_id)
+            calculated_data["battery_soc"] = soc if soc is not None else 0
+
+            charge_power = snapshot.get_float(self._battery_charge_power_entity_id)
+            calculated_data["battery_charge_power"] = (
+                charge_power if charge_power is not None else 0
+            )
 
-        charge_power = get_safe_float(self.hass, self._battery_charge_power_entity_id)
-        calculated_data["battery_charge_power"] = (
-            charge_power if charge_power is not None else 0
+            calculated_data["priority_weight"] = self.priority_weight
+
+            #
+            # Call Algorithm Recuit simulé
+            # The devices are read in the event loop (templates cannot be rendered from a thread)
+            # and the optimization runs in an executor to not block Home Assistant.
+            # The optimization core only sees snapshots of the grid and of the devices
+            #
+            grid = GridSnapshot(
+                power_consumption=calculated_data["power_consumption"],
+                power_production=calculated_data["power_production"],
+                sell_cost=calculated_data["sell_cost"],
+                buy_cost=calculated_data["buy_cost"],
+                sell_tax_percent=calculated_data["sell_tax_percent"],
+                battery_soc=calculated_data["battery_soc"],
+                battery_charge_power=calculated_data["battery_charge_power"],
+                priority_weight=calculated_data["priority_weight"],
+            )
+            equipements = self._algo.preparer_equipements(self._devices, grid.battery_soc)
+            power_consumption = grid.consumption_with_battery
+
+            # Warm start from the previous best solution. The variation of the power consumed without the managed devices
+            # gives how much the situation has changed since the previous cycle
+            base_power = power_consumption - sum(eqt["current_power"] for eqt in equipements)
+            last_best_solution = self._last_best_solution if self._warm_start else None
+            variation = abs(base_power - self._last_base_power) if self._last_base_power is not None else None
+
+            # The same situation gives the same result. Do not run the optimization again if it has been
+            # calculated recently (events of the consumption and production sensors could be very frequent)
+            signature = self.optimization_signature(equipements, power_consumption, calculated_data) if self._cache.is_enabled else None
+            now = debut_solver = time_module.monotonic()
+            iterations, acceptance_ratio = 0, None
+            cached = self._cache.get(signature, now) if signature else None
+            if cached is not None:
+                _LOGGER.debug("Same situation as a recent calculation. The cached result is reused")
+                best_solution, best_objective, total_power = cached
+            else:
+                seed = self._seeds.getrandbits(32)
+                best_solution, best_objective, total_power = await self.hass.async_add_executor_job(
+                    self._algo.optimiser,
+                    equipements,
+                    power_consumption,
+                    grid.power_production,
+                    grid.sell_cost,
+                    grid.buy_cost,
+                    grid.sell_tax_percent,
+                    grid.priority_weight,
+                    last_best_solution,
+                    variation,
+                    seed,
+                )
+                iterations, acceptance_ratio = self._algo.nombre_iterations_effectuees, self._algo.taux_acceptation
+                if self._captured_cycles.maxlen:
+                    self._captured_cycles.append(
+                        {
+                            "date": datetime.now().isoformat(),
+                            "seed": seed,
+                            "algorithm": self._algo.parametres(),
+                            "equipements": equipements,
+                            "power_consumption": power_consumption,
+                            "power_production": calculated_data["power_production"],
+                            "sell_cost": calculated_data["sell_cost"],
+                            "buy_cost": calculated_data["buy_cost"],
+                            "sell_tax_percent": calculated_data["sell_tax_percent"],
+                            "battery_soc": calculated_data["battery_soc"],
+                            "priority_weight": calculated_data["priority_weight"],
+                            "solution_precedente": last_best_solution,
+                            "variation": variation,
+                            "best_objective": best_objective,
+                            "total_power": total_power,
+                            "solver_ms": round(1000 * (time_module.monotonic() - debut_solver), 1),
+                        }
+                    )
+                if signature:
+                    self._cache.put(signature, (best_solution, best_objective, total_power), now)
+            debut_actuation = time_module.monotonic()
+            self._last_best_solution = {equipement["unique_id"]: equipement for equipement in best_solution}
+            self._last_base_power = base_power
+
+            calculated_data["best_solution"] = best_solution
+            calculated_data["best_objective"] = best_objective
+            calculated_data["total_power"] = total_power
+
+            # Uses the result to turn on or off or change power. The actions are planned first and then executed
+            # concurrently: the deactivations and power decreases before the activations and power increases
+            # so that the grid import does not peak during the actuation
+            should_log = False
+            first_actions: list[tuple[ManagedDevice, list[Callable], int]] = []
+            second_actions: list[tuple[ManagedDevice, list[Callable], int]] = []
+            for _, equipement in enumerate(best_solution):
+                name = equipement["name"]
+                requested_power = equipement.get("requested_power")
+                state = equipement["state"]
+                _LOGGER.debug("Dealing with best_solution for %s - %s", name, equipement)
+                device = self.get_device_by_unique_id(equipement["unique_id"])
+                if not device:
+                    continue
+
+                actions = []
+                is_first = False
+                old_requested_power = device.requested_power
+                is_active = device.is_active
+                should_force_offpeak = device.should_be_forced_offpeak
+                if should_force_offpeak:
+                    _LOGGER.debug("%s - we should force %s name", self, name)
+                if is_active and not state and not should_force_offpeak:
+                    _LOGGER.debug("Extinction de %s", name)
+                    should_log = True
+                    old_requested_power = 0
+                    actions.append(device.deactivate)
+                    is_first = True
+                elif not is_active and (state or should_force_offpeak):
+                    _LOGGER.debug("Allumage de %s", name)
+                    should_log = True
+                    old_requested_power = requested_power
+                    actions.append(partial(device.activate, requested_power))
+
+                # Send change power if state is now on and change power is accepted and (power have change or eqt is just activated)
+                if (
+                    state
+                    and device.can_change_power
+                    and (device.current_power != requested_power or not is_active)
+                ):
+                    _LOGGER.debug(
+                        "Change power of %s to %s",
+                        equipement["name"],
+                        requested_power,
+                    )
+                    should_log = True
+                    actions.append(partial(device.change_requested_power, requested_power))
+                    is_first = is_active and requested_power < device.current_power
+
+                if not actions:
+                    device.set_requested_power(old_requested_power)
+                elif is_first:
+                    first_actions.append((device, actions, old_requested_power))
+                else:
+                    second_actions.append((device, actions, old_requested_power))
+
+                # Add updated data to the result
+                calculated_data[name_to_unique_id(name)] = device
+        finally:
+            self._end_render_cycle()
+
+        actuation_errors = {}
+        semaphore = asyncio.Semaphore(self._max_concurrent_actions)
+        for planned_actions in (first_actions, second_actions):
+            results = await asyncio.gather(
+                *(
+                    self._async_run_device_actions(device, actions, old_requested_power, semaphore)
+                    for device, actions, old_requested_power in planned_actions
+                )
+            )
+            for (device, _, _), error in zip(planned_actions, results):
+                if error is not None:
+                    actuation_errors[device.name] = error
+        calculated_data["actuation_errors"] = actuation_errors
+
+        fin_cycle = time_module.monotonic()
+        self._cycle_statistics.add(
+            {
+                "state": 1000 * (debut_solver - debut_cycle),
+                "solver": 1000 * (debut_actuation - debut_solver),
+                "actuation": 1000 * (fin_cycle - debut_actuation),
+                "total": 1000 * (fin_cycle - debut_cycle),
+            },
+            iterations,
+            acceptance_ratio,
         )
+        calculated_data["cycle_duration"] = round(1000 * (fin_cycle - debut_cycle), 1)
+
+        if should_log:
+            _LOGGER.info("Calculated data are: %s", calculated_data)
+        else:
+            _LOGGER.debug("Calculated data are: %s", calculated_data)
+
+        return calculated_data
+
+    def optimization_signature(self, equipements: list[dict], power_consumption: float, calculated_data: dict) -> tuple:
+        """Returns the key of the optimization result cache. Powers are rounded to cache_power_bucket
+        so that near identical situations give the same key"""
 
-        calculated_data["priority_weight"] = self.priority_weight
+        def quantize(power: float) -> float:
+            return round(power / self._cache_power_bucket) if self._cache_power_bucket > 0 else power
 
-        #
-        # Call Algorithm Recuit simulé
-        #
-        best_solution, best_objective, total_power = self._algo.recuit_simule(
-            self._devices,
-            calculated_data["power_consumption"] + calculated_data["battery_charge_power"],
-            calculated_data["power_production"],
+        return (
+            quantize(power_consumption),
+            quantize(calculated_data["power_production"]),
             calculated_data["sell_cost"],
             calculated_data["buy_cost"],
             calculated_data["sell_tax_percent"],
-            calculated_data["battery_soc"],
+            round(calculated_data["battery_soc"] / SOC_BUCKET_PERCENT),
             calculated_data["priority_weight"],
+            tuple(
+                (
+                    eqt["unique_id"],
+                    eqt["is_usable"],
+                    eqt["is_waiting"],
+                    eqt["state"],
+                    eqt["current_power"],
+                    eqt["priority"],
+                    eqt["power_max"],
+                    eqt["power_min"],
+                    eqt["power_step"],
+                )
+                for eqt in equipements
+            ),
         )
 
-        calculated_data["best_solution"] = best_solution
-        calculated_data["best_objective"] = best_objective
-        calculated_data["total_power"] = total_power
-
-        # Uses the result to turn on or off or change power
-        should_log = False
-        for _, equipement in enumerate(best_solution):
-            name = equipement["name"]
-            requested_power = equipement.get("requested_power")
-            state = equipement["state"]
-            _LOGGER.debug("Dealing with best_solution for %s - %s", name, equipement)
-            device = self.get_device_by_name(name)
-            if not device:
-                continue
+    def take_snapshot(self) -> InputSnapshot:
+        """Read in one pass all the entities used by a refresh cycle"""
+        power_entity_ids = (self._power_production_entity_id, self._power_consumption_entity_id)
+        numeric_entity_ids = (
+            self._sell_cost_entity_id,
+            self._buy_cost_entity_id,
+            self._sell_tax_percent_entity_id,
+            self._battery_soc_entity_id,
+            self._battery_charge_power_entity_id,
+        )
+        return InputSnapshot(
+            self.hass,
+            (*power_entity_ids, *numeric_entity_ids, *(device.power_entity_id for device in self._devices)),
+            power_entity_ids,
+            numeric_entity_ids,
+        )
 
-            old_requested_power = device.requested_power
-            is_active = device.is_active
-            should_force_offpeak = device.should_be_forced_offpeak
-            if should_force_offpeak:
-                _LOGGER.debug("%s - we should force %s name", self, name)
-            if is_active and not state and not should_force_offpeak:
-                _LOGGER.debug("Extinction de %s", name)
-                should_log = True
-                old_requested_power = 0
-                await device.deactivate()
-            elif not is_active and (state or should_force_offpeak):
-                _LOGGER.debug("Allumage de %s", name)
-                should_log = True
-                old_requested_power = requested_power
-                await device.activate(requested_power)
-
-            # Send change power if state is now on and change power is accepted and (power have change or eqt is just activated)
-            if (
-                state
-                and device.can_change_power
-                and (device.current_power != requested_power or not is_active)
-            ):
-                _LOGGER.debug(
-                    "Change power of %s to %s",
-                    equipement["name"],
-                    requested_power,
-                )
-                should_log = True
-                await device.change_requested_power(requested_power)
+    def _end_render_cycle(self):
+        """The templates of the devices are rendered again at each access"""
+        for device in self._devices:
+            device.end_render_cycle()
+
+    async def _async_run_device_actions(
+        self, device: ManagedDevice, actions: list[Callable], requested_power: int, semaphore: asyncio.Semaphore
+    ) -> str | None:
+        """Run the actions of one device in sequence. Returns the error message if the actions have failed"""
+        error = None
+        async with semaphore:
+            try:
+                async with asyncio.timeout(self._action_timeout_sec):
+                    for action in actions:
+                        await action()
+            except TimeoutError:
+                error = f"actions not done within {self._action_timeout_sec} sec"
+                _LOGGER.error("%s - the actions of %s have not been done within %s sec", self, device.name, self._action_timeout_sec)
+            except Exception as err:  # pylint: disable=broad-except
+                error = str(err)
+                _LOGGER.exception("%s - the actions of %s have failed", self, device.name)
+
+        device.set_requested_power(requested_power)
+        return error
+
+    async def async_run_device_action(self, device: ManagedDevice, action: Callable) -> bool:
+        """Run an action of a device outside of a calculation (a toggle of its switch or a service). The action is limited
+        to action_timeout_sec and its error is logged. Returns True if the action has been done"""
+        try:
+            async with asyncio.timeout(self._action_timeout_sec):
+                await action()
+        except TimeoutError:
+            _LOGGER.error("%s - the action of %s has not been done within %s sec", self, device.name, self._action_timeout_sec)
+            return False
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.exception("%s - the action of %s has failed", self, device.name)
+            return False
+        return True
 
-            device.set_requested_power(old_requested_power)
+    @property
+    def captured_cycles(self) -> list[dict]:
+        """The inputs and results of the last optimizations. They could be replayed with replay.replay_cycle"""
+        return list(self._captured_cycles)
 
-            # Add updated data to the result
-            calculated_data[name_to_unique_id(name)] = device
+    @property
+    def cycle_statistics(self) -> CycleStatistics:
+        """The durations of the last refresh cycles"""
+        return self._cycle_statistics
 
-        if should_log:
-            _LOGGER.info("Calculated data are: %s", calculated_data)
-        else:
-            _LOGGER.debug("Calculated data are: %s", calculated_data)
+    @property
+    def cache_hits(self) -> int:
+        """The number of optimizations skipped thanks to the result cache"""
+        return self._cache.hits
 
-        return calculated_data
+    @property
+    def cache_misses(self) -> int:
+        """The number of optimizations which have been calculated"""
+        return self._cache.misses
+
+    @property
+    def fast_paths(self) -> dict[str, int]:
+        """The number of calculations solved without search by each fast path"""
+        return self._algo.compteurs_chemins_rapides
+
+    @property
+    def events_received(self) -> int:
+        """The number of consumption and production events received"""
+        return self._events_received
+
+    @property
+    def events_executed(self) -> int:
+        """The number of refreshes triggered by the consumption and production events"""
+        return self._events_executed
+
+    @property
+    def events_coalesced(self) -> int:
+        """The number of consumption and production events which have not triggered their own refresh"""
+        return self._events_received - self._events_executed
 
     @classmethod
     def get_coordinator(cls) -> Any:
@@ -308,17 +893,11 @@ class SolarOptimizerCoordinator(DataUpdateCoordinator):
 
     def get_device_by_name(self, name: str) -> ManagedDevice | None:
         """Returns the device which name is given in argument"""
-        for _, device in enumerate(self._devices):
-            if device.name == name:
-                return device
-        return None
+        return self._devices_by_name.get(name)
 
     def get_device_by_unique_id(self, uid: str) -> ManagedDevice | None:
-        """Returns the device which name is given in argument"""
-        for _, device in enumerate(self._devices):
-            if device.unique_id == uid:
-                return device
-        return None
+        """Returns the device which unique_id is given in argument"""
+        return self._devices_by_unique_id.get(uid)
 
     def set_priority_weight_entity(self, entity: SelectEntity):
         """Set the priority weight entity"""
@@ -331,23 +910,112 @@ class SolarOptimizerCoordinator(DataUpdateCoordinator):
             return 0
         return self._priority_weight_entity.current_priority_weight
 
+    @property
+    def publish_enable_state_events(self) -> bool:
+        """True if the enable state changes of the devices are also fired on the event bus"""
+        return self._publish_enable_state_events
+
+    @property
+    def on_time_sensors_count(self) -> int:
+        """The number of on time sensors updated by the shared ticker"""
+        return len(self._on_time_sensors)
+
     @property
     def raz_time(self) -> time:
         """Get the raz time with default to DEFAULT_RAZ_TIME"""
         return self._raz_time
 
+    @property
+    def power_consumption_entity_id(self) -> str | None:
+        """The entity of the net power consumption"""
+        return self._power_consumption_entity_id
+
+    @property
+    def power_production_entity_id(self) -> str | None:
+        """The entity of the solar power production"""
+        return self._power_production_entity_id
+
+    @property
+    def sell_cost_entity_id(self) -> str | None:
+        """The entity of the sell cost"""
+        return self._sell_cost_entity_id
+
+    @property
+    def buy_cost_entity_id(self) -> str | None:
+        """The entity of the buy cost"""
+        return self._buy_cost_entity_id
+
+    @property
+    def sell_tax_percent_entity_id(self) -> str | None:
+        """The entity of the sell tax percent"""
+        return self._sell_tax_percent_entity_id
+
     def add_device(self, device: ManagedDevice):
         """Add a new device to the list of managed device"""
         # Append or replace the device
-        for i, dev in enumerate(self._devices):
-            if dev.unique_id == device.unique_id:
-                self._devices[i] = device
-                return
-        self._devices.append(device)
+        if (old_device := self._devices_by_unique_id.get(device.unique_id)) is not None:
+            self._devices[self._devices.index(old_device)] = device
+            self._devices_by_name.pop(old_device.name, None)
+            self._untrack_device(device.unique_id)
+        else:
+            self._devices.append(device)
+        self._devices_by_unique_id[device.unique_id] = device
+        self._devices_by_name[device.name] = device
+        self._template_trackers[device.unique_id] = device.async_track_templates()
+        self.update_device_index(device)
 
     def remove_device(self, unique_id: str):
         """Remove a device from the list of managed device"""
-        for i, dev in enumerate(self._devices):
-            if dev.unique_id == unique_id:
-                self._devices.pop(i)
-                return
+        if (device := self._devices_by_unique_id.pop(unique_id, None)) is not None:
+            self._devices.remove(device)
+            self._devices_by_name.pop(device.name, None)
+            self._untrack_device(unique_id)
+
+    def _untrack_device(self, unique_id: str):
+        """Stop the template tracking of a device and remove it from the index"""
+        if (untrack := self._template_trackers.pop(unique_id, None)) is not None:
+            untrack()
+        self._usable_device_ids.discard(unique_id)
+        self._active_device_ids.discard(unique_id)
+
+    @callback
+    def update_device_index(self, device: ManagedDevice):
+        """Update the index with the template results of a device. Refresh out of band if a high priority device
+        becomes usable"""
+        unique_id = device.unique_id
+        if device.is_active:
+            self._active_device_ids.add(unique_id)
+        else:
+            self._active_device_ids.discard(unique_id)
+
+        if not device.is_template_usable:
+            self._usable_device_ids.discard(unique_id)
+            return
+        if unique_id in self._usable_device_ids:
+            return
+
+        self._usable_device_ids.add(unique_id)
+        if (
+            self._refresh_on_usable_priority is not None
+            and self._central_config_done
+            and 0 < device.priority <= self._refresh_on_usable_priority
+            and device.is_enabled
+        ):
+            _LOGGER.info("%s becomes usable. Solar Optimizer calculation is refreshed", device.name)
+            self._usable_refreshes += 1
+            self.hass.async_create_task(self._usable_debouncer.async_call())
+
+    @property
+    def usable_device_ids(self) -> frozenset[str]:
+        """The unique_id of the devices whose check_usable template is true"""
+        return frozenset(self._usable_device_ids)
+
+    @property
+    def active_device_ids(self) -> frozenset[str]:
+        """The unique_id of the devices which are active"""
+        return frozenset(self._active_device_ids)
+
+    @property
+    def usable_refreshes(self) -> int:
+        """The number of refreshes triggered by a high priority device which becomes usable"""
+        return self._usable_refreshes
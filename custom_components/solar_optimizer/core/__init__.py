@@ -0,0 +1,23 @@
+""" The optimization core of Solar Optimizer.
+
+This package does not depend on Home Assistant. It takes plain snapshots of the devices and of the grid
+and could be used (and tested) without a running Home Assistant. ManagedDevice and the coordinator
+are the adapters which build the snapshots from the Home Assistant entities.
+"""
+
+from .const import ALGORITHM_MODE_ANNEALING, ALGORITHM_MODE_EXACT, ALGORITHM_MODES, FAST_PATHS
+from .model import DeviceSnapshot, GridSnapshot, SolverResult
+from .simulated_annealing_algo import SimulatedAnnealingAlgorithm
+from .solver import solve
+
+__all__ = [
+    "ALGORITHM_MODE_ANNEALING",
+    "ALGORITHM_MODE_EXACT",
+    "ALGORITHM_MODES",
+    "FAST_PATHS",
+    "DeviceSnapshot",
+    "GridSnapshot",
+    "SolverResult",
+    "SimulatedAnnealingAlgorithm",
+    "solve",
+]
@@ -0,0 +1,19 @@
+""" The constants of the optimization core. This module must not import Home Assistant """
+
+ALGORITHM_MODE_ANNEALING = "annealing"
+ALGORITHM_MODE_EXACT = "exact"
+
+ALGORITHM_MODES = [ALGORITHM_MODE_ANNEALING, ALGORITHM_MODE_EXACT]
+
+# The situations in which the best solution is found without search
+FAST_PATH_NO_USABLE_DEVICES = "no_usable_devices"
+FAST_PATH_NO_SURPLUS = "no_surplus"
+FAST_PATH_SURPLUS_ABOVE_MAX_POWER = "surplus_above_max_power"
+FAST_PATH_SURPLUS_BELOW_MIN_POWER = "surplus_below_min_power"
+
+FAST_PATHS = [
+    FAST_PATH_NO_USABLE_DEVICES,
+    FAST_PATH_NO_SURPLUS,
+    FAST_PATH_SURPLUS_ABOVE_MAX_POWER,
+    FAST_PATH_SURPLUS_BELOW_MIN_POWER,
+]
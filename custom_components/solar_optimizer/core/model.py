@@ -0,0 +1,103 @@
+""" The inputs and the result of the optimization core: plain immutable snapshots of the devices and of the grid """
+
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True, slots=True)
+class DeviceSnapshot:
+    """The state of a device at the time of an optimization"""
+
+    name: str
+    unique_id: str
+    power_max: float
+    # -1 if the device cannot change its power
+    power_min: int = -1
+    power_step: int = 0
+    current_power: float = 0
+    is_active: bool = False
+    is_usable: bool = True
+    is_waiting: bool = False
+    is_enabled: bool = True
+    priority: int = 0
+
+    @property
+    def can_change_power(self) -> bool:
+        """True if the power of the device could be changed"""
+        return self.power_min >= 0
+
+    def set_battery_soc(self, battery_soc):
+        """The usability of a snapshot already takes the battery into account"""
+
+    @classmethod
+    def from_device(cls, device) -> "DeviceSnapshot":
+        """Take a snapshot of a device. The device could be any object with the same properties, like a ManagedDevice"""
+        if isinstance(device, DeviceSnapshot):
+            return device
+        return cls(
+            name=device.name,
+            unique_id=device.unique_id,
+            power_max=device.power_max,
+            power_min=device.power_min,
+            power_step=device.power_step,
+            current_power=device.current_power,
+            is_active=device.is_active,
+            is_usable=device.is_usable,
+            is_waiting=device.is_waiting,
+            is_enabled=device.is_enabled,
+            priority=device.priority,
+        )
+
+    def to_equipement(self) -> dict:
+        """The equipment dict used by the algorithm"""
+        # Force deactivation if active, not usable and not waiting
+        force_state = (
+            False
+            if self.is_active and ((not self.is_usable and not self.is_waiting) or self.current_power <= 0)
+            else self.is_active
+        )
+        return {
+            "power_max": self.power_max,
+            "power_min": self.power_min,
+            "power_step": self.power_step,
+            "current_power": self.current_power,
+            # Initial Requested power is the current power if usable
+            "requested_power": self.current_power,
+            "name": self.name,
+            "unique_id": self.unique_id,
+            "state": force_state,
+            "is_usable": self.is_usable,
+            "is_waiting": self.is_waiting,
+            "can_change_power": self.can_change_power,
+            "priority": self.priority,
+        }
+
+
+@dataclass(frozen=True, slots=True)
+class GridSnapshot:
+    """The situation of the grid at the time of an optimization. The powers are in W and power_consumption
+    is the net consumption (negative if power is given back to the grid)"""
+
+    power_consumption: float
+    power_production: float
+    sell_cost: float
+    buy_cost: float
+    sell_tax_percent: float = 0
+    battery_soc: float = 0
+    battery_charge_power: float = 0
+    priority_weight: int = 0
+
+    @property
+    def consumption_with_battery(self) -> float:
+        """The consumption seen by the algorithm: the power which charges the battery could be used by the devices"""
+        return self.power_consumption + self.battery_charge_power
+
+
+@dataclass(frozen=True, slots=True)
+class SolverResult:
+    """The result of an optimization"""
+
+    best_solution: list[dict]
+    best_objective: float
+    total_power: float
+    iterations: int = 0
+    fast_path: str | None = None
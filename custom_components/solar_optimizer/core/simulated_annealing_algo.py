@@ -0,0 +1,972 @@
+""" The Simulated Annealing (recuit simulé) algorithm"""
+import logging
+import random
+import math
+import threading
+import time
+
+from .const import (
+    ALGORITHM_MODE_ANNEALING,
+    ALGORITHM_MODE_EXACT,
+    FAST_PATHS,
+    FAST_PATH_NO_USABLE_DEVICES,
+    FAST_PATH_NO_SURPLUS,
+    FAST_PATH_SURPLUS_ABOVE_MAX_POWER,
+    FAST_PATH_SURPLUS_BELOW_MIN_POWER,
+)
+from .model import DeviceSnapshot
+
+_LOGGER = logging.getLogger(__name__)
+
+DEBUG = False
+
+# In parallel tempering, the temperature of a chain is the temperature of the previous chain multiplied by this factor
+FACTEUR_TEMPERATURE_CHAINES = 0.5
+# In parallel tempering, an exchange of solutions between chains is tried every this number of iterations
+PERIODE_ECHANGE_CHAINES = 10
+
+# With a warm start, the number of iterations and the initial temperature are never reduced below this ratio
+RATIO_MIN_DEMARRAGE_A_CHAUD = 0.1
+
+# With the adaptive schedule, the initial temperature is calibrated so that a mean worsening move is accepted with this probability
+PROBABILITE_ACCEPTATION_INITIALE = 0.8
+# With the adaptive schedule, the number of moves sampled to calibrate the initial temperature
+NOMBRE_ECHANTILLONS_CALIBRATION = 30
+# With the adaptive schedule, the minimal number of iterations of a run
+NOMBRE_ITERATIONS_MIN_ADAPTATIF = 50
+
+# Above this number of distinct total powers, the exact algorithm gives up and the simulated annealing is used
+MAX_EXACT_STATES = 200000
+# Above this number of combinations (total powers * options of an equipment) to evaluate for one equipment, the exact
+# algorithm gives up before evaluating them and the simulated annealing is used
+MAX_EXACT_TRANSITIONS = 1000000
+# The exact algorithm uses at most this part of the time budget so that the simulated annealing has time to run if it gives up
+RATIO_DUREE_EXACT = 0.5
+
+
+class Solution:
+    """An array-backed solution: the state and the requested power of each equipment.
+    The equipments are referenced by their index in SimulatedAnnealingAlgorithm._equipements.
+    A solution is mutated in place by permuter_equipement and restored with annuler_permutation.
+    The running totals (total requested power and sum of priority * requested power of the active
+    equipments) are kept up to date at each change so that the objective is calculated in O(1)"""
+
+    __slots__ = ("states", "requested_powers", "puissance_totale", "somme_priorites")
+
+    def __init__(self, states: list[bool], requested_powers: list[float], puissance_totale: float, somme_priorites: float):
+        self.states = states
+        self.requested_powers = requested_powers
+        self.puissance_totale = puissance_totale
+        self.somme_priorites = somme_priorites
+
+    def copy(self) -> "Solution":
+        """Returns a copy of this solution"""
+        return Solution(self.states[:], self.requested_powers[:], self.puissance_totale, self.somme_priorites)
+
+
+class SimulatedAnnealingAlgorithm:
+    """The class which implemenets the Simulated Annealing algorithm"""
+
+    # Paramètres de l'algorithme de recuit simulé
+    _temperature_initiale: float = 1000
+    _temperature_minimale: float = 0.1
+    _facteur_refroidissement: float = 0.95
+    _nombre_iterations: float = 1000
+    _duree_max_sec: float = 5
+    _mode: str = ALGORITHM_MODE_ANNEALING
+    _nb_max_equipements_exact: int = 20
+    _nb_chaines: int = 1
+    _adaptatif: bool = False
+    _iterations_par_equipement: int = 50
+    _iterations_sans_amelioration: int = 200
+    _chemins_rapides: bool = True
+    _nombre_iterations_effectuees: int = 0
+    _chemin_rapide: str | None = None
+    _debut_run: float = 0
+    _nombre_acceptations: int = 0
+    _equipements: list[dict]
+    _puissance_totale_eqt_initiale: float
+    _cout_achat: float = 15  # centimes
+    _cout_revente: float = 10  # centimes
+    _taxe_revente: float = 10  # pourcentage
+    _consommation_net: float
+    _production_solaire: float
+
+    def __init__(
+        self,
+        initial_temp: float,
+        min_temp: float,
+        cooling_factor: float,
+        max_iteration_number: int,
+        max_duration_sec: float = 5,
+        mode: str = ALGORITHM_MODE_ANNEALING,
+        exact_max_devices: int = 20,
+        chains: int = 1,
+        seed: int | None = None,
+        adaptive_schedule: bool = False,
+        iterations_per_device: int = 50,
+        max_iterations_without_improvement: int = 200,
+        fast_paths: bool = True,
+    ):
+        """Initialize the algorithm with values. The random generator is owned by the algorithm and
+        seeded with seed (if given) so that the runs could be reproduced"""
+        self._temperature_initiale = initial_temp
+        self._temperature_minimale = min_temp
+        self._facteur_refroidissement = cooling_factor
+        self._nombre_iterations = max_iteration_number
+        self._duree_max_sec = max_duration_sec
+        self._mode = mode
+        self._nb_max_equipements_exact = exact_max_devices
+        self._nb_chaines = max(1, chains)
+        self._random = random.Random(seed)
+        self._adaptatif = adaptive_schedule
+        self._iterations_par_equipement = iterations_per_device
+        self._iterations_sans_amelioration = max_iterations_without_improvement
+        self._chemins_rapides = fast_paths
+        self._compteurs_chemins_rapides = dict.fromkeys(FAST_PATHS, 0)
+        # The run state is stored in the instance. Only one run at a time is possible
+        self._lock = threading.Lock()
+        _LOGGER.info(
+            "Initializing the SimulatedAnnealingAlgorithm with initial_temp=%.2f min_temp=%.2f cooling_factor=%.2f max_iterations_number=%d max_duration_sec=%.2f mode=%s exact_max_devices=%d chains=%d adaptive_schedule=%s fast_paths=%s",
+            self._temperature_initiale,
+            self._temperature_minimale,
+            self._facteur_refroidissement,
+            self._nombre_iterations,
+            self._duree_max_sec,
+            self._mode,
+            self._nb_max_equipements_exact,
+            self._nb_chaines,
+            self._adaptatif,
+            self._chemins_rapides,
+        )
+
+    def parametres(self) -> dict:
+        """The parameters of the algorithm (the arguments of the constructor except the seed)"""
+        return {
+            "initial_temp": self._temperature_initiale,
+            "min_temp": self._temperature_minimale,
+            "cooling_factor": self._facteur_refroidissement,
+            "max_iteration_number": self._nombre_iterations,
+            "max_duration_sec": self._duree_max_sec,
+            "mode": self._mode,
+            "exact_max_devices": self._nb_max_equipements_exact,
+            "chains": self._nb_chaines,
+            "adaptive_schedule": self._adaptatif,
+            "iterations_per_device": self._iterations_par_equipement,
+            "max_iterations_without_improvement": self._iterations_sans_amelioration,
+            "fast_paths": self._chemins_rapides,
+        }
+
+    @property
+    def nombre_iterations_effectuees(self) -> int:
+        """The number of iterations done by the last run (0 if the exact algorithm has been used)"""
+        return self._nombre_iterations_effectuees
+
+    @property
+    def chemin_rapide(self) -> str | None:
+        """The fast path which has given the solution of the last run (None if a search has been done)"""
+        return self._chemin_rapide
+
+    @property
+    def compteurs_chemins_rapides(self) -> dict[str, int]:
+        """The number of runs solved by each fast path since the creation of the algorithm"""
+        return dict(self._compteurs_chemins_rapides)
+
+    @property
+    def taux_acceptation(self) -> float | None:
+        """The ratio of the moves accepted by the last run of the simulated annealing (None if no move has been done)"""
+        nombre_mouvements = self._nombre_iterations_effectuees * self._nb_chaines
+        return self._nombre_acceptations / nombre_mouvements if nombre_mouvements > 0 else None
+
+    def recuit_simule(
+        self,
+        devices: list,
+        power_consumption: float,
+        solar_power_production: float,
+        sell_cost: float,
+        buy_cost: float,
+        sell_tax_percent: float,
+        battery_soc: float,
+        priority_weight: int,
+    ):
+        """The entrypoint of the algorithm:
+        You should give:
+         - devices: a list of ManagedDevices (or DeviceSnapshots). devices that are is_usable false are not taken into account
+         - power_consumption: the current power consumption. Can be negeative if power is given back to grid.
+         - solar_power_production: the solar production power
+         - sell_cost: the sell cost of energy
+         - buy_cost: the buy cost of energy
+         - sell_tax_percent: a sell taxe applied to sell energy (a percentage)
+         - battery_soc: the state of charge of the battery (0-100)
+         - priority_weight: the weight of the priority in the cost calculation. 10 means 10%
+
+         In return you will have:
+          - best_solution: a list of object in whitch name, power_max and state are set,
+          - best_objectif: the measure of the objective for that solution,
+          - total_power_consumption: the total of power consumption for all equipments which should be activated (state=True)
+        """
+        if len(devices) <= 0 or not self.entrees_valides(power_consumption, solar_power_production, sell_cost, buy_cost, sell_tax_percent):
+            return [], -1, -1
+
+        return self.optimiser(
+            self.preparer_equipements(devices, battery_soc),
+            power_consumption,
+            solar_power_production,
+            sell_cost,
+            buy_cost,
+            sell_tax_percent,
+            priority_weight,
+        )
+
+    def entrees_valides(
+        self,
+        power_consumption: float,
+        solar_power_production: float,
+        sell_cost: float,
+        buy_cost: float,
+        sell_tax_percent: float,
+    ) -> bool:
+        """Check that all the informations needed by the algorithm are available"""
+        if (
+            power_consumption is None
+            or solar_power_production is None
+            or sell_cost is None
+            or buy_cost is None
+            or sell_tax_percent is None
+        ):
+            _LOGGER.info(
+                "Not all informations are available for Simulated Annealign algorithm to work. Calculation is abandoned"
+            )
+            return False
+        return True
+
+    def preparer_equipements(self, devices: list, battery_soc: float) -> list[dict]:
+        """Take a snapshot of the enabled devices. The result is a list of dict which is used by optimiser.
+        The devices are ManagedDevices or DeviceSnapshots. A ManagedDevice is read (templates, states) so
+        this method should then be called from the event loop"""
+        equipements = []
+        for device in devices:
+            if not device.is_enabled:
+                _LOGGER.debug("%s is disabled. Forget it", device.name)
+                continue
+
+            device.set_battery_soc(battery_soc)
+            equipements.append(DeviceSnapshot.from_device(device).to_equipement())
+        return equipements
+
+    def optimiser(
+        self,
+        equipements: list[dict],
+        power_consumption: float,
+        solar_power_production: float,
+        sell_cost: float,
+        buy_cost: float,
+        sell_tax_percent: float,
+        priority_weight: int,
+        solution_precedente: dict[str, dict] | None = None,
+        variation: float | None = None,
+        seed: int | None = None,
+    ):
+        """Search the best solution for the equipments given by preparer_equipements.
+        This method only works on the snapshot of the equipments so it can be called from an executor thread.
+        The search is stopped after max_duration_sec and the best solution found so far is returned.
+        solution_precedente is the best solution of the previous run (equipments by unique_id). If given, the
+        annealing starts from it (warm start) and variation (the change of the power in W since the previous run)
+        is used to reduce the number of iterations when the situation has not changed much.
+        If seed is given, the random generator is reseeded with it so that the run can be reproduced.
+        The return is the same as recuit_simule"""
+        if not self.entrees_valides(power_consumption, solar_power_production, sell_cost, buy_cost, sell_tax_percent):
+            return [], -1, -1
+
+        with self._lock:
+            if seed is not None:
+                self._random.seed(seed)
+            return self._optimiser(
+                equipements,
+                power_consumption,
+                solar_power_production,
+                sell_cost,
+                buy_cost,
+                sell_tax_percent,
+                priority_weight,
+                solution_precedente,
+                variation,
+            )
+
+    def _optimiser(
+        self,
+        equipements: list[dict],
+        power_consumption: float,
+        solar_power_production: float,
+        sell_cost: float,
+        buy_cost: float,
+        sell_tax_percent: float,
+        priority_weight: int,
+        solution_precedente: dict[str, dict] | None,
+        variation: float | None,
+    ):
+        """The optimization itself. Should be called with the lock acquired"""
+        _LOGGER.debug(
+            "Calling recuit_simule with power_consumption=%.2f, solar_power_production=%.2f sell_cost=%.2f, buy_cost=%.2f, tax=%.2f%% equipements=%s",
+            power_consumption,
+            solar_power_production,
+            sell_cost,
+            buy_cost,
+            sell_tax_percent,
+            equipements,
+        )
+        self._cout_achat = buy_cost
+        self._cout_revente = sell_cost
+        self._taxe_revente = sell_tax_percent
+        self._consommation_net = power_consumption
+        self._production_solaire = solar_power_production
+        self._priority_weight = priority_weight / 100.0  # to get percentage
+
+        # fix #131 - costs cannot be negative or 0
+        if self._cout_achat <= 0 or self._cout_revente <= 0:
+            _LOGGER.warning(
+                "The cost of energy cannot be negative or 0. Buy cost=%.2f, Sell cost=%.2f. Setting them to 1",
+                self._cout_achat,
+                self._cout_revente,
+            )
+            self._cout_achat = self._cout_revente = 1
+
+        # The cost coefficients only depend on the costs. They are calculated once per run
+        cout_revente_impose = self._cout_revente * (1.0 - self._taxe_revente / 100.0)
+        self._coef_import = (self._cout_achat) / (self._cout_achat + cout_revente_impose)
+        self._coef_rejets = (cout_revente_impose) / (self._cout_achat + cout_revente_impose)
+
+        self._equipements = equipements
+        if DEBUG:
+            _LOGGER.debug("enabled _equipements are: %s", self._equipements)
+
+        # Générer une solution initiale
+        solution_initiale = self.generer_solution_initiale(self._equipements)
+        self._nombre_iterations_run = self._nombre_iterations
+        self._temperature_initiale_run = self._temperature_initiale
+        self._nombre_iterations_effectuees = 0
+        self._nombre_acceptations = 0
+        self._chemin_rapide = None
+        # The time budget is shared by the exact algorithm and the simulated annealing which could follow it
+        self._debut_run = time.monotonic()
+
+        if self._chemins_rapides and (resultat := self.resoudre_trivial(solution_initiale)) is not None:
+            meilleure_solution, self._chemin_rapide = resultat
+            self._compteurs_chemins_rapides[self._chemin_rapide] += 1
+            _LOGGER.debug("The best solution is found without search (%s)", self._chemin_rapide)
+            return (
+                self.construire_solution(meilleure_solution),
+                self.calculer_objectif(meilleure_solution),
+                self.consommation_equipements(meilleure_solution),
+            )
+
+        if self._mode == ALGORITHM_MODE_EXACT:
+            if (resultat := self.resoudre_exact(solution_initiale)) is not None:
+                meilleure_solution, meilleure_objectif = resultat
+            else:
+                _LOGGER.info("The problem is too big or too long for the exact algorithm. The simulated annealing is used")
+                self.adapter_planification(solution_initiale)
+                meilleure_solution, meilleure_objectif = self.executer_recuit(solution_initiale)
+        else:
+            self.adapter_planification(solution_initiale)
+            if solution_precedente:
+                solution_initiale = self.demarrer_a_chaud(solution_initiale, solution_precedente, variation)
+            meilleure_solution, meilleure_objectif = self.executer_recuit(solution_initiale)
+
+        return (
+            self.construire_solution(meilleure_solution),
+            meilleure_objectif,
+            self.consommation_equipements(meilleure_solution),
+        )
+
+    def adapter_planification(self, solution: Solution):
+        """With the adaptive schedule, the number of iterations is proportional to the number of usable equipments
+        (limited by max_iteration_number) and the initial temperature is calibrated from the objective variations of
+        moves sampled around the solution (which is not modified). The cooling factor is then chosen by
+        facteur_refroidissement_run so that the minimal temperature is reached at the last iteration"""
+        if not self._adaptatif:
+            return
+
+        self._nombre_iterations_run = min(
+            self._nombre_iterations, max(NOMBRE_ITERATIONS_MIN_ADAPTATIF, self._iterations_par_equipement * len(self._indices_utilisables))
+        )
+
+        objectif = self.calculer_objectif(solution)
+        degradations = []
+        for _ in range(NOMBRE_ECHANTILLONS_CALIBRATION):
+            undo = self.permuter_equipement(solution)
+            if (delta := self.calculer_objectif(solution) - objectif) > 0:
+                degradations.append(delta)
+            self.annuler_permutation(solution, undo)
+
+        if degradations:
+            self._temperature_initiale_run = -(sum(degradations) / len(degradations)) / math.log(PROBABILITE_ACCEPTATION_INITIALE)
+        _LOGGER.debug(
+            "Adaptive schedule: %d iterations for %d usable equipments. Initial temperature is %.2f",
+            self._nombre_iterations_run,
+            len(self._indices_utilisables),
+            self._temperature_initiale_run,
+        )
+
+    def facteur_refroidissement_run(self) -> float:
+        """The cooling factor of the run. With the adaptive schedule, the temperature goes from the initial temperature
+        to the minimal temperature in the number of iterations of the run"""
+        if not self._adaptatif or self._temperature_initiale_run <= self._temperature_minimale:
+            return self._facteur_refroidissement
+        return (self._temperature_minimale / self._temperature_initiale_run) ** (1 / max(1, self._nombre_iterations_run))
+
+    def demarrer_a_chaud(self, solution_initiale: Solution, solution_precedente: dict[str, dict], variation: float | None) -> Solution:
+        """Build the starting solution from the best solution of the previous run. The previous state and power
+        of an equipment is only taken if it is allowed by the current usable and waiting constraints.
+        If the constraints have not changed, the number of iterations and the initial temperature are reduced
+        according to the variation of power (relative to the max power of the usable equipments).
+        Returns the best of the initial solution and the warm started one"""
+        depart = solution_initiale.copy()
+        contraintes_identiques = True
+        puissance_utilisable = 0
+        for idx, eqt in enumerate(self._equipements):
+            precedent = solution_precedente.get(eqt["unique_id"])
+            if precedent is None or precedent["is_usable"] != eqt["is_usable"] or precedent["is_waiting"] != eqt["is_waiting"]:
+                contraintes_identiques = False
+            if precedent is None or not eqt["is_usable"]:
+                continue
+            puissance_utilisable += self._power_max[idx]
+
+            if precedent["state"] and self._can_change_power[idx] and (depart.states[idx] or not eqt["is_waiting"]):
+                # A waiting equipment cannot be switched on or off, but the power of an active one can change
+                power = min(max(precedent["requested_power"], self._power_min[idx]), self._power_max[idx])
+                self.affecter(depart, idx, True, power)
+            elif not eqt["is_waiting"] and precedent["state"] != depart.states[idx]:
+                self.affecter(depart, idx, precedent["state"], self._power_max[idx] if precedent["state"] else 0)
+
+        if self.calculer_objectif(depart) > self.calculer_objectif(solution_initiale):
+            _LOGGER.debug("The previous solution is not better than the current state. No warm start")
+            return solution_initiale
+
+        if contraintes_identiques and variation is not None:
+            ratio = max(min(1, variation / max(puissance_utilisable, 1)), RATIO_MIN_DEMARRAGE_A_CHAUD)
+            self._nombre_iterations_run = max(1, math.ceil(self._nombre_iterations_run * ratio))
+            self._temperature_initiale_run = self._temperature_initiale_run * ratio
+            _LOGGER.debug(
+                "Warm start with a variation of %.2fW. Iterations are reduced to %d and initial temperature to %.2f",
+                variation,
+                self._nombre_iterations_run,
+                self._temperature_initiale_run,
+            )
+        return depart
+
+    def executer_recuit(self, solution_actuelle: Solution) -> tuple[Solution, float]:
+        """Run the simulated annealing from the solution given in argument (which is modified).
+        Returns the best solution found and its objective"""
+        if self._nb_chaines > 1:
+            return self.executer_recuit_multi_chaines(solution_actuelle)
+
+        meilleure_solution = solution_actuelle.copy()
+        meilleure_objectif = objectif_actuel = self.calculer_objectif(solution_actuelle)
+        nombre_iterations = acceptations = 0
+        temperature = self._temperature_initiale_run
+        facteur_refroidissement = self.facteur_refroidissement_run()
+        # With the adaptive schedule, the run stops when the best solution has not been improved for a while
+        patience = self._iterations_sans_amelioration if self._adaptatif else 0
+        derniere_amelioration = 0
+        date_limite = self._debut_run + self._duree_max_sec
+
+        for iteration in range(self._nombre_iterations_run):
+            # Check the time budget every 16 iterations. The best solution found so far is kept
+            if not iteration & 15 and time.monotonic() >= date_limite:
+                _LOGGER.warning(
+                    "The Simulated Annealing algorithm has exceeded its time budget of %.2f sec after %d iterations. The best solution found so far is used",
+                    self._duree_max_sec,
+                    iteration,
+                )
+                break
+            nombre_iterations += 1
+
+            # Générer un voisin
+            if DEBUG:
+                _LOGGER.debug("Objectif actuel : %.2f", objectif_actuel)
+
+            # The neighbour is the current solution modified in place. undo allows to go back to the current solution
+            undo = self.permuter_equipement(solution_actuelle)
+
+            # Calculer les objectifs pour la solution actuelle et le voisin
+            objectif_voisin = self.calculer_objectif(solution_actuelle)
+            if DEBUG:
+                _LOGGER.debug("Objectif voisin : %2.f", objectif_voisin)
+
+            # Accepter le voisin si son objectif est meilleur ou si la consommation totale n'excède pas la production solaire
+            if objectif_voisin < objectif_actuel:
+                _LOGGER.debug("---> On garde l'objectif voisin")
+                objectif_actuel = objectif_voisin
+                acceptations += 1
+                if objectif_voisin < meilleure_objectif:
+                    _LOGGER.debug("---> C'est la meilleure jusque là")
+                    meilleure_solution = solution_actuelle.copy()
+                    meilleure_objectif = objectif_voisin
+                    derniere_amelioration = iteration
+            else:
+                # Accepter le voisin avec une certaine probabilité
+                probabilite = math.exp(
+                    (objectif_actuel - objectif_voisin) / temperature
+                )
+                if (seuil := self._random.random()) < probabilite:
+                    objectif_actuel = objectif_voisin
+                    acceptations += 1
+                    if DEBUG:
+                        _LOGGER.debug(
+                            "---> On garde l'objectif voisin car seuil (%.2f) inférieur à proba (%.2f)",
+                            seuil,
+                            probabilite,
+                        )
+                else:
+                    self.annuler_permutation(solution_actuelle, undo)
+                    if DEBUG:
+                        _LOGGER.debug("--> On ne prend pas")
+
+            # Réduire la température
+            temperature *= facteur_refroidissement
+            if DEBUG:
+                _LOGGER.debug(" !! Temperature %.2f", temperature)
+            if temperature < self._temperature_minimale or meilleure_objectif <= 0:
+                break
+            if patience and iteration - derniere_amelioration >= patience:
+                _LOGGER.debug("No improvement since %d iterations. The Simulated Annealing is stopped", patience)
+                break
+
+        self._nombre_iterations_effectuees = nombre_iterations
+        self._nombre_acceptations = acceptations
+        return meilleure_solution, meilleure_objectif
+
+    def executer_recuit_multi_chaines(self, solution_initiale: Solution) -> tuple[Solution, float]:
+        """Run the simulated annealing with several chains (parallel tempering).
+        Each chain starts from the initial solution and has its own temperature: the first chain has the
+        initial temperature and each next chain is colder. At each iteration all the chains do a move and
+        periodically the solutions of two neighbour chains are exchanged with the Metropolis criteria, so that
+        the good solutions found by the hot chains are refined by the cold ones.
+        Returns the best solution found by all the chains and its objective"""
+        nb_chaines = self._nb_chaines
+        solutions = [solution_initiale] + [solution_initiale.copy() for _ in range(nb_chaines - 1)]
+        objectifs = [self.calculer_objectif(solution_initiale)] * nb_chaines
+        temperatures = [self._temperature_initiale_run * FACTEUR_TEMPERATURE_CHAINES**k for k in range(nb_chaines)]
+        meilleure_solution = solution_initiale.copy()
+        meilleure_objectif = objectifs[0]
+        nombre_iterations = acceptations = 0
+        facteur_refroidissement = self.facteur_refroidissement_run()
+        patience = self._iterations_sans_amelioration if self._adaptatif else 0
+        derniere_amelioration = 0
+        date_limite = self._debut_run + self._duree_max_sec
+
+        for iteration in range(self._nombre_iterations_run):
+            if not iteration & 15 and time.monotonic() >= date_limite:
+                _LOGGER.warning(
+                    "The Simulated Annealing algorithm has exceeded its time budget of %.2f sec after %d iterations. The best solution found so far is used",
+                    self._duree_max_sec,
+                    iteration,
+                )
+                break
+            nombre_iterations += 1
+
+            for k in range(nb_chaines):
+                solution = solutions[k]
+                undo = self.permuter_equipement(solution)
+                objectif_voisin = self.calculer_objectif(solution)
+                if objectif_voisin < objectifs[k] or self._random.random() < math.exp((objectifs[k] - objectif_voisin) / temperatures[k]):
+                    objectifs[k] = objectif_voisin
+                    acceptations += 1
+                    if objectif_voisin < meilleure_objectif:
+                        meilleure_solution = solution.copy()
+                        meilleure_objectif = objectif_voisin
+                        derniere_amelioration = iteration
+                else:
+                    self.annuler_permutation(solution, undo)
+
+            # Try to exchange the solutions of neighbour chains
+            if iteration % PERIODE_ECHANGE_CHAINES == PERIODE_ECHANGE_CHAINES - 1:
+                for k in range(nb_chaines - 1):
+                    delta = (objectifs[k] - objectifs[k + 1]) * (1 / temperatures[k] - 1 / temperatures[k + 1])
+                    if delta >= 0 or self._random.random() < math.exp(delta):
+                        solutions[k], solutions[k + 1] = solutions[k + 1], solutions[k]
+                        objectifs[k], objectifs[k + 1] = objectifs[k + 1], objectifs[k]
+
+            # Réduire la température de toutes les chaines
+            temperatures = [temperature * facteur_refroidissement for temperature in temperatures]
+            if temperatures[0] < self._temperature_minimale or meilleure_objectif <= 0:
+                break
+            if patience and iteration - derniere_amelioration >= patience:
+                break
+
+        self._nombre_iterations_effectuees = nombre_iterations
+        self._nombre_acceptations = acceptations
+        return meilleure_solution, meilleure_objectif
+
+    def options_equipement(self, solution: Solution, idx: int) -> list[tuple[bool, float]]:
+        """Returns all the (state, requested_power) the equipment idx can take from the solution given in argument.
+        The current state is always the first option. Options with the same consumption are given only once"""
+        state = solution.states[idx]
+        options = [(state, solution.requested_powers[idx])]
+        is_waiting = self._is_waiting[idx]
+        if not self._is_usable[idx] or (is_waiting and not state):
+            return options
+
+        power_max = self._power_max[idx]
+        if not self._can_change_power[idx]:
+            if not is_waiting:
+                options.append((False, 0))
+                options.append((True, power_max))
+        else:
+            # A waiting equipment cannot be switched off but its power can change
+            if not is_waiting:
+                options.append((False, 0))
+            power_step = self._power_step[idx]
+            power = self._power_min[idx]
+            while power_step > 0 and power <= power_max:
+                if power > 0:
+                    options.append((True, power))
+                power += power_step
+
+        consommations = set()
+        uniques = []
+        for option_state, power in options:
+            consommation = power if option_state else 0
+            if consommation not in consommations:
+                consommations.add(consommation)
+                uniques.append((option_state, power))
+        return uniques
+
+    def resoudre_trivial(self, solution_initiale: Solution) -> tuple[Solution, str] | None:
+        """Detect the situations in which the best solution is known without search and returns it with the name of
+        the fast path. The objective is convex in the total power of the equipments with its minimum when the surplus
+        is consumed, so the best solution is known:
+         - when no equipment can change,
+         - when there is no surplus with all the equipments at their lowest power (at night for example): they stay at their lowest power,
+         - when the surplus is above the power of all the equipments at their highest power: they all go to their highest power,
+         - when the surplus is below the smallest power increase of an equipment: the best of doing nothing and of this smallest increase.
+        The priorities could change the best solution only if the priority weight is not 0. Returns None if a search is needed"""
+        variables = []
+        for idx in self._indices_utilisables:
+            if len(options := self.options_equipement(solution_initiale, idx)) > 1:
+                # The options sorted by increasing consumption
+                variables.append((idx, sorted(options, key=lambda option: option[1] if option[0] else 0)))
+
+        if not variables:
+            return solution_initiale, FAST_PATH_NO_USABLE_DEVICES
+
+        solution_min = solution_initiale.copy()
+        for idx, options in variables:
+            self.affecter(solution_min, idx, *options[0])
+        surplus = -(self._consommation_net + solution_min.puissance_totale - self._puissance_totale_eqt_initiale)
+
+        # Without priority weight, the objective only depends on the total power. With a priority weight and no
+        # power at all, the priority part of the objective is also at its minimum (0)
+        if surplus <= 0 and (self._priority_weight == 0 or solution_min.puissance_totale == 0):
+            return solution_min, FAST_PATH_NO_SURPLUS
+        if self._priority_weight != 0:
+            return None
+
+        def consommation(option: tuple[bool, float]) -> float:
+            return option[1] if option[0] else 0
+
+        if surplus >= sum(consommation(options[-1]) - consommation(options[0]) for _, options in variables):
+            solution_max = solution_min.copy()
+            for idx, options in variables:
+                self.affecter(solution_max, idx, *options[-1])
+            return solution_max, FAST_PATH_SURPLUS_ABOVE_MAX_POWER
+
+        # The smallest increase of the total power. In case of equality, the equipment which keeps its state is preferred
+        idx, options = min(
+            variables,
+            key=lambda variable: (
+                consommation(variable[1][1]) - consommation(variable[1][0]),
+                variable[1][1] != (solution_initiale.states[variable[0]], solution_initiale.requested_powers[variable[0]]),
+            ),
+        )
+        if surplus < consommation(options[1]) - consommation(options[0]):
+            solution_plus = solution_min.copy()
+            self.affecter(solution_plus, idx, *options[1])
+            meilleure_solution = min(
+                (solution_min, solution_plus),
+                key=lambda solution: (
+                    self.calculer_objectif(solution),
+                    abs(solution.puissance_totale - self._puissance_totale_eqt_initiale),
+                ),
+            )
+            return meilleure_solution, FAST_PATH_SURPLUS_BELOW_MIN_POWER
+
+        return None
+
+    def resoudre_exact(self, solution_initiale: Solution) -> tuple[Solution, float] | None:
+        """Solve the problem exactly with a dynamic programming over the achievable total power.
+        For a total power, the objective only depends on the sum of priority * power, so only the minimal sum
+        is kept for each total power. Returns None if the problem is too big or if the part of the time budget given to
+        the exact algorithm is exhausted (the simulated annealing should then be used)"""
+        variables = []
+        for idx in range(len(self._equipements)):
+            if len(options := self.options_equipement(solution_initiale, idx)) > 1:
+                variables.append((idx, options))
+
+        if len(variables) > self._nb_max_equipements_exact:
+            return None
+
+        # The equipments which cannot change are part of the initial solution
+        solution = solution_initiale.copy()
+        for idx, _ in variables:
+            self.affecter(solution, idx, False, 0)
+        puissance_fixe = solution.puissance_totale
+        somme_fixe = solution.somme_priorites
+
+        # etats gives for each achievable total power, the minimal sum of priority * power
+        etats: dict[float, float] = {0: 0}
+        retours: list[dict[float, tuple[float, tuple[bool, float]]]] = []
+        date_limite = self._debut_run + self._duree_max_sec * RATIO_DUREE_EXACT
+        for idx, options in variables:
+            if len(etats) * len(options) > MAX_EXACT_TRANSITIONS:
+                _LOGGER.info("The exact algorithm would evaluate more than %d combinations", MAX_EXACT_TRANSITIONS)
+                return None
+            priority = self._priorities[idx]
+            nouveaux_etats: dict[float, float] = {}
+            retour = {}
+            for numero, (puissance, somme) in enumerate(etats.items()):
+                # Check the time budget every 256 total powers
+                if not numero & 255 and time.monotonic() >= date_limite:
+                    _LOGGER.info("The exact algorithm has exceeded its part of the time budget")
+                    return None
+                for option in options:
+                    consommation = option[1] if option[0] else 0
+                    nouvelle_puissance = puissance + consommation
+                    nouvelle_somme = somme + priority * consommation
+                    if nouvelle_puissance not in nouveaux_etats or nouvelle_somme < nouveaux_etats[nouvelle_puissance]:
+                        nouveaux_etats[nouvelle_puissance] = nouvelle_somme
+                        retour[nouvelle_puissance] = (puissance, option)
+            if len(nouveaux_etats) > MAX_EXACT_STATES:
+                return None
+            etats = nouveaux_etats
+            retours.append(retour)
+
+        # Search the best total power. In case of equality, the one which changes the less the total power is preferred
+        meilleure_puissance = min(
+            etats,
+            key=lambda puissance: (
+                self.calculer_objectif_puissance(puissance_fixe + puissance, somme_fixe + etats[puissance]),
+                abs(puissance_fixe + puissance - self._puissance_totale_eqt_initiale),
+            ),
+        )
+
+        # Rebuild the solution from the last equipment to the first one
+        puissance = meilleure_puissance
+        for (idx, _), retour in zip(reversed(variables), reversed(retours)):
+            puissance, (state, requested_power) = retour[puissance]
+            self.affecter(solution, idx, state, requested_power)
+
+        return solution, self.calculer_objectif(solution)
+
+    def calculer_objectif(self, solution: Solution) -> float:
+        """Calcul de l'objectif : minimiser le surplus de production solaire
+        rejets = 0 if consommation_net >=0 else -consommation_net
+        consommation_solaire = min(production_solaire, production_solaire - rejets)
+        consommation_totale = consommation_net + consommation_solaire
+        The objectif is calculated in O(1) with the running totals of the solution
+        """
+        return self.calculer_objectif_puissance(solution.puissance_totale, solution.somme_priorites)
+
+    def calculer_objectif_puissance(self, puissance_totale_eqt: float, somme_priorites: float) -> float:
+        """Calcul de l'objectif pour une puissance totale des équipements et une somme des priorités * puissance"""
+        diff_puissance_totale_eqt = (
+            puissance_totale_eqt - self._puissance_totale_eqt_initiale
+        )
+
+        new_consommation_net = self._consommation_net + diff_puissance_totale_eqt
+        new_rejets = 0 if new_consommation_net >= 0 else -new_consommation_net
+        new_import = 0 if new_consommation_net < 0 else new_consommation_net
+        new_consommation_solaire = min(
+            self._production_solaire, self._production_solaire - new_rejets
+        )
+        new_consommation_totale = (
+            new_consommation_net + new_rejets
+        ) + new_consommation_solaire
+        if DEBUG:
+            _LOGGER.debug(
+                "Objectif : cette solution ajoute %.3fW a la consommation initial. Nouvelle consommation nette=%.3fW. Nouveaux rejets=%.3fW. Nouvelle conso totale=%.3fW",
+                diff_puissance_totale_eqt,
+                new_consommation_net,
+                new_rejets,
+                new_consommation_totale,
+            )
+
+        consumption_coef = self._coef_import * new_import + self._coef_rejets * new_rejets
+        # calculate the priority coef as the sum of the priority of all devices
+        # in the solution weighted by their power
+        if puissance_totale_eqt > 0:
+            priority_coef = somme_priorites / puissance_totale_eqt
+        else:
+            priority_coef = 0
+        priority_weight = self._priority_weight
+
+        ret = consumption_coef * (1.0 - priority_weight) + priority_coef * priority_weight
+        return ret
+
+    def generer_solution_initiale(self, equipements: list[dict]) -> Solution:
+        """Generate the initial solution (which is the state of the equipments given in argument) and calculate the total initial power.
+        The static characteristics of the equipments are stored in parallel arrays indexed like the solution"""
+        self._power_max = [eqt["power_max"] for eqt in equipements]
+        self._power_min = [eqt["power_min"] for eqt in equipements]
+        self._power_step = [eqt["power_step"] for eqt in equipements]
+        self._priorities = [eqt["priority"] for eqt in equipements]
+        self._is_usable = [eqt["is_usable"] for eqt in equipements]
+        self._is_waiting = [eqt["is_waiting"] for eqt in equipements]
+        self._can_change_power = [eqt["can_change_power"] for eqt in equipements]
+        # The moves table: the equipments which can be moved and the lowest power reachable by a power change
+        # with and without switching off. They do not change during a run
+        self._indices_utilisables = [i for i, is_usable in enumerate(self._is_usable) if is_usable]
+        self._power_min_extinction = [max(0, power_min - power_step) for power_min, power_step in zip(self._power_min, self._power_step)]
+        self._power_min_allume = [max(power_min, power_step) for power_min, power_step in zip(self._power_min, self._power_step)]
+
+        states = [eqt["state"] for eqt in equipements]
+        requested_powers = [eqt["requested_power"] for eqt in equipements]
+        solution = Solution(
+            states,
+            requested_powers,
+            0,
+            sum(self._priorities[i] * requested_powers[i] for i, state in enumerate(states) if state),
+        )
+        solution.puissance_totale = self._puissance_totale_eqt_initiale = self.consommation_equipements(solution)
+        return solution
+
+    def affecter(self, solution: Solution, idx: int, state: bool, requested_power: float):
+        """Set the state and the requested_power of the equipment idx and update the running totals of the solution"""
+        priority = self._priorities[idx]
+        if solution.states[idx]:
+            old_power = solution.requested_powers[idx]
+            solution.puissance_totale -= old_power
+            solution.somme_priorites -= priority * old_power
+        if state:
+            solution.puissance_totale += requested_power
+            solution.somme_priorites += priority * requested_power
+        solution.states[idx] = state
+        solution.requested_powers[idx] = requested_power
+
+    def construire_solution(self, solution: Solution) -> list[dict]:
+        """Convert a solution into the list of equipments (dict) given to the caller"""
+        return [
+            {**eqt, "state": solution.states[i], "requested_power": solution.requested_powers[i]}
+            for i, eqt in enumerate(self._equipements)
+        ]
+
+    def consommation_equipements(self, solution: Solution) -> float:
+        """The total power consumption for all active equipement (recalculated from scratch)"""
+        requested_powers = solution.requested_powers
+        return sum(requested_powers[i] for i, state in enumerate(solution.states) if state)
+
+    def calculer_new_power(self, idx: int, current_power: float, can_switch_off: bool) -> float:
+        """Calcul une nouvelle puissance. The new power is current_power plus or minus a random number of power steps
+        between the lowest reachable power and power_max. The number of steps is drawn directly from the bounds
+        precomputed by generer_solution_initiale, so that no list of choices is built"""
+        power_step = self._power_step[idx]
+        if power_step <= 0:
+            return current_power
+
+        power_min_to_use = self._power_min_extinction[idx] if can_switch_off else self._power_min_allume[idx]
+        power_max = self._power_max[idx]
+        nb_baisses = math.ceil((current_power - power_min_to_use) / power_step) if current_power > power_min_to_use else 0
+        nb_hausses = math.ceil((power_max - current_power) / power_step) if current_power < power_max else 0
+        if nb_baisses + nb_hausses <= 0:
+            # No changes
+            return current_power
+
+        # The choices are -1 .. -nb_baisses then 1 .. nb_hausses steps
+        choice = self._random.randrange(nb_baisses + nb_hausses)
+        power_add = (-choice - 1 if choice < nb_baisses else choice - nb_baisses + 1) * power_step
+        requested_power = current_power + power_add
+        if DEBUG:
+            _LOGGER.debug("Adding %d power to current_power (%d). New requested_power is %s", power_add, current_power, requested_power)
+        return requested_power
+
+    def permuter_equipement(self, solution: Solution) -> tuple[int, bool, float] | None:
+        """Permuter le state d'un equipement au hasard. The solution is modified in place.
+        Returns the undo information (index, old state, old requested_power) or None if nothing has changed"""
+        usable = self._indices_utilisables
+        if not usable:
+            return None
+
+        idx = self._random.choice(usable)
+
+        state = solution.states[idx]
+        can_change_power = self._can_change_power[idx]
+        is_waiting = self._is_waiting[idx]
+
+        # Current power is the last requested_power
+        current_power = solution.requested_powers[idx]
+        # If power is not manageable, min = max
+        power_min = self._power_min[idx] if can_change_power else self._power_max[idx]
+
+        # On veut gérer le is_waiting qui interdit d'allumer ou éteindre un eqt usable.
+        # On veut pouvoir changer la puissance si l'eqt est déjà allumé malgré qu'il soit waiting.
+        # Usable veut dire qu'on peut l'allumer/éteindre OU qu'on peut changer la puissance
+
+        # if not can_change_power and is_waiting:
+        #    -> on ne fait rien (mais ne devrait pas arriver car il ne serait pas usable dans ce cas)
+        #
+        # if state and can_change_power and is_waiting:
+        #    -> change power mais sans l'éteindre (requested_power >= power_min)
+        #
+        # if state and can_change_power and not is_waiting:
+        #    -> change power avec extinction possible
+        #
+        # if not state and not is_waiting
+        #    -> allumage
+        #
+        # if state and not is_waiting
+        #    -> extinction
+        #
+        if (not can_change_power and is_waiting) or (
+            not state and can_change_power and is_waiting
+        ):
+            _LOGGER.debug("not can_change_power and is_waiting -> do nothing")
+            return None
+
+        new_state = state
+        if state and can_change_power and is_waiting:
+            # calculated a new power but do not switch off (because waiting)
+            requested_power = self.calculer_new_power(idx, current_power, can_switch_off=False)
+            assert (
+                requested_power > 0
+            ), "Requested_power should be > 0 because is_waiting is True"
+
+        elif state and can_change_power and not is_waiting:
+            # change power and accept switching off
+            requested_power = self.calculer_new_power(idx, current_power, can_switch_off=True)
+            if requested_power < power_min:
+                # deactivate the equipment
+                new_state = False
+                requested_power = 0
+
+        elif not state and not is_waiting:
+            # Allumage
+            new_state = True
+            requested_power = power_min
+
+        elif state and not is_waiting:
+            # Extinction
+            new_state = False
+            requested_power = 0
+
+        else:
+            _LOGGER.error("We should not be there. eqt=%s", self._equipements[idx])
+            assert False, "Requested power n'a pas été calculé. Ce n'est pas normal"
+
+        self.affecter(solution, idx, new_state, requested_power)
+
+        if DEBUG:
+            _LOGGER.debug(
+                "      -- On permute %s puissance max de %.2f. Il passe à %s",
+                self._equipements[idx]["name"],
+                requested_power,
+                new_state,
+            )
+        return idx, state, current_power
+
+    def annuler_permutation(self, solution: Solution, undo: tuple[int, bool, float] | None):
+        """Restore the solution as it was before the permuter_equipement which gave the undo information"""
+        if undo is None:
+            return
+        idx, state, requested_power = undo
+        self.affecter(solution, idx, state, requested_power)
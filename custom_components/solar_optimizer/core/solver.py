@@ -0,0 +1,35 @@
+""" The solver API of the optimization core """
+
+from .model import DeviceSnapshot, GridSnapshot, SolverResult
+from .simulated_annealing_algo import SimulatedAnnealingAlgorithm
+
+
+def solve(
+    algorithm: SimulatedAnnealingAlgorithm,
+    devices: list[DeviceSnapshot],
+    grid: GridSnapshot,
+    previous_solution: dict[str, dict] | None = None,
+    variation: float | None = None,
+    seed: int | None = None,
+) -> SolverResult:
+    """Search the best states and powers of the devices for the grid situation. The disabled devices are ignored.
+    previous_solution (the states of the previous best solution by unique_id) and variation give a warm start"""
+    equipements = algorithm.preparer_equipements(devices, grid.battery_soc)
+    if not equipements or not algorithm.entrees_valides(
+        grid.power_consumption, grid.power_production, grid.sell_cost, grid.buy_cost, grid.sell_tax_percent
+    ):
+        return SolverResult([], -1, -1)
+
+    best_solution, best_objective, total_power = algorithm.optimiser(
+        equipements,
+        grid.consumption_with_battery,
+        grid.power_production,
+        grid.sell_cost,
+        grid.buy_cost,
+        grid.sell_tax_percent,
+        grid.priority_weight,
+        previous_solution,
+        variation,
+        seed,
+    )
+    return SolverResult(best_solution, best_objective, total_power, algorithm.nombre_iterations_effectuees, algorithm.chemin_rapide)
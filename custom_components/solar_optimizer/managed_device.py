@@ -1,8 +1,13 @@
 """ A ManagedDevice represent a device than can be managed by the optimisatiion algorithm"""
 import logging
 from datetime import datetime, timedelta, time
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any, Callable, NamedTuple
 
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.exceptions import TemplateError
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+from homeassistant.helpers.event import TrackTemplate, TrackTemplateResultInfo, async_track_template_result
 from homeassistant.helpers.template import Template
 from homeassistant.components.select import SelectEntity
 from homeassistant.const import STATE_ON, STATE_UNAVAILABLE, STATE_UNKNOWN
@@ -23,8 +28,12 @@ from .const import (
     EVENT_TYPE_SOLAR_OPTIMIZER_CHANGE_POWER,
     EVENT_TYPE_SOLAR_OPTIMIZER_STATE_CHANGE,
     EVENT_TYPE_SOLAR_OPTIMIZER_ENABLE_STATE_CHANGE,
+    SIGNAL_ENABLE_STATE_CHANGE,
 )
 
+if TYPE_CHECKING:
+    from .coordinator import InputSnapshot
+
 ACTION_ACTIVATE = "Activate"
 ACTION_DEACTIVATE = "Deactivate"
 ACTION_CHANGE_POWER = "ChangePower"
@@ -37,59 +46,83 @@ POWERED_ENTITY_DOMAINS_NEED_ATTR = (
 
 _LOGGER = logging.getLogger(__name__)
 
+class ServiceAction(NamedTuple):
+    """A service declaration 'domain/action[/parameter]' parsed once when the device is created"""
+
+    service_name: str
+    domain: str
+    action: str
+    # The raw parameter (the third part) of the declaration or None
+    parameter: str | None
+    # The data key of the power for a change of power ('value' by default)
+    attribute: str
+    # The static data of an activation or a deactivation ('option:value' parameter)
+    data: MappingProxyType
+
+
+def parse_service_action(service_name: str | None, entity_id) -> ServiceAction | None:
+    """Parse a service declaration formatted with 'domain/action[/option:value]' or 'domain/action[/attribute]'.
+    Returns None if there is no service. Raises a ConfigurationError if the declaration is incorrect"""
+    if service_name is None or len(service_name) == 0:
+        return None
+
+    parties = service_name.split("/")
+    if len(parties) < 2:
+        raise ConfigurationError(
+            f"Incorrect service declaration for entity {entity_id}. Service {service_name} should be formatted with: 'domain/action[/option:value]'"
+        )
+
+    parameter = parties[2] if len(parties) == 3 else None
+    data = {}
+    if parameter:
+        args = parameter.split(":")
+        if len(args) >= 2:
+            data = {args[0]: args[1]}
+
+    return ServiceAction(
+        service_name,
+        parties[0],
+        parties[1],
+        parameter,
+        # default data key for most entities
+        parameter or "value",
+        MappingProxyType(data),
+    )
+
+
 async def do_service_action(
     hass: HomeAssistant,
     entity_id,
     action_type,
-    service_name,
+    service_action: ServiceAction | None,
     current_power,
     requested_power,
     convert_power_divide_factor,
 ):
     """Activate an entity via a service call"""
 
-    if service_name is None or len(service_name) == 0:
+    if service_action is None:
         _LOGGER.info(
             "No service name defined for entity %s. Cannot call service",
             entity_id,
         )
         return
 
-    _LOGGER.info("Calling service %s for entity %s", service_name, entity_id)
-    parties = service_name.split("/")
-    if len(parties) < 2:
-        raise ConfigurationError(
-            f"Incorrect service declaration for entity {entity_id}. Service {service_name} should be formatted with: 'domain/action[/option:value]'"
-        )
-
-    service_data = {}
-    domain = parties[0]
-    action = parties[1]
-    parameter = parties[2] if len(parties) == 3 else None
-
-    attributes = "value" # default data key for most entities
+    _LOGGER.info("Calling service %s for entity %s", service_action.service_name, entity_id)
 
     if action_type == ACTION_CHANGE_POWER:
-        value = round(requested_power / convert_power_divide_factor)
-        if parameter:
-            attributes = parameter
-        service_data = {attributes: value}
+        service_data = {service_action.attribute: round(requested_power / convert_power_divide_factor)}
     else:
-        if parameter:
-            args = parameter.split(":")
-            if len(args) >= 2:
-                service_data = {args[0]: args[1]}
+        service_data = dict(service_action.data)
 
     target = {
         "entity_id": entity_id,
     }
 
-    try:
-        await hass.services.async_call(
-            domain, action, service_data=service_data, target=target
-        )
-    except Exception as err:  # pylint: disable=broad-except
-        _LOGGER.exception(err)
+    # The call waits for the end of the service so that its errors and its duration are seen by the caller
+    await hass.services.async_call(
+        service_action.domain, service_action.action, service_data=service_data, target=target, blocking=True
+    )
 
     # Also send an event to inform
     do_event_action(
@@ -141,6 +174,11 @@ class ManagedDevice:
 
         self._hass = hass
         self._coordinator = coordinator
+        # The results of the templates rendered during a refresh cycle of the coordinator. None outside of a cycle
+        self._render_cache: dict[str, Any] | None = None
+        # The last results of the tracked templates. They are updated when the entities of the templates change
+        self._template_results: dict[str, Any] = {}
+        self._template_tracker: TrackTemplateResultInfo | None = None
         self._name = device_config.get("name")
         self._unique_id = name_to_unique_id(self._name)
         self._entity_id = device_config.get("entity_id")
@@ -194,6 +232,19 @@ class ManagedDevice:
         self._activation_service = device_config.get("activation_service")
         self._deactivation_service = device_config.get("deactivation_service")
         self._change_power_service = device_config.get("change_power_service")
+        # The services are parsed once. An incorrect declaration is a configuration error
+        self._activation_action = parse_service_action(self._activation_service, self._entity_id)
+        self._deactivation_action = parse_service_action(self._deactivation_service, self._entity_id)
+        self._change_power_action = parse_service_action(self._change_power_service, self._power_entity_id)
+        if (
+            self._can_change_power
+            and self._power_entity_id is not None
+            and self._power_entity_id.startswith(POWERED_ENTITY_DOMAINS_NEED_ATTR)
+            and (self._change_power_action is None or self._change_power_action.parameter is None)
+        ):
+            raise ConfigurationError(
+                f"Incorrect service declaration for power entity {self._power_entity_id}. Service {self._change_power_service} should be formatted with: 'domain/action/attribute'"
+            )
 
         self._battery_soc = None
         self._battery_soc_threshold = convert_to_template_or_value(hass, device_config.get("battery_soc_threshold") or 0)
@@ -232,6 +283,62 @@ class ManagedDevice:
 
         self._priority_entity = None
 
+    def start_render_cycle(self):
+        """Start a refresh cycle. Each template is then rendered at most once until end_render_cycle is called"""
+        self._render_cache = {}
+
+    def end_render_cycle(self):
+        """End a refresh cycle. The templates are rendered at each access"""
+        self._render_cache = None
+
+    def async_track_templates(self) -> Callable[[], None]:
+        """Track the results of the check_usable and check_active templates. They are then rendered only when
+        the entities they reference change, and the coordinator index is updated. Returns the function which
+        stops the tracking"""
+        tracked = (("check_usable", self._check_usable_template), ("check_active", self._check_active_template))
+
+        @callback
+        def on_template_results(_event, updates):
+            for update in updates:
+                key = next(key for key, template in tracked if template is update.template)
+                if isinstance(update.result, TemplateError):
+                    # the template is rendered again at each access and gives the error
+                    self._template_results.pop(key, None)
+                else:
+                    self._template_results[key] = update.result
+            self._coordinator.update_device_index(self)
+
+        self._template_tracker = async_track_template_result(
+            self._hass, [TrackTemplate(template, None) for _, template in tracked], on_template_results
+        )
+        self._template_results = {key: get_template_or_value(self._hass, template) for key, template in tracked}
+
+        @callback
+        def untrack():
+            if self._template_tracker is not None:
+                self._template_tracker.async_remove()
+                self._template_tracker = None
+            self._template_results = {}
+
+        return untrack
+
+    @property
+    def is_template_usable(self) -> bool:
+        """The last result of the check_usable template"""
+        return bool(self._render("check_usable", self._check_usable_template))
+
+    def _render(self, key: str, template_or_value):
+        """Render a template (or return the value) using the tracked results or the cache of the current refresh cycle"""
+        if key in self._template_results:
+            return self._template_results[key]
+
+        if self._render_cache is None:
+            return get_template_or_value(self._hass, template_or_value)
+
+        if key not in self._render_cache:
+            self._render_cache[key] = get_template_or_value(self._hass, template_or_value)
+        return self._render_cache[key]
+
     async def _apply_action(self, action_type: str, requested_power=None):
         """Apply an action to a managed device.
         This method is a generical method for activate, deactivate, change_requested_power
@@ -250,18 +357,18 @@ class ManagedDevice:
             method = None
             entity_id = self._entity_id
             if action_type == ACTION_ACTIVATE:
-                method = self._activation_service
+                method = self._activation_action
                 self.reset_next_date_available(action_type)
                 if self._can_change_power:
                     self.reset_next_date_available_power()
             elif action_type == ACTION_DEACTIVATE:
-                method = self._deactivation_service
+                method = self._deactivation_action
                 self.reset_next_date_available(action_type)
             elif action_type == ACTION_CHANGE_POWER:
                 assert (
                     self._can_change_power
                 ), f"Equipment {self._name} cannot change its power. We should not be there."
-                method = self._change_power_service
+                method = self._change_power_action
                 entity_id = self._power_entity_id
                 self.reset_next_date_available_power()
 
@@ -373,8 +480,9 @@ class ManagedDevice:
                 self._next_date_available,
             )
 
-    def set_current_power_with_device_state(self):
-        """Set the current power according to the real device state"""
+    def set_current_power_with_device_state(self, snapshot: "InputSnapshot | None" = None):
+        """Set the current power according to the real device state. The state of the power entity is taken
+        from the snapshot of the refresh cycle if given"""
         if not self.is_active:
             self._current_power = 0
             _LOGGER.debug(
@@ -391,7 +499,10 @@ class ManagedDevice:
             )
             return
 
-        power_entity_state = self._hass.states.get(self._power_entity_id)
+        if snapshot is not None:
+            power_entity_state = snapshot.get_state(self._power_entity_id)
+        else:
+            power_entity_state = self._hass.states.get(self._power_entity_id)
         if not power_entity_state or power_entity_state.state in [None, STATE_UNKNOWN, STATE_UNAVAILABLE]:
             self._current_power = self._power_min
             _LOGGER.debug(
@@ -403,15 +514,8 @@ class ManagedDevice:
             return
 
         if self._power_entity_id.startswith(POWERED_ENTITY_DOMAINS_NEED_ATTR):
-            # TODO : move this part to device initialisation, make new instance variable
-            service_name = self._change_power_service # retrieve attribute from power service
-            parties = self._change_power_service.split("/")
-            if len(parties) < 2:
-                raise ConfigurationError(
-                    f"Incorrect service declaration for power entity. Service {service_name} should be formatted with: 'domain/action/attribute'"
-                )
-            parameter = parties[2]
-            power_entity_value = power_entity_state.attributes[parameter]
+            # the attribute is the one of the power service, checked at initialisation
+            power_entity_value = power_entity_state.attributes[self._change_power_action.parameter]
         else:
             power_entity_value = power_entity_state.state
 
@@ -444,6 +548,10 @@ class ManagedDevice:
         """Set the requested power of the ManagedDevice"""
         self._requested_power = requested_power
 
+    def set_available_from(self, date: datetime):
+        """Set the date from which the device could be activated, deactivated and change its power"""
+        self._next_date_available = self._next_date_available_power = date
+
     @property
     def is_enabled(self) -> bool:
         """return true if the managed device is enabled for solar optimisation"""
@@ -457,7 +565,7 @@ class ManagedDevice:
     @property
     def is_active(self) -> bool:
         """Check if device is active by getting the underlying state of the device"""
-        result = self._check_active_template.async_render(context={})
+        result = self._render("check_active", self._check_active_template)
         if result:
             _LOGGER.debug("%s is active", self._name)
 
@@ -474,9 +582,8 @@ class ManagedDevice:
             )
             result = False
         else:
-            context = {}
             now = self.now
-            result = self._check_usable_template.async_render(context)
+            result = self._render("check_usable", self._check_usable_template)
             if self._can_change_power:
                 result = result and now >= self._next_date_available_power
             else:
@@ -547,7 +654,7 @@ class ManagedDevice:
     @property
     def power_max(self):
         """The power max of the managed device"""
-        return get_template_or_value(self._hass, self._power_max)
+        return self._render("power_max", self._power_max)
 
     @property
     def power_min(self):
@@ -584,6 +691,11 @@ class ManagedDevice:
         """The entity_id of the device which gives the current power"""
         return self._power_entity_id
 
+    @property
+    def service_actions(self) -> tuple[ServiceAction | None, ServiceAction | None, ServiceAction | None]:
+        """The activation, deactivation and change power services of the device"""
+        return self._activation_action, self._deactivation_action, self._change_power_action
+
     @property
     def current_power(self) -> int:
         """The current_power of the device"""
@@ -617,12 +729,12 @@ class ManagedDevice:
     @property
     def max_on_time_per_day_sec(self) -> int:
         """The max_on_time_per_day_sec configured"""
-        return get_template_or_value(self._hass, self._max_on_time_per_day_min) * 60
+        return self._render("max_on_time_per_day_min", self._max_on_time_per_day_min) * 60
 
     @property
     def min_on_time_per_day_sec(self) -> int:
         """The min_on_time_per_day_sec configured"""
-        return get_template_or_value(self._hass, self._min_on_time_per_day_min) * 60
+        return self._render("min_on_time_per_day_min", self._min_on_time_per_day_min) * 60
 
     @property
     def offpeak_time(self) -> int:
@@ -637,7 +749,7 @@ class ManagedDevice:
     @property
     def battery_soc_threshold(self) -> int:
         """The battery soc"""
-        return get_template_or_value(self._hass, self._battery_soc_threshold)
+        return self._render("battery_soc_threshold", self._battery_soc_threshold)
 
     def set_battery_soc(self, battery_soc):
         """Define the battery soc. This is used with is_usable
@@ -645,7 +757,13 @@ class ManagedDevice:
         self._battery_soc = battery_soc
 
     def publish_enable_state_change(self) -> None:
-        """Publish an event when the state is changed"""
+        """Signal the enable state change to the entities of this device. The event on the bus (which renders
+        the templates of the device) is fired only if publish_enable_state_events is set"""
+
+        async_dispatcher_send(self._hass, SIGNAL_ENABLE_STATE_CHANGE.format(self._unique_id), self.is_enabled)
+
+        if not self._coordinator.publish_enable_state_events:
+            return
 
         self._hass.bus.fire(
             event_type=EVENT_TYPE_SOLAR_OPTIMIZER_ENABLE_STATE_CHANGE,
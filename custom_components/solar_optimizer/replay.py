@@ -0,0 +1,80 @@
+""" Replay of the optimizations captured by the coordinator.
+
+The captured cycles are returned by the solar_optimizer.get_captured_cycles service. Save the response
+in a JSON file and replay them offline (from the root of the repository):
+    python -m custom_components.solar_optimizer.replay cycles.json
+    python -m custom_components.solar_optimizer.replay cycles.json --index 3 --repeat 10
+
+A replay gives the same result as the captured cycle, unless the captured run has been stopped by its
+time budget (max_duration_sec).
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from .core import SimulatedAnnealingAlgorithm
+
+
+def replay_cycle(cycle: dict) -> dict:
+    """Run again the optimization of a captured cycle. Returns the result, its duration and
+    if it is the same as the captured one"""
+    algo = SimulatedAnnealingAlgorithm(**cycle["algorithm"])
+    start = time.perf_counter()
+    best_solution, best_objective, total_power = algo.optimiser(
+        cycle["equipements"],
+        cycle["power_consumption"],
+        cycle["power_production"],
+        cycle["sell_cost"],
+        cycle["buy_cost"],
+        cycle["sell_tax_percent"],
+        cycle["priority_weight"],
+        cycle["solution_precedente"],
+        cycle["variation"],
+        cycle["seed"],
+    )
+    duration_ms = 1000 * (time.perf_counter() - start)
+    return {
+        "best_solution": best_solution,
+        "best_objective": best_objective,
+        "total_power": total_power,
+        "duration_ms": round(duration_ms, 3),
+        "iterations": algo.nombre_iterations_effectuees,
+        "same_result": best_objective == cycle["best_objective"] and total_power == cycle["total_power"],
+    }
+
+
+def load_cycles(path: str) -> list[dict]:
+    """Load the cycles of a file. The file contains the response of the get_captured_cycles service or a list of cycles"""
+    with open(path, encoding="utf-8") as file:
+        content = json.load(file)
+    return content["cycles"] if isinstance(content, dict) else content
+
+
+def main(argv=None) -> int:
+    """Replay captured cycles and print one line per replay"""
+    parser = argparse.ArgumentParser(description="Replay the optimizations captured by Solar Optimizer")
+    parser.add_argument("file", help="the JSON file with the captured cycles")
+    parser.add_argument("--index", type=int, help="replay only the cycle with this index")
+    parser.add_argument("--repeat", type=int, default=1, help="the number of replays of each cycle (for timing)")
+    args = parser.parse_args(argv)
+
+    cycles = load_cycles(args.file)
+    indexes = [args.index] if args.index is not None else range(len(cycles))
+    all_same = True
+    for index in indexes:
+        cycle = cycles[index]
+        for _ in range(args.repeat):
+            result = replay_cycle(cycle)
+            all_same = all_same and result["same_result"]
+            print(
+                f"cycle={index} date={cycle.get('date')} objective={result['best_objective']} (captured {cycle['best_objective']}) "
+                f"total_power={result['total_power']} (captured {cycle['total_power']}) iterations={result['iterations']} "
+                f"duration_ms={result['duration_ms']} (captured {cycle.get('solver_ms')}) same_result={result['same_result']}"
+            )
+    return 0 if all_same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
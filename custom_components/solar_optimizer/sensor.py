@@ -1,7 +1,7 @@
 """ A sensor entity that holds the result of the recuit simule algorithm """
 
 import logging
-from datetime import datetime, timedelta, time
+from datetime import datetime
 from homeassistant.const import (
     UnitOfPower,
     UnitOfTime,
@@ -11,6 +11,7 @@ from homeassistant.const import (
 )
 from homeassistant.core import callback, HomeAssistant, Event, State
 from homeassistant.helpers.update_coordinator import CoordinatorEntity
+from homeassistant.helpers.entity import EntityCategory
 from homeassistant.helpers import entity_platform
 from homeassistant.components.sensor import (
     SensorEntity,
@@ -31,8 +32,6 @@ from homeassistant.helpers.restore_state import (
 )
 from homeassistant.helpers.event import (
     async_track_state_change_event,
-    async_track_time_change,
-    async_track_time_interval,
 )
 from homeassistant.helpers.device_registry import DeviceInfo
 
@@ -65,8 +64,9 @@ async def async_setup_entry(
         entity4 = SolarOptimizerSensorEntity(coordinator, hass, "power_production_brut")
         entity5 = SolarOptimizerSensorEntity(coordinator, hass, "power_consumption")
         entity6 = SolarOptimizerSensorEntity(coordinator, hass, "battery_soc")
+        entity7 = SolarOptimizerSensorEntity(coordinator, hass, "cycle_duration")
 
-        async_add_entities([entity1, entity2, entity3, entity4, entity5, entity6], False)
+        async_add_entities([entity1, entity2, entity3, entity4, entity5, entity6, entity7], False)
 
         await coordinator.configure(entry)
         return
@@ -107,6 +107,8 @@ class SolarOptimizerSensorEntity(CoordinatorEntity, SensorEntity):
         self._attr_unique_id = "solar_optimizer_" + idx
 
         self._attr_native_value = None
+        if idx == "cycle_duration":
+            self._attr_entity_category = EntityCategory.DIAGNOSTIC
 
     @callback
     def _handle_coordinator_update(self) -> None:
@@ -120,6 +122,17 @@ class SolarOptimizerSensorEntity(CoordinatorEntity, SensorEntity):
             return
 
         self._attr_native_value = value
+        if self.idx == "best_objective":
+            self._attr_extra_state_attributes = {
+                "cache_hits": self.coordinator.cache_hits,
+                "cache_misses": self.coordinator.cache_misses,
+                "events_received": self.coordinator.events_received,
+                "events_coalesced": self.coordinator.events_coalesced,
+                "events_executed": self.coordinator.events_executed,
+                **{f"fast_path_{name}": count for name, count in self.coordinator.fast_paths.items()},
+            }
+        elif self.idx == "cycle_duration":
+            self._attr_extra_state_attributes = self.coordinator.cycle_statistics.as_attributes()
         self.async_write_ha_state()
 
     @property
@@ -143,6 +156,8 @@ class SolarOptimizerSensorEntity(CoordinatorEntity, SensorEntity):
             return "mdi:battery"
         elif self.idx == "power_consumption":
             return "mdi:home-lightning-bolt"
+        elif self.idx == "cycle_duration":
+            return "mdi:timer-outline"
         else:
             return "mdi:solar-power-variant"
 
@@ -152,12 +167,14 @@ class SolarOptimizerSensorEntity(CoordinatorEntity, SensorEntity):
             return SensorDeviceClass.MONETARY
         elif self.idx == "battery_soc":
             return SensorDeviceClass.BATTERY
+        elif self.idx == "cycle_duration":
+            return SensorDeviceClass.DURATION
         else:
             return SensorDeviceClass.POWER
 
     @property
     def state_class(self) -> SensorStateClass | None:
-        if self.device_class in (SensorDeviceClass.POWER, SensorDeviceClass.BATTERY):
+        if self.device_class in (SensorDeviceClass.POWER, SensorDeviceClass.BATTERY, SensorDeviceClass.DURATION):
             return SensorStateClass.MEASUREMENT
         else:
             return SensorStateClass.TOTAL
@@ -168,6 +185,8 @@ class SolarOptimizerSensorEntity(CoordinatorEntity, SensorEntity):
             return "€"
         elif self.idx == "battery_soc":
             return "%"
+        elif self.idx == "cycle_duration":
+            return UnitOfTime.MILLISECONDS
         else:
             return UnitOfPower.WATT
 
@@ -223,26 +242,8 @@ class TodayOnTimeSensor(SensorEntity, RestoreEntity):
         # desarme le timer lors de la destruction de l'entité
         self.async_on_remove(listener_cancel)
 
-        # Add listener to midnight to reset the counter
-        raz_time: time = self._coordinator.raz_time
-        self.async_on_remove(
-            async_track_time_change(
-                hass=self.hass,
-                action=self._on_midnight,
-                hour=raz_time.hour,
-                minute=raz_time.minute,
-                second=0,
-            )
-        )
-
-        # Add a listener to calculate OnTine at each minute
-        self.async_on_remove(
-            async_track_time_interval(
-                self.hass,
-                self._on_update_on_time,
-                interval=timedelta(minutes=1),
-            )
-        )
+        # The OnTime is calculated each minute and reset at raz_time by the shared ticker of the coordinator
+        self.async_on_remove(self._coordinator.register_on_time_sensor(self))
 
         # restore the last value or set to 0
         self._attr_native_value = 0
@@ -328,37 +329,42 @@ class TodayOnTimeSensor(SensorEntity, RestoreEntity):
             self.async_write_ha_state()
             self._device.set_on_time(self._attr_native_value)
 
-    @callback
-    async def _on_midnight(self, _=None) -> None:
-        """Called each day at midnight to reset the counter"""
+    def reset_on_time(self) -> bool:
+        """Reset the counter. Returns True if the state should be written"""
+        changed = self._attr_native_value != 0 or self._last_datetime_on is not None
         self._attr_native_value = 0
 
-        _LOGGER.info("Call of _on_midnight to reset onTime")
-
         # reset _last_datetime_on to now if it was active. Here we lose the time on of yesterday but it is too late I can't do better.
         # Else you will have two point with the same date and not the same value (one with value + duration and one with 0)
         if self._last_datetime_on is not None:
             self._last_datetime_on = self._device.now
 
         self.update_custom_attributes()
-        self.async_write_ha_state()
         self._device.set_on_time(self._attr_native_value)
+        return changed
+
+    def accumulate_on_time(self) -> bool:
+        """Add the on time since the last call if the device is active. Returns True if the value has changed"""
+        if self._last_datetime_on is None or not self._device.is_active:
+            return False
 
-    @callback
-    async def _on_update_on_time(self, _=None) -> None:
-        """Called priodically to update the on_time sensor"""
         now = self._device.now
-        _LOGGER.debug("Call of _on_update_on_time at %s", now)
+        delta = round((now - self._last_datetime_on).total_seconds())
+        if delta <= 0:
+            return False
 
-        if self._last_datetime_on is not None and self._device.is_active:
-            self._attr_native_value += round(
-                (now - self._last_datetime_on).total_seconds()
-            )
-            self._last_datetime_on = now
-            self.update_custom_attributes()
-            self.async_write_ha_state()
+        self._attr_native_value += delta
+        self._last_datetime_on = now
+        self.update_custom_attributes()
+        self._device.set_on_time(self._attr_native_value)
+        return True
 
-            self._device.set_on_time(self._attr_native_value)
+    @callback
+    async def _on_midnight(self, _=None) -> None:
+        """Reset the counter of this sensor (the shared ticker resets all the sensors at raz_time)"""
+        _LOGGER.info("Call of _on_midnight to reset onTime")
+        if self.reset_on_time():
+            self.async_write_ha_state()
 
     def update_custom_attributes(self):
         """Add some custom attributes to the entity"""
@@ -0,0 +1,257 @@
+""" Accelerated-time simulation of Solar Optimizer on recorded production and consumption series.
+
+The simulation drives the coordinator of a Home Assistant instance in which Solar Optimizer is configured
+(see benchmarks/simulate.py to run it from the command line). At each simulated cycle:
+ - the clock of the devices is set with ManagedDevice._set_now and the on time sensors are updated with it,
+ - the production and the net consumption (the recorded consumption of the house without the managed devices,
+   plus the power of the active devices, minus the production) are written in the central entities,
+ - the calculation of the coordinator is run and the devices answer the service calls it sends by updating
+   the states of their entities (the services called by the devices are replaced by simulated ones).
+
+The series are CSV files with a time, a production and a consumption column (in W), or an export of the Home
+Assistant history (entity_id, state and last_changed columns). The templates which use now() still see the real clock.
+The central configuration should not subscribe to the events of the production and of the consumption, else each
+simulated cycle also triggers a refresh.
+"""
+
+import csv
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, NamedTuple
+
+from homeassistant.core import HomeAssistant, ServiceCall
+from homeassistant.const import STATE_OFF, STATE_ON
+from homeassistant.util import dt as dt_util
+
+from .coordinator import SolarOptimizerCoordinator, CycleStatistics
+from .managed_device import ManagedDevice, POWERED_ENTITY_DOMAINS_NEED_ATTR
+
+_LOGGER = logging.getLogger(__name__)
+
+TIME_COLUMNS = ("time", "timestamp", "last_changed")
+
+
+class SeriesPoint(NamedTuple):
+    """The production and the consumption of the house without the managed devices (in W) at a time"""
+
+    time: datetime
+    production: float
+    consumption: float
+
+
+def parse_time(value: str) -> datetime:
+    """Parse an ISO time. A time without time zone is in the time zone of Home Assistant"""
+    date = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    return date if date.tzinfo is not None else date.replace(tzinfo=dt_util.get_default_time_zone())
+
+
+def load_series(path: str, production_entity_id: str | None = None, consumption_entity_id: str | None = None) -> list[SeriesPoint]:
+    """Load a series from a CSV file with time, production and consumption columns or from a Home Assistant
+    history export (the entity ids of the production and of the consumption should then be given).
+    A missing value is the last known value"""
+    with open(path, encoding="utf-8", newline="") as file:
+        rows = list(csv.DictReader(file))
+    if not rows:
+        return []
+
+    time_column = next((column for column in TIME_COLUMNS if column in rows[0]), None)
+    if time_column is None:
+        raise ValueError(f"{path} has no time column. Use one of {TIME_COLUMNS}")
+
+    values: list[tuple[datetime, str, float]] = []
+    for row in rows:
+        if "entity_id" in row:
+            names = {production_entity_id: "production", consumption_entity_id: "consumption"}
+            if (name := names.get(row["entity_id"])) is None:
+                continue
+            raw_values = {name: row["state"]}
+        else:
+            raw_values = {"production": row.get("production"), "consumption": row.get("consumption")}
+        for name, raw_value in raw_values.items():
+            try:
+                values.append((parse_time(row[time_column]), name, float(raw_value)))
+            except (TypeError, ValueError):
+                # unknown, unavailable or empty values are ignored
+                continue
+
+    series = []
+    last = {"production": 0.0, "consumption": 0.0}
+    for date, name, value in sorted(values, key=lambda value: value[0]):
+        last[name] = value
+        if series and series[-1].time == date:
+            series[-1] = SeriesPoint(date, last["production"], last["consumption"])
+        else:
+            series.append(SeriesPoint(date, last["production"], last["consumption"]))
+    return series
+
+
+def resample(series: list[SeriesPoint], step: timedelta) -> list[SeriesPoint]:
+    """The values of the series at each step from its first time to its last time"""
+    if not series:
+        return []
+    points = []
+    index = 0
+    date = series[0].time
+    while date <= series[-1].time:
+        while index + 1 < len(series) and series[index + 1].time <= date:
+            index += 1
+        points.append(SeriesPoint(date, series[index].production, series[index].consumption))
+        date += step
+    return points
+
+
+class Simulation:
+    """Run the coordinator on a series in accelerated time. The devices are simulated: they answer the
+    service calls by updating the states of their entities"""
+
+    def __init__(self, hass: HomeAssistant, coordinator: SolarOptimizerCoordinator, sell_cost: float = 1, buy_cost: float = 1):
+        self._hass = hass
+        self._coordinator = coordinator
+        self._sell_cost = sell_cost
+        self._buy_cost = buy_cost
+
+    @property
+    def devices(self) -> list[ManagedDevice]:
+        """The simulated devices"""
+        return self._coordinator.devices
+
+    def _entity_ids(self) -> dict[str, str | None]:
+        """The central entities written by the simulation"""
+        coordinator = self._coordinator
+        return {
+            "production": coordinator.power_production_entity_id,
+            "consumption": coordinator.power_consumption_entity_id,
+            "sell_cost": coordinator.sell_cost_entity_id,
+            "buy_cost": coordinator.buy_cost_entity_id,
+            "sell_tax_percent": coordinator.sell_tax_percent_entity_id,
+        }
+
+    def _register_services(self):
+        """Register the services called by the devices. They replace the services of Home Assistant (the entities of
+        the devices are not real entities) and update the states of the entities"""
+        services = {
+            (action.domain, action.action)
+            for device in self.devices
+            for action in device.service_actions
+            if action is not None
+        }
+        for domain, action in services:
+            self._hass.services.async_register(domain, action, self._async_on_service_call)
+
+    async def _async_on_service_call(self, call: ServiceCall):
+        """A simulated device answers a service call"""
+        entity_ids = call.data.get("entity_id") or []
+        for entity_id in [entity_ids] if isinstance(entity_ids, str) else entity_ids:
+            for device in self.devices:
+                activation, deactivation, change_power = device.service_actions
+                if (
+                    entity_id == device.power_entity_id
+                    and change_power is not None
+                    and (change_power.domain, change_power.action) == (call.domain, call.service)
+                    and change_power.attribute in call.data
+                ):
+                    value = call.data[change_power.attribute]
+                    if entity_id.startswith(POWERED_ENTITY_DOMAINS_NEED_ATTR):
+                        self._hass.states.async_set(entity_id, STATE_ON, {change_power.attribute: value})
+                    else:
+                        self._hass.states.async_set(entity_id, str(value))
+                elif entity_id == device.entity_id:
+                    if activation is not None and (activation.domain, activation.action) == (call.domain, call.service):
+                        self._hass.states.async_set(entity_id, STATE_ON)
+                    elif deactivation is not None and (deactivation.domain, deactivation.action) == (call.domain, call.service):
+                        self._hass.states.async_set(entity_id, STATE_OFF)
+
+    def _devices_power(self) -> float:
+        """The power consumed by the active devices"""
+        return sum(device.current_power for device in self.devices if device.is_active)
+
+    async def async_run(self, series: list[SeriesPoint], step: timedelta) -> dict[str, Any]:
+        """Simulate the series with one cycle at each step and returns the report"""
+        self._register_services()
+        entity_ids = self._entity_ids()
+        for name, value in (("sell_cost", self._sell_cost), ("buy_cost", self._buy_cost), ("sell_tax_percent", 0)):
+            if entity_ids[name] and self._hass.states.get(entity_ids[name]) is None:
+                self._hass.states.async_set(entity_ids[name], value)
+        for device in self.devices:
+            if self._hass.states.get(device.entity_id) is None:
+                self._hass.states.async_set(device.entity_id, STATE_OFF)
+        await self._hass.async_block_till_done()
+
+        hours = step.total_seconds() / 3600
+        energies = {"production": 0.0, "consumption": 0.0, "self_consumption": 0.0, "imported": 0.0, "exported": 0.0}
+        switches = {device.name: 0 for device in self.devices}
+        on_time_sec = {device.name: 0 for device in self.devices}
+        cpu_ms = []
+        decisions = []
+        raz_time = self._coordinator.raz_time
+        fast_paths_start = self._coordinator.fast_paths
+
+        points = resample(series, step)
+        # the devices are available at the start of the series and not at the real time of their creation
+        for device in self.devices:
+            if points:
+                device.set_available_from(points[0].time)
+
+        for index, point in enumerate(points):
+            for device in self.devices:
+                device._set_now(point.time)  # pylint: disable=protected-access
+            # the on time is accumulated with the clock of the devices, and reset at raz_time
+            self._coordinator.async_update_on_time()
+            if index > 0 and raz_time is not None:
+                last_raz = point.time.replace(hour=raz_time.hour, minute=raz_time.minute, second=0, microsecond=0)
+                if last_raz > point.time:
+                    last_raz -= timedelta(days=1)
+                if points[index - 1].time < last_raz:
+                    self._coordinator.async_reset_on_time()
+
+            was_active = {device.name: device.is_active for device in self.devices}
+            self._hass.states.async_set(entity_ids["production"], point.production)
+            self._hass.states.async_set(entity_ids["consumption"], point.consumption + self._devices_power() - point.production)
+            await self._hass.async_block_till_done()
+
+            start = time.process_time()
+            await self._coordinator.async_refresh()
+            calculated_data = self._coordinator.data if self._coordinator.last_update_success else None
+            await self._hass.async_block_till_done()
+            cpu_ms.append(1000 * (time.process_time() - start))
+
+            for device in self.devices:
+                device.set_current_power_with_device_state()
+                if device.is_active != was_active[device.name]:
+                    switches[device.name] += 1
+                if device.is_active:
+                    on_time_sec[device.name] += step.total_seconds()
+
+            consumption = point.consumption + self._devices_power()
+            energies["production"] += point.production * hours
+            energies["consumption"] += consumption * hours
+            energies["self_consumption"] += min(point.production, consumption) * hours
+            energies["imported"] += max(0, consumption - point.production) * hours
+            energies["exported"] += max(0, point.production - consumption) * hours
+            decisions.append(
+                {
+                    "time": point.time.isoformat(),
+                    "production": point.production,
+                    "consumption": point.consumption,
+                    "devices": {device.name: device.current_power for device in self.devices if device.is_active},
+                    "best_objective": calculated_data.get("best_objective") if calculated_data else None,
+                }
+            )
+
+        values = sorted(cpu_ms)
+        return {
+            "cycles": len(points),
+            "simulated_hours": round(len(points) * hours, 2),
+            **{f"{name}_kwh": round(value / 1000, 3) for name, value in energies.items()},
+            "self_consumption_ratio": round(energies["self_consumption"] / energies["production"], 3) if energies["production"] else None,
+            "switches": switches,
+            "on_time_min": {name: round(value / 60) for name, value in on_time_sec.items()},
+            "fast_paths": {name: count - fast_paths_start[name] for name, count in self._coordinator.fast_paths.items()},
+            "cpu_ms_per_cycle": {
+                "mean": round(sum(values) / len(values), 3) if values else None,
+                "p95": round(CycleStatistics.percentile(values, 0.95), 3) if values else None,
+                "max": round(values[-1], 3) if values else None,
+            },
+            "decisions": decisions,
+        }
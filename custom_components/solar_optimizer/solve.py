@@ -0,0 +1,225 @@
+""" Headless solver of optimization problems given as JSON.
+
+Each problem gives the devices and the grid situation. The solutions are written as NDJSON (one line per
+problem) with their timings. Run it from the root of the repository, Home Assistant does not need to run:
+    python -m custom_components.solar_optimizer.solve problems.ndjson
+    python -m custom_components.solar_optimizer.solve problems.json --mode exact --output solutions.ndjson
+    cat problems.ndjson | python -m custom_components.solar_optimizer.solve -
+
+The input is a JSON array of problems, one problem or NDJSON (one problem per line). A problem is:
+    {
+        "id": "2024-06-01T12:00",
+        "devices": [
+            {"name": "Pool pump", "power_max": 1500, "state": true, "current_power": 1500, "priority": 4},
+            {"name": "Car charger", "power_max": 3680, "power_min": 690, "power_step": 230, "is_usable": true, "is_waiting": false}
+        ],
+        "power_consumption": -800, "power_production": 3000,
+        "sell_cost": 0.06, "buy_cost": 0.25, "sell_tax_percent": 0,
+        "battery_soc": 80, "battery_charge_power": 0, "priority_weight": 0,
+        "seed": 1, "algorithm": {"max_iteration_number": 2000}
+    }
+Only devices, power_consumption, power_production, sell_cost and buy_cost are required. power_consumption is the
+net consumption (negative if power is given back to the grid). "algorithm" overrides the settings of the command line.
+A line or a problem which is not valid gives an error in place of its solution and the other problems are solved.
+Each solution or error gives the position of its problem in the input ("index", from 0) and its "id" (null if none).
+"""
+
+import argparse
+import itertools
+import json
+import sys
+import time
+from collections.abc import Iterable, Iterator
+
+from .core import ALGORITHM_MODES, DeviceSnapshot, GridSnapshot, SimulatedAnnealingAlgorithm, solve
+
+
+def _parse_lines(lines: Iterable[str]) -> Iterator[dict | ValueError]:
+    """Parse NDJSON lines. A line which is not valid JSON gives a ValueError in place of its problem"""
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            content = json.loads(line)
+        except ValueError as err:
+            yield ValueError(f"line {number}: {err}")
+            continue
+        if isinstance(content, list):
+            yield from content
+        else:
+            yield content
+
+
+def read_problems(lines: Iterable[str]) -> Iterator[dict | ValueError]:
+    """Read the problems of a JSON array, of one JSON problem written on several lines or of NDJSON lines.
+    A line which is not valid JSON gives a ValueError in place of its problem"""
+    lines = iter(lines)
+    head = []
+    for line in lines:
+        head.append(line)
+        if line.strip():
+            break
+    if not head or not head[-1].strip():
+        return
+
+    try:
+        json.loads(head[-1])
+    except ValueError:
+        # a JSON array or a JSON problem written on several lines, else NDJSON with an invalid first line
+        text = "".join(head) + "".join(lines)
+        try:
+            content = json.loads(text)
+        except ValueError:
+            yield from _parse_lines(text.splitlines())
+        else:
+            yield from content if isinstance(content, list) else [content]
+        return
+
+    yield from _parse_lines(itertools.chain(head, lines))
+
+
+def device_from_json(device: dict) -> DeviceSnapshot:
+    """The snapshot of a device of a problem. "state" is a synonym of "is_active" """
+    is_active = bool(device.get("is_active", device.get("state", False)))
+    return DeviceSnapshot(
+        name=device["name"],
+        unique_id=device.get("unique_id", device["name"]),
+        power_max=device["power_max"],
+        power_min=device.get("power_min", -1),
+        power_step=device.get("power_step", 0),
+        current_power=device.get("current_power", device["power_max"] if is_active else 0),
+        is_active=is_active,
+        is_usable=bool(device.get("is_usable", True)),
+        is_waiting=bool(device.get("is_waiting", False)),
+        is_enabled=bool(device.get("is_enabled", True)),
+        priority=device.get("priority", 0),
+    )
+
+
+def grid_from_json(problem: dict) -> GridSnapshot:
+    """The grid situation of a problem"""
+    return GridSnapshot(
+        power_consumption=problem["power_consumption"],
+        power_production=problem["power_production"],
+        sell_cost=problem["sell_cost"],
+        buy_cost=problem["buy_cost"],
+        sell_tax_percent=problem.get("sell_tax_percent", 0),
+        battery_soc=problem.get("battery_soc", 0),
+        battery_charge_power=problem.get("battery_charge_power", 0),
+        priority_weight=problem.get("priority_weight", 0),
+    )
+
+
+class Solver:
+    """Solve the problems with the settings of the command line. The algorithms are reused between problems"""
+
+    def __init__(self, settings: dict, seed: int | None = None):
+        self._settings = settings
+        self._seed = seed
+        self._algorithms: dict[tuple, SimulatedAnnealingAlgorithm] = {}
+
+    def algorithm(self, overrides: dict | None) -> SimulatedAnnealingAlgorithm:
+        """The algorithm of the settings overridden by the ones of a problem"""
+        settings = {**self._settings, **(overrides or {})}
+        key = tuple(sorted(settings.items()))
+        if (algo := self._algorithms.get(key)) is None:
+            algo = self._algorithms[key] = SimulatedAnnealingAlgorithm(**settings)
+        return algo
+
+    def solve(self, index: int, problem: dict | ValueError) -> dict:
+        """Solve one problem. Returns the solution or the error as a dict"""
+        problem_id = problem.get("id") if isinstance(problem, dict) else None
+        try:
+            if isinstance(problem, ValueError):
+                raise problem
+            if not isinstance(problem, dict):
+                raise TypeError(f"a problem should be a JSON object, not {type(problem).__name__}")
+            devices = [device_from_json(device) for device in problem["devices"]]
+            grid = grid_from_json(problem)
+            algo = self.algorithm(problem.get("algorithm"))
+            start = time.perf_counter()
+            result = solve(algo, devices, grid, seed=problem.get("seed", self._seed))
+            duration_ms = 1000 * (time.perf_counter() - start)
+        except (AttributeError, KeyError, TypeError, ValueError) as err:
+            return {"index": index, "id": problem_id, "error": f"{type(err).__name__}: {err}"}
+
+        return {
+            "index": index,
+            "id": problem_id,
+            "best_solution": [
+                {"unique_id": eqt["unique_id"], "state": eqt["state"], "requested_power": eqt["requested_power"]}
+                for eqt in result.best_solution
+            ],
+            "best_objective": result.best_objective,
+            "total_power": result.total_power,
+            "iterations": result.iterations,
+            "fast_path": result.fast_path,
+            "solve_ms": round(duration_ms, 3),
+        }
+
+
+def parse_args(argv=None):
+    """Parse the command line"""
+    parser = argparse.ArgumentParser(description="Solve Solar Optimizer problems given as JSON and write the solutions as NDJSON")
+    parser.add_argument("file", help="the JSON or NDJSON file of the problems, - for the standard input")
+    parser.add_argument("--output", help="the NDJSON file of the solutions (the standard output by default)")
+    parser.add_argument("--initial-temp", type=float, default=1000)
+    parser.add_argument("--min-temp", type=float, default=0.05)
+    parser.add_argument("--cooling-factor", type=float, default=0.95)
+    parser.add_argument("--max-iteration-number", type=int, default=1000)
+    parser.add_argument("--max-duration-sec", type=float, default=5)
+    parser.add_argument("--mode", choices=ALGORITHM_MODES, default=ALGORITHM_MODES[0])
+    parser.add_argument("--exact-max-devices", type=int, default=20)
+    parser.add_argument("--chains", type=int, default=1)
+    parser.add_argument("--adaptive-schedule", action="store_true")
+    parser.add_argument("--no-fast-paths", dest="fast_paths", action="store_false", help="always search the solution")
+    parser.add_argument("--seed", type=int, help="the seed of the problems which do not give one")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    """Solve the problems and print a summary on the standard error. The exit code is 1 if a problem has failed"""
+    args = parse_args(argv)
+    solver = Solver(
+        {
+            "initial_temp": args.initial_temp,
+            "min_temp": args.min_temp,
+            "cooling_factor": args.cooling_factor,
+            "max_iteration_number": args.max_iteration_number,
+            "max_duration_sec": args.max_duration_sec,
+            "mode": args.mode,
+            "exact_max_devices": args.exact_max_devices,
+            "chains": args.chains,
+            "adaptive_schedule": args.adaptive_schedule,
+            "fast_paths": args.fast_paths,
+        },
+        args.seed,
+    )
+
+    input_file = sys.stdin if args.file == "-" else open(args.file, encoding="utf-8")  # pylint: disable=consider-using-with
+    output_file = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout  # pylint: disable=consider-using-with
+    nb_problems = nb_errors = nb_fast_paths = 0
+    start = time.perf_counter()
+    try:
+        for index, problem in enumerate(read_problems(input_file)):
+            solution = solver.solve(index, problem)
+            nb_problems += 1
+            nb_errors += "error" in solution
+            nb_fast_paths += solution.get("fast_path") is not None
+            output_file.write(json.dumps(solution) + "\n")
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
+
+    duration = time.perf_counter() - start
+    print(
+        f"{nb_problems} problems solved in {duration:.3f} sec ({nb_problems / duration if duration > 0 else 0:.1f} problems/sec), {nb_fast_paths} without search, {nb_errors} errors",
+        file=sys.stderr,
+    )
+    return 1 if nb_errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,6 +7,7 @@ from typing import Any
 from homeassistant.const import STATE_UNAVAILABLE, STATE_UNKNOWN, STATE_ON
 from homeassistant.core import callback, HomeAssistant, State, Event
 from homeassistant.config_entries import ConfigEntry
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
 from homeassistant.helpers.update_coordinator import CoordinatorEntity
 from homeassistant.helpers.restore_state import RestoreEntity
 from homeassistant.components.switch import SwitchEntity, DOMAIN as SWITCH_DOMAIN
@@ -132,33 +133,27 @@ class ManagedDeviceSwitch(CoordinatorEntity, SwitchEntity, RestoreEntity):
 
         # desarme le timer lors de la destruction de l'entité
         self.async_on_remove(
-            self._hass.bus.async_listen(
-                event_type=EVENT_TYPE_SOLAR_OPTIMIZER_ENABLE_STATE_CHANGE,
-                listener=self._on_enable_state_change,
+            async_dispatcher_connect(
+                self._hass,
+                SIGNAL_ENABLE_STATE_CHANGE.format(self.idx),
+                self._on_enable_state_change,
             )
         )
 
         self.update_custom_attributes(self._device)
 
     @callback
-    async def _on_enable_state_change(self, event: Event) -> None:
+    def _on_enable_state_change(self, is_enabled: bool) -> None:
         """Triggered when the ManagedDevice enable state have change"""
 
-        # is it for me ?
-        if (
-            not event.data
-            or (device_id := event.data.get("device_unique_id")) != self.idx
-        ):
-            return
-
         # search for coordinator and device
         if not self.coordinator or not (
-            device := self.coordinator.get_device_by_unique_id(device_id)
+            device := self.coordinator.get_device_by_unique_id(self.idx)
         ):
             return
 
         _LOGGER.info(
-            "Changing enabled state for %s to %s", device_id, device.is_enabled
+            "Changing enabled state for %s to %s", self.idx, is_enabled
         )
 
         self.update_custom_attributes(device)
@@ -257,7 +252,8 @@ class ManagedDeviceSwitch(CoordinatorEntity, SwitchEntity, RestoreEntity):
             return
 
         if not self._attr_is_on:
-            await device.activate()
+            if not await self.coordinator.async_run_device_action(device, device.activate):
+                return
             self._attr_is_on = True
             self.update_custom_attributes(device)
             self.async_write_ha_state()
@@ -288,7 +284,8 @@ class ManagedDeviceSwitch(CoordinatorEntity, SwitchEntity, RestoreEntity):
                     device.name,
                 )
                 device.set_forced_end_time(None)
-            await device.deactivate()
+            if not await self.coordinator.async_run_device_action(device, device.deactivate):
+                return
             self._attr_is_on = False
             self.update_custom_attributes(device)
             self.async_write_ha_state()
@@ -361,22 +358,16 @@ class ManagedDeviceEnable(SwitchEntity, RestoreEntity):
 
         # Écoute les changements d'état enable émis par set_enable() (ex: start_forced)
         self.async_on_remove(
-            self._hass.bus.async_listen(
-                event_type=EVENT_TYPE_SOLAR_OPTIMIZER_ENABLE_STATE_CHANGE,
-                listener=self._on_enable_state_change,
+            async_dispatcher_connect(
+                self._hass,
+                SIGNAL_ENABLE_STATE_CHANGE.format(self._device.unique_id),
+                self._on_enable_state_change,
             )
         )
 
     @callback
-    async def _on_enable_state_change(self, event: Event) -> None:
+    def _on_enable_state_change(self, new_is_enabled: bool) -> None:
         """Synchronise l'état du bouton Enable quand set_enable() est appelé en dehors du bouton."""
-        if not event.data:
-            return
-        device_unique_id = event.data.get("device_unique_id")
-        if device_unique_id != name_to_unique_id(self._device.name):
-            return
-
-        new_is_enabled: bool = event.data.get("is_enabled", True)
         if self._attr_is_on == new_is_enabled:
             return
 
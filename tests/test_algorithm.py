@@ -0,0 +1,359 @@
+""" Unit tests of the SimulatedAnnealingAlgorithm"""
+import math
+import random
+import time
+from unittest.mock import MagicMock
+
+from .commons import *  # pylint: disable=wildcard-import, unused-wildcard-import
+from custom_components.solar_optimizer.core import SimulatedAnnealingAlgorithm
+
+
+def create_fake_device(name, power_max, power_min=-1, power_step=0, is_active=False, current_power=0, is_usable=True, is_waiting=False, priority=0):
+    """Creates a lightweight stand-in for a ManagedDevice"""
+    device = MagicMock(
+        spec=ManagedDevice,
+        is_enabled=True,
+        is_active=is_active,
+        is_usable=is_usable,
+        is_waiting=is_waiting,
+        power_max=power_max,
+        power_min=power_min,
+        power_step=power_step,
+        can_change_power=power_min >= 0,
+        current_power=current_power,
+        priority=priority,
+        unique_id=name_to_unique_id(name),
+    )
+    # name is a reserved keyword of MagicMock. It should be set after the creation
+    device.name = name
+    return device
+
+
+async def test_recuit_simule_on_off_devices(hass: HomeAssistant):
+    """The algorithm should find the combination of on/off devices which uses exactly the surplus"""
+    devices = [
+        create_fake_device("A", 1000),
+        create_fake_device("B", 500),
+        create_fake_device("C", 2000),
+    ]
+    algo = SimulatedAnnealingAlgorithm(1000, 0.1, 0.99, 1000)
+
+    best_solution, best_objective, total_power = algo.recuit_simule(devices, -1500, 2000, 1, 1, 0, 0, 0)
+
+    assert [eqt["name"] for eqt in best_solution] == ["A", "B", "C"]
+    assert [eqt["state"] for eqt in best_solution] == [True, True, False]
+    assert [eqt["requested_power"] for eqt in best_solution] == [1000, 500, 0]
+    assert best_objective == 0
+    assert total_power == 1500
+
+
+async def test_recuit_simule_power_device(hass: HomeAssistant):
+    """The algorithm should find the power which uses exactly the surplus and keep the solution dicts independent"""
+    devices = [create_fake_device("Power", 2000, power_min=100, power_step=100)]
+    algo = SimulatedAnnealingAlgorithm(1000, 0.1, 0.99, 1000)
+
+    best_solution, best_objective, total_power = algo.recuit_simule(devices, -700, 2000, 1, 1, 0, 0, 0)
+
+    assert best_solution[0]["state"] is True
+    assert best_solution[0]["requested_power"] == 700
+    assert best_solution[0]["current_power"] == 0
+    assert best_objective == 0
+    assert total_power == 700
+
+    # the returned solution is a copy which could be modified by the caller
+    best_solution[0]["requested_power"] = 0
+    second_solution, _, _ = algo.recuit_simule(devices, -700, 2000, 1, 1, 0, 0, 0)
+    assert second_solution[0]["requested_power"] == 700
+
+
+async def test_running_totals_are_consistent(hass: HomeAssistant):
+    """The running totals updated at each permutation should be equal to the totals calculated from scratch"""
+    devices = [
+        create_fake_device("A", 1000, priority=1),
+        create_fake_device("B", 500, is_active=True, current_power=500, priority=4),
+        create_fake_device("Power", 2000, power_min=100, power_step=100, is_active=True, current_power=300, priority=16),
+    ]
+    algo = SimulatedAnnealingAlgorithm(1000, 0.1, 0.99, 1000)
+    algo.recuit_simule(devices, -1500, 2000, 1, 1, 0, 0, 50)
+
+    solution = algo.generer_solution_initiale(algo._equipements)  # pylint: disable=protected-access
+    for i in range(200):
+        undo = algo.permuter_equipement(solution)
+        if i % 3 == 0:
+            algo.annuler_permutation(solution, undo)
+
+        assert solution.puissance_totale == algo.consommation_equipements(solution)
+        assert solution.somme_priorites == sum(
+            eqt["priority"] * solution.requested_powers[idx] for idx, eqt in enumerate(algo._equipements) if solution.states[idx]  # pylint: disable=protected-access
+        )
+
+
+async def test_time_budget(hass: HomeAssistant):
+    """When the time budget is exhausted, the best solution found so far (here the initial one) is returned"""
+    devices = [create_fake_device("A", 1000)]
+    algo = SimulatedAnnealingAlgorithm(1000, 0.1, 0.99, 1000, max_duration_sec=0, fast_paths=False)
+
+    best_solution, _, total_power = algo.recuit_simule(devices, -1500, 2000, 1, 1, 0, 0, 0)
+
+    assert best_solution[0]["state"] is False
+    assert total_power == 0
+
+
+async def test_exact_mode(hass: HomeAssistant):
+    """The exact mode should find the optimal solution in a deterministic way"""
+    devices = [
+        create_fake_device("A", 1000, priority=1),
+        create_fake_device("B", 700, priority=2),
+        create_fake_device("C", 300, is_active=True, current_power=300, priority=4),
+        create_fake_device("Power", 2000, power_min=100, power_step=150, priority=8),
+    ]
+    algo = SimulatedAnnealingAlgorithm(1000, 0.1, 0.99, 1000, mode=ALGORITHM_MODE_EXACT)
+
+    # 2250 W could be consumed: A + B + C + Power at 250 W or A + B + Power at 550 W.
+    # With the same total power, the lowest sum of priority * power is kept
+    best_solution, best_objective, total_power = algo.recuit_simule(devices, -1950, 3000, 1, 1, 0, 0, 0)
+    assert [eqt["state"] for eqt in best_solution] == [True, True, True, True]
+    assert [eqt["requested_power"] for eqt in best_solution] == [1000, 700, 300, 250]
+    assert best_objective == 0
+    assert total_power == 2250
+
+    # The result is deterministic
+    same_solution, _, _ = algo.recuit_simule(devices, -1950, 3000, 1, 1, 0, 0, 0)
+    assert same_solution == best_solution
+
+    # 2350 W cannot be reached exactly. 2300 W (50 W rejected) and 2400 W (50 W imported) have the same cost.
+    # The one which changes the less the total power is preferred
+    _, best_objective, total_power = algo.recuit_simule(devices, -2050, 3000, 1, 1, 0, 0, 0)
+    assert total_power == 2300
+    assert best_objective == 25
+
+
+async def test_exact_mode_fallback(hass: HomeAssistant):
+    """Above exact_max_devices the simulated annealing is used"""
+    devices = [create_fake_device(f"D{i}", 100) for i in range(5)]
+    algo = SimulatedAnnealingAlgorithm(1000, 0.1, 0.99, 1000, mode=ALGORITHM_MODE_EXACT, exact_max_devices=4)
+
+    with patch.object(algo, "executer_recuit", wraps=algo.executer_recuit) as mock_recuit:
+        _, _, total_power = algo.recuit_simule(devices, -300, 500, 1, 1, 0, 0, 0)
+        assert mock_recuit.call_count == 1
+    assert total_power == 300
+
+    algo = SimulatedAnnealingAlgorithm(1000, 0.1, 0.99, 1000, mode=ALGORITHM_MODE_EXACT, exact_max_devices=5)
+    with patch.object(algo, "executer_recuit") as mock_recuit:
+        _, _, total_power = algo.recuit_simule(devices, -300, 500, 1, 1, 0, 0, 0)
+        assert mock_recuit.call_count == 0
+    assert total_power == 300
+
+
+async def test_exact_mode_large_step_space(hass: HomeAssistant):
+    """With many power steps, the exact algorithm gives up before evaluating too many combinations or exceeding
+    its time budget, and the simulated annealing is used"""
+    devices = [create_fake_device(f"P{i}", 2000, power_min=1, power_step=1) for i in range(6)]
+    algo = SimulatedAnnealingAlgorithm(1000, 0.1, 0.99, 1000, max_duration_sec=1, mode=ALGORITHM_MODE_EXACT, fast_paths=False)
+
+    start = time.monotonic()
+    with patch.object(algo, "executer_recuit", wraps=algo.executer_recuit) as mock_recuit:
+        _, _, total_power = algo.recuit_simule(devices, -3000, 5000, 1, 1, 0, 0, 0)
+        assert mock_recuit.call_count == 1
+    assert time.monotonic() - start < 2
+    assert total_power > 0
+
+    # The time budget is checked inside the evaluation of an equipment
+    with patch("custom_components.solar_optimizer.core.simulated_annealing_algo.MAX_EXACT_TRANSITIONS", 10**9), \
+         patch.object(algo, "executer_recuit", wraps=algo.executer_recuit) as mock_recuit:
+        start = time.monotonic()
+        algo.recuit_simule(devices, -3000, 5000, 1, 1, 0, 0, 0)
+        assert mock_recuit.call_count == 1
+    assert time.monotonic() - start < 2
+
+
+async def test_multiple_chains(hass: HomeAssistant):
+    """With several chains, the best solution of all the chains is returned"""
+    devices = [create_fake_device(f"D{i}", 100 * (i + 1)) for i in range(8)]
+    devices.append(create_fake_device("Power", 2000, power_min=100, power_step=100))
+    algo = SimulatedAnnealingAlgorithm(1000, 0.1, 0.99, 1000, chains=4)
+
+    with patch.object(algo, "permuter_equipement", wraps=algo.permuter_equipement) as mock_permuter:
+        best_solution, best_objective, total_power = algo.recuit_simule(devices, -3000, 5000, 1, 1, 0, 0, 0)
+        # each iteration moves the 4 chains
+        assert mock_permuter.call_count % 4 == 0
+
+    assert best_objective == 0
+    assert total_power == 3000
+    assert sum(eqt["requested_power"] for eqt in best_solution if eqt["state"]) == 3000
+
+
+async def test_warm_start(hass: HomeAssistant):
+    """The annealing starts from the previous best solution and the number of iterations is reduced if nothing has changed"""
+    devices = [
+        create_fake_device("A", 1000),
+        create_fake_device("B", 500, is_waiting=True),
+        create_fake_device("Power", 2000, power_min=100, power_step=100),
+    ]
+    algo = SimulatedAnnealingAlgorithm(1000, 0.1, 0.99, 1000)
+    equipements = algo.preparer_equipements(devices, 0)
+    solution_precedente = {
+        "a": {"state": True, "requested_power": 1000, "is_usable": True, "is_waiting": False},
+        # B is waiting. It cannot be switched on
+        "b": {"state": True, "requested_power": 500, "is_usable": True, "is_waiting": False},
+        "power": {"state": True, "requested_power": 600, "is_usable": True, "is_waiting": False},
+    }
+
+    departs = []
+    executer_recuit = algo.executer_recuit
+
+    def copy_and_execute(solution):
+        departs.append(solution.copy())
+        return executer_recuit(solution)
+
+    with patch.object(algo, "executer_recuit", side_effect=copy_and_execute):
+        best_solution, _, total_power = algo.optimiser(equipements, -1600, 2000, 1, 1, 0, 0, solution_precedente, 0)
+
+    depart = departs[0]
+    assert depart.states == [True, False, True]
+    assert depart.requested_powers == [1000, 0, 600]
+    assert best_solution[1]["state"] is False
+    assert total_power == 1600
+    # The constraints of B have changed. All iterations are done
+    assert algo._nombre_iterations_run == 1000  # pylint: disable=protected-access
+
+    solution_precedente["b"]["is_waiting"] = True
+    algo.optimiser(equipements, -1600, 2000, 1, 1, 0, 0, solution_precedente, 0)
+    assert algo._nombre_iterations_run == 100  # pylint: disable=protected-access
+    algo.optimiser(equipements, -1600, 2000, 1, 1, 0, 0, solution_precedente, 1750)
+    assert algo._nombre_iterations_run == 500  # pylint: disable=protected-access
+
+
+async def test_new_power_draw(hass: HomeAssistant):
+    """The new power is drawn like a random choice among all the power steps between the lowest reachable power and power_max"""
+
+    def choices(current_power, power_step, power_min, power_max, can_switch_off):
+        """All the possible steps, listed like the move table does"""
+        power_min_to_use = max(0, power_min - power_step) if can_switch_off else max(power_min, power_step)
+        downs = list(range(-1, -math.ceil((current_power - power_min_to_use) / power_step) - 1, -1)) if current_power > power_min_to_use else []
+        ups = list(range(1, math.ceil((power_max - current_power) / power_step) + 1)) if current_power < power_max else []
+        return downs + ups
+
+    devices = [create_fake_device("Charger", 11000, power_min=230, power_step=230)]
+    algo = SimulatedAnnealingAlgorithm(1000, 0.1, 0.99, 1000)
+    algo.recuit_simule(devices, 0, 0, 1, 1, 0, 0, 0)
+
+    for current_power, can_switch_off in ((230, True), (230, False), (4600, True), (10810, False), (11040, True)):
+        steps = choices(current_power, 230, 230, 11000, can_switch_off)
+        random.seed(42)
+        expected = [current_power + random.choice(steps) * 230 for _ in range(50)]
+        algo._random.seed(42)  # pylint: disable=protected-access
+        assert [algo.calculer_new_power(0, current_power, can_switch_off) for _ in range(50)] == expected
+
+
+async def test_adaptive_schedule(hass: HomeAssistant):
+    """With the adaptive schedule, the number of iterations depends on the number of usable devices, the initial
+    temperature is calibrated and the annealing stops when the best solution is not improved anymore"""
+    devices = [create_fake_device(f"D{i}", 100 * (i % 7 + 1), priority=i % 5) for i in range(12)]
+    devices.append(create_fake_device("Unusable", 1000, is_usable=False))
+    algo = SimulatedAnnealingAlgorithm(1000, 0.1, 0.99, 10000, adaptive_schedule=True, iterations_per_device=20, max_iterations_without_improvement=0, seed=1, fast_paths=False)
+
+    algo.recuit_simule(devices, 500, 3000, 1, 1, 0, 0, 50)
+    # 12 usable devices
+    assert algo._nombre_iterations_run == 240  # pylint: disable=protected-access
+    assert algo._temperature_initiale_run != 1000  # pylint: disable=protected-access
+    # the minimal temperature is reached at the last iteration
+    assert algo.facteur_refroidissement_run() ** 240 * algo._temperature_initiale_run == pytest.approx(0.1)  # pylint: disable=protected-access
+    assert algo.nombre_iterations_effectuees == 240
+
+    # A few devices gives the minimal number of iterations
+    algo.recuit_simule(devices[:2], 500, 3000, 1, 1, 0, 0, 50)
+    assert algo._nombre_iterations_run == 50  # pylint: disable=protected-access
+
+    # Without improvement during 30 iterations, the annealing is stopped
+    algo = SimulatedAnnealingAlgorithm(1000, 0.1, 0.99, 10000, adaptive_schedule=True, iterations_per_device=20, max_iterations_without_improvement=30, seed=1, fast_paths=False)
+    algo.recuit_simule(devices, 500, 3000, 1, 1, 0, 0, 50)
+    assert algo.nombre_iterations_effectuees < 240
+
+    # Not adaptive: the configured schedule is used
+    algo = SimulatedAnnealingAlgorithm(1000, 0.1, 0.99, 10000, iterations_per_device=20, seed=1)
+    algo.recuit_simule(devices, 500, 3000, 1, 1, 0, 0, 50)
+    assert algo._nombre_iterations_run == 10000  # pylint: disable=protected-access
+    assert algo._temperature_initiale_run == 1000  # pylint: disable=protected-access
+    assert algo.facteur_refroidissement_run() == 0.99
+
+
+async def test_fast_paths(hass: HomeAssistant):
+    """The trivial situations are solved without search and each fast path is counted"""
+    devices = [
+        create_fake_device("A", 1000, is_active=True, current_power=1000),
+        create_fake_device("B", 500),
+        create_fake_device("Power", 2000, power_min=300, power_step=100),
+        create_fake_device("Unusable", 700, is_usable=False),
+    ]
+    algo = SimulatedAnnealingAlgorithm(1000, 0.1, 0.99, 1000)
+
+    with patch.object(algo, "executer_recuit") as mock_recuit:
+        # At night, everything is switched off
+        best_solution, best_objective, total_power = algo.recuit_simule(devices, 1500, 0, 1, 1, 0, 0, 0)
+        assert algo.chemin_rapide == FAST_PATH_NO_SURPLUS
+        assert [eqt["state"] for eqt in best_solution] == [False, False, False, False]
+        assert total_power == 0
+        assert best_objective == 250
+
+        # A surplus above the power of all the devices: everything is switched on at its max power
+        best_solution, _, total_power = algo.recuit_simule(devices, -3000, 5000, 1, 1, 0, 0, 0)
+        assert algo.chemin_rapide == FAST_PATH_SURPLUS_ABOVE_MAX_POWER
+        assert [eqt["requested_power"] for eqt in best_solution if eqt["state"]] == [1000, 500, 2000]
+        assert total_power == 3500
+
+        # A surplus of 200 W once A is switched off: 300 W (100 W imported) is better than nothing (200 W rejected)
+        best_solution, best_objective, total_power = algo.recuit_simule(devices, 800, 2000, 1, 1, 0, 0, 0)
+        assert algo.chemin_rapide == FAST_PATH_SURPLUS_BELOW_MIN_POWER
+        assert [eqt["unique_id"] for eqt in best_solution if eqt["state"]] == ["power"]
+        assert total_power == 300
+        assert best_objective == 50
+
+        # Only unusable devices
+        _, _, total_power = algo.recuit_simule(devices[3:], -1000, 2000, 1, 1, 0, 0, 0)
+        assert algo.chemin_rapide == FAST_PATH_NO_USABLE_DEVICES
+        assert total_power == 0
+
+        assert mock_recuit.call_count == 0
+
+    # A surplus between the powers of the devices needs a search
+    algo.recuit_simule(devices, -100, 2000, 1, 1, 0, 0, 0)
+    assert algo.chemin_rapide is None
+    assert algo.nombre_iterations_effectuees > 0
+    assert algo.compteurs_chemins_rapides == {
+        FAST_PATH_NO_USABLE_DEVICES: 1,
+        FAST_PATH_NO_SURPLUS: 1,
+        FAST_PATH_SURPLUS_ABOVE_MAX_POWER: 1,
+        FAST_PATH_SURPLUS_BELOW_MIN_POWER: 1,
+    }
+
+    # With a priority weight, only a situation without surplus nor power is trivial
+    algo.recuit_simule(devices, -3000, 5000, 1, 1, 0, 0, 50)
+    assert algo.chemin_rapide is None
+    algo.recuit_simule(devices, 1500, 0, 1, 1, 0, 0, 50)
+    assert algo.chemin_rapide == FAST_PATH_NO_SURPLUS
+
+
+async def test_fast_paths_are_optimal(hass: HomeAssistant):
+    """When a fast path is used, its solution is as good as the one of the exact algorithm"""
+    rng = random.Random(1)
+    exact = SimulatedAnnealingAlgorithm(1000, 0.1, 0.99, 1000, mode=ALGORITHM_MODE_EXACT, fast_paths=False)
+    algo = SimulatedAnnealingAlgorithm(1000, 0.1, 0.99, 1000)
+    for _ in range(200):
+        devices = []
+        for i in range(rng.randrange(1, 5)):
+            is_active = rng.random() < 0.3
+            if rng.random() < 0.5:
+                power_max = rng.randrange(2, 20) * 100
+                devices.append(create_fake_device(f"D{i}", power_max, is_active=is_active, current_power=power_max if is_active else 0))
+            else:
+                devices.append(create_fake_device(f"P{i}", 2000, 500, 100, is_active=is_active, current_power=1000 if is_active else 0))
+        power_consumption = rng.randrange(-4000, 2000)
+        sell_cost = rng.choice((0.05, 0.1, 0.2))
+
+        _, best_objective, _ = algo.recuit_simule(devices, power_consumption, 4000, sell_cost, 0.2, 0, 0, 0)
+        if algo.chemin_rapide is not None:
+            _, exact_objective, _ = exact.recuit_simule(devices, power_consumption, 4000, sell_cost, 0.2, 0, 0, 0)
+            assert best_objective == pytest.approx(exact_objective)
+
+    assert sum(algo.compteurs_chemins_rapides.values()) > 0
@@ -0,0 +1,31 @@
+""" Test the benchmark of the algorithm """
+import json
+
+from benchmarks.benchmark_algorithm import main, compare, parse_args, run_case
+
+
+async def test_benchmark_baseline(hass, tmp_path):
+    """The benchmark runs on a small fleet, saves a baseline and finds no regression against itself"""
+    baseline_file = tmp_path / "baseline.json"
+    args = ["--devices", "5", "--iterations", "200", "--repeat", "1", "--save", str(baseline_file)]
+    assert main(args) == 0
+
+    baseline = json.loads(baseline_file.read_text(encoding="utf-8"))
+    result = baseline["results"][0]
+    assert result["devices"] == 5
+    assert result["iterations_per_sec"] > 0
+    assert result["reference_objective"] is not None
+    assert result["gap"] >= 0
+
+    # A slower run is a regression
+    slower = dict(result, iterations_per_sec=result["iterations_per_sec"] // 2)
+    assert len(compare([slower], baseline, 0.2, 10)) == 1
+    assert compare([result], baseline, 0.2, 10) == []
+
+
+def test_benchmark_seed():
+    """Two runs with the same seed give the same objective so that they could be compared"""
+    args = parse_args(["--seed", "3", "--repeat", "2"])
+    first = run_case(30, 0.3, 100, 300, args)
+    second = run_case(30, 0.3, 100, 300, args)
+    assert first["objective"] == second["objective"]
@@ -0,0 +1,456 @@
+""" Unit tests of the SolarOptimizerCoordinator"""
+import json
+from datetime import timedelta
+from unittest.mock import patch
+
+from homeassistant.components.sensor import DOMAIN as SENSOR_DOMAIN
+from homeassistant.components.switch import DOMAIN as SWITCH_DOMAIN
+from homeassistant.core import ServiceCall
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.util import dt as dt_util
+from pytest_homeassistant_custom_component.common import async_fire_time_changed
+
+from .commons import *  # pylint: disable=wildcard-import, unused-wildcard-import
+from custom_components.solar_optimizer.coordinator import OptimizationCache, CycleStatistics, InputSnapshot
+from custom_components.solar_optimizer.replay import replay_cycle, main as replay_main
+
+
+async def create_test_device(hass: HomeAssistant, name: str, power_max: int = 1000) -> ManagedDevice:
+    """Creates an on/off device which is always usable"""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        title=name,
+        unique_id=name_to_unique_id(name) + "UniqueId",
+        data={
+            CONF_NAME: name,
+            CONF_DEVICE_TYPE: CONF_DEVICE,
+            CONF_ENTITY_ID: "input_boolean.fake_" + name_to_unique_id(name),
+            CONF_POWER_MAX: power_max,
+            CONF_CHECK_USABLE_TEMPLATE: "{{ True }}",
+            CONF_DURATION_MIN: 0.3,
+            CONF_DURATION_STOP_MIN: 0.1,
+            CONF_ACTION_MODE: CONF_ACTION_MODE_ACTION,
+            CONF_ACTIVATION_SERVICE: "input_boolean/turn_on",
+            CONF_DEACTIVATION_SERVICE: "input_boolean/turn_off",
+            CONF_BATTERY_SOC_THRESHOLD: 0,
+            CONF_MAX_ON_TIME_PER_DAY_MIN: 0,
+        },
+    )
+    return await create_managed_device(hass, entry, name_to_unique_id(name))
+
+
+def create_side_effects(consumption: float, production: float) -> SideEffects:
+    """Creates the states of the central configuration entities"""
+    return SideEffects(
+        {
+            "sensor.fake_power_consumption": State("sensor.fake_power_consumption", consumption),
+            "sensor.fake_power_production": State("sensor.fake_power_production", production),
+            "sensor.fake_battery_charge_power": State("sensor.fake_battery_charge_power", 0),
+            "input_number.fake_sell_cost": State("input_number.fake_sell_cost", 1),
+            "input_number.fake_buy_cost": State("input_number.fake_buy_cost", 1),
+            "input_number.fake_sell_tax_percent": State("input_number.fake_sell_tax_percent", 0),
+            "sensor.fake_battery_soc": State("sensor.fake_battery_soc", 50),
+        },
+        State("unknown.entity_id", "unknown"),
+    )
+
+
+async def test_optimization_cache(hass: HomeAssistant, init_solar_optimizer_central_config):
+    """The optimization is not run again when the situation is the same as a recent calculation"""
+    await create_test_device(hass, "Equipement A")
+    coordinator: SolarOptimizerCoordinator = SolarOptimizerCoordinator.get_coordinator()
+    algo = coordinator._algo  # pylint: disable=protected-access
+
+    side_effects = create_side_effects(500, 0)
+    # fmt:off
+    with patch("homeassistant.core.StateMachine.get", side_effect=side_effects.get_side_effects()), \
+         patch.object(algo, "optimiser", wraps=algo.optimiser) as mock_optimiser:
+    # fmt:on
+        first = await coordinator._async_update_data()
+        assert mock_optimiser.call_count == 1
+        assert coordinator.cache_misses == 1
+        assert coordinator.cache_hits == 0
+
+        # Same situation, the result is reused
+        second = await coordinator._async_update_data()
+        assert mock_optimiser.call_count == 1
+        assert coordinator.cache_hits == 1
+        assert second["best_solution"] == first["best_solution"]
+        assert second["total_power"] == first["total_power"]
+
+        # A small variation is in the same power bucket
+        side_effects.add_or_update_side_effect("sensor.fake_power_consumption", State("sensor.fake_power_consumption", 510))
+        await coordinator._async_update_data()
+        assert mock_optimiser.call_count == 1
+        assert coordinator.cache_hits == 2
+
+        # A greater variation needs a new calculation
+        side_effects.add_or_update_side_effect("sensor.fake_power_consumption", State("sensor.fake_power_consumption", 700))
+        await coordinator._async_update_data()
+        assert mock_optimiser.call_count == 2
+        assert coordinator.cache_misses == 2
+
+
+async def test_optimization_cache_lru_and_ttl(hass: HomeAssistant):
+    """The cache is bounded in size and the entries expire"""
+    cache = OptimizationCache(2, 60)
+    cache.put(("a",), 1, 0)
+    cache.put(("b",), 2, 0)
+    # a is now the most recently used
+    assert cache.get(("a",), 10) == 1
+    cache.put(("c",), 3, 10)
+    assert cache.get(("b",), 10) is None
+    assert cache.get(("a",), 10) == 1
+    assert cache.get(("c",), 10) == 3
+
+    # a is too old
+    assert cache.get(("a",), 61) is None
+    assert cache.get(("c",), 61) == 3
+    assert cache.hits == 4
+    assert cache.misses == 2
+
+    disabled = OptimizationCache(0, 60)
+    assert disabled.is_enabled is False
+
+
+async def test_events_are_coalesced(hass: HomeAssistant, init_solar_optimizer_central_config):
+    """A burst of consumption events gives one immediate refresh and one refresh at the end of the minimal interval"""
+    coordinator: SolarOptimizerCoordinator = SolarOptimizerCoordinator.get_coordinator()
+    coordinator._event_debouncer.cooldown = 10  # pylint: disable=protected-access
+    event = MagicMock(data={"entity_id": "sensor.fake_power_consumption"})
+
+    side_effects = create_side_effects(500, 0)
+    # fmt:off
+    with patch("homeassistant.core.StateMachine.get", side_effect=side_effects.get_side_effects()), \
+         patch.object(coordinator, "async_refresh") as mock_refresh:
+    # fmt:on
+        await coordinator._async_on_change(event)  # pylint: disable=protected-access
+        assert mock_refresh.call_count == 1
+        coordinator._last_refresh_powers = {"sensor.fake_power_consumption": 500}  # pylint: disable=protected-access
+
+        # not significant
+        side_effects.add_or_update_side_effect("sensor.fake_power_consumption", State("sensor.fake_power_consumption", 520))
+        await coordinator._async_on_change(event)  # pylint: disable=protected-access
+
+        # significant but during the minimal interval
+        for power in (600, 700, 800):
+            side_effects.add_or_update_side_effect("sensor.fake_power_consumption", State("sensor.fake_power_consumption", power))
+            await coordinator._async_on_change(event)  # pylint: disable=protected-access
+        assert mock_refresh.call_count == 1
+
+        # the trailing refresh
+        async_fire_time_changed(hass, dt_util.utcnow() + timedelta(seconds=11))
+        await hass.async_block_till_done()
+        assert mock_refresh.call_count == 2
+
+    assert coordinator.events_received == 5
+    assert coordinator.events_executed == 2
+    assert coordinator.events_coalesced == 3
+    coordinator._event_debouncer.async_cancel()  # pylint: disable=protected-access
+
+
+async def test_concurrent_actuation(hass: HomeAssistant, init_solar_optimizer_central_config):
+    """The deactivations are done before the activations and the errors are given by device"""
+    device_a = await create_test_device(hass, "Equipement A", 1000)
+    device_b = await create_test_device(hass, "Equipement B", 500)
+    coordinator: SolarOptimizerCoordinator = SolarOptimizerCoordinator.get_coordinator()
+    coordinator._smooth_production = False  # pylint: disable=protected-access
+
+    # A is on and 500 W are imported. Without A there is 500 W of surplus which is exactly the power of B
+    side_effects = create_side_effects(500, 2000)
+    side_effects.add_or_update_side_effect("input_boolean.fake_equipement_a", State("input_boolean.fake_equipement_a", STATE_ON))
+    # the result of the check_active template is tracked from the state machine
+    hass.states.async_set("input_boolean.fake_equipement_a", STATE_ON)
+    await hass.async_block_till_done()
+
+    calls = []
+
+    async def record_action(hass, entity_id, action_type, *args):
+        calls.append((entity_id, action_type))
+
+    # fmt:off
+    with patch("homeassistant.core.StateMachine.get", side_effect=side_effects.get_side_effects()), \
+         patch("custom_components.solar_optimizer.managed_device.do_service_action", side_effect=record_action):
+    # fmt:on
+        calculated_data = await coordinator._async_update_data()
+
+    assert [eqt["state"] for eqt in calculated_data["best_solution"]] == [False, True]
+    assert calls == [("input_boolean.fake_equipement_a", "Deactivate"), ("input_boolean.fake_equipement_b", "Activate")]
+    assert calculated_data["actuation_errors"] == {}
+
+    async def fail_or_wait(hass, entity_id, action_type, *args):
+        if entity_id == "input_boolean.fake_equipement_a":
+            raise HomeAssistantError("Cloud not reachable")
+        await asyncio.sleep(1)
+
+    # the states have not changed. Some minutes later the same actions are done
+    now = dt_util.now() + timedelta(minutes=10)
+    device_a._set_now(now)  # pylint: disable=protected-access
+    device_b._set_now(now)  # pylint: disable=protected-access
+    coordinator._action_timeout_sec = 0.05  # pylint: disable=protected-access
+    # fmt:off
+    with patch("homeassistant.core.StateMachine.get", side_effect=side_effects.get_side_effects()), \
+         patch("custom_components.solar_optimizer.managed_device.do_service_action", side_effect=fail_or_wait):
+    # fmt:on
+        calculated_data = await coordinator._async_update_data()
+
+    assert calculated_data["actuation_errors"] == {
+        "Equipement A": "Cloud not reachable",
+        "Equipement B": "actions not done within 0.05 sec",
+    }
+
+
+async def test_actuation_with_services(hass: HomeAssistant, init_solar_optimizer_central_config):
+    """The services are called in blocking mode so their errors and their duration are given by device"""
+    await create_test_device(hass, "Equipement A", 1000)
+    await create_test_device(hass, "Equipement B", 500)
+    coordinator: SolarOptimizerCoordinator = SolarOptimizerCoordinator.get_coordinator()
+    coordinator._smooth_production = False  # pylint: disable=protected-access
+    coordinator._action_timeout_sec = 0.05  # pylint: disable=protected-access
+
+    side_effects = create_side_effects(500, 2000)
+    side_effects.add_or_update_side_effect("input_boolean.fake_equipement_a", State("input_boolean.fake_equipement_a", STATE_ON))
+    hass.states.async_set("input_boolean.fake_equipement_a", STATE_ON)
+    await hass.async_block_till_done()
+
+    calls = []
+
+    async def turn_off(service_call: ServiceCall):
+        calls.append(("turn_off", service_call.data["entity_id"]))
+        raise HomeAssistantError("Cloud not reachable")
+
+    async def turn_on(service_call: ServiceCall):
+        calls.append(("turn_on", service_call.data["entity_id"]))
+        await asyncio.sleep(1)
+
+    hass.services.async_register("input_boolean", "turn_off", turn_off)
+    hass.services.async_register("input_boolean", "turn_on", turn_on)
+
+    with patch("homeassistant.core.StateMachine.get", side_effect=side_effects.get_side_effects()):
+        calculated_data = await coordinator._async_update_data()
+
+    assert calls == [("turn_off", "input_boolean.fake_equipement_a"), ("turn_on", "input_boolean.fake_equipement_b")]
+    assert calculated_data["actuation_errors"] == {
+        "Equipement A": "Cloud not reachable",
+        "Equipement B": "actions not done within 0.05 sec",
+    }
+
+
+
+
+async def test_switch_with_failing_services(hass: HomeAssistant, init_solar_optimizer_central_config):
+    """A service which fails or is too long does not break the toggle of the switch of a device"""
+    await create_test_device(hass, "Equipement A")
+    coordinator: SolarOptimizerCoordinator = SolarOptimizerCoordinator.get_coordinator()
+    coordinator._action_timeout_sec = 0.05  # pylint: disable=protected-access
+    device_switch = search_entity(hass, "switch.solar_optimizer_equipement_a", SWITCH_DOMAIN)
+
+    async def turn_on(_: ServiceCall):
+        await asyncio.sleep(1)
+
+    async def turn_off(_: ServiceCall):
+        raise HomeAssistantError("Cloud not reachable")
+
+    hass.services.async_register("input_boolean", "turn_on", turn_on)
+    hass.services.async_register("input_boolean", "turn_off", turn_off)
+
+    # the activation is too long: the switch stays off
+    await device_switch.async_turn_on()
+    assert device_switch.is_on is False
+
+    async def turn_on_ok(_: ServiceCall):
+        return
+
+    hass.services.async_register("input_boolean", "turn_on", turn_on_ok)
+    await device_switch.async_turn_on()
+    assert device_switch.is_on is True
+
+    # the deactivation fails: the switch stays on
+    await device_switch.async_turn_off()
+    assert device_switch.is_on is True
+
+async def test_render_cycle_ended_on_error(hass: HomeAssistant, init_solar_optimizer_central_config):
+    """The templates are rendered again at each access after a calculation which has failed"""
+    device = await create_test_device(hass, "Equipement A")
+    coordinator: SolarOptimizerCoordinator = SolarOptimizerCoordinator.get_coordinator()
+
+    side_effects = create_side_effects(500, 2000)
+    # fmt:off
+    with patch("homeassistant.core.StateMachine.get", side_effect=side_effects.get_side_effects()), \
+         patch.object(coordinator._algo, "optimiser", side_effect=RuntimeError("boom")), \
+         pytest.raises(RuntimeError):
+    # fmt:on
+        await coordinator._async_update_data()
+
+    assert device._render_cache is None  # pylint: disable=protected-access
+
+async def test_device_index(hass: HomeAssistant, init_solar_optimizer_central_config):
+    """The devices are found by unique_id and by name after add, replace and remove"""
+    coordinator: SolarOptimizerCoordinator = SolarOptimizerCoordinator.get_coordinator()
+
+    def fake_device(name):
+        device = MagicMock(spec=ManagedDevice, unique_id=name_to_unique_id(name))
+        device.name = name
+        return device
+
+    device_a, device_b = fake_device("Equipement A"), fake_device("Equipement B")
+    coordinator.add_device(device_a)
+    coordinator.add_device(device_b)
+    assert coordinator.get_device_by_unique_id("equipement_a") is device_a
+    assert coordinator.get_device_by_name("Equipement B") is device_b
+
+    # replace keeps the position
+    new_device_a = fake_device("Equipement A")
+    coordinator.add_device(new_device_a)
+    assert coordinator.devices == [new_device_a, device_b]
+    assert coordinator.get_device_by_unique_id("equipement_a") is new_device_a
+    assert coordinator.get_device_by_name("Equipement A") is new_device_a
+
+    coordinator.remove_device("equipement_a")
+    assert coordinator.devices == [device_b]
+    assert coordinator.get_device_by_unique_id("equipement_a") is None
+    assert coordinator.get_device_by_name("Equipement A") is None
+
+
+async def test_cycle_statistics(hass: HomeAssistant, init_solar_optimizer_central_config):
+    """The durations of the cycles are measured and published by the cycle_duration sensor"""
+    await create_test_device(hass, "Equipement A")
+    # with a surplus between the powers of the devices, the solution is searched
+    await create_test_device(hass, "Equipement B", 300)
+    coordinator: SolarOptimizerCoordinator = SolarOptimizerCoordinator.get_coordinator()
+
+    side_effects = create_side_effects(-500, 1000)
+    with patch("homeassistant.core.StateMachine.get", side_effect=side_effects.get_side_effects()):
+        calculated_data = await coordinator._async_update_data()  # pylint: disable=protected-access
+
+    assert calculated_data["cycle_duration"] >= 0
+    attributes = coordinator.cycle_statistics.as_attributes()
+    assert attributes["cycles"] == 1
+    assert attributes["iterations"] > 0
+    assert 0 <= attributes["acceptance_ratio"] <= 1
+    for step in ("state", "solver", "actuation", "total"):
+        assert attributes[f"{step}_p50_ms"] <= attributes[f"{step}_p95_ms"] <= attributes[f"{step}_max_ms"]
+
+    statistics = CycleStatistics(10)
+    for duration in range(1, 21):
+        statistics.add({"state": duration, "solver": duration, "actuation": duration, "total": duration}, 100, 0.5)
+    attributes = statistics.as_attributes()
+    # Only the last 10 cycles are kept
+    assert attributes["total_ms"] == 20
+    assert attributes["total_p50_ms"] == 15
+    assert attributes["total_p95_ms"] == 20
+    assert attributes["total_max_ms"] == 20
+    assert attributes["cycles"] == 20
+
+
+async def test_fast_paths(hass: HomeAssistant, init_solar_optimizer_central_config):
+    """At night, the best solution is found without search and the fast path is counted"""
+    await create_test_device(hass, "Equipement A")
+    coordinator: SolarOptimizerCoordinator = SolarOptimizerCoordinator.get_coordinator()
+
+    side_effects = create_side_effects(300, 0)
+    with patch("homeassistant.core.StateMachine.get", side_effect=side_effects.get_side_effects()):
+        calculated_data = await coordinator._async_update_data()  # pylint: disable=protected-access
+
+    assert calculated_data["total_power"] == 0
+    assert coordinator.fast_paths[FAST_PATH_NO_SURPLUS] == 1
+    assert coordinator.cycle_statistics.as_attributes()["iterations"] == 0
+
+
+async def test_replay_captured_cycle(hass: HomeAssistant, init_solar_optimizer_central_config, tmp_path):
+    """A captured cycle is replayed with the same result"""
+    await create_test_device(hass, "Equipement A", 700)
+    await create_test_device(hass, "Equipement B", 500)
+    await create_test_device(hass, "Equipement C", 300)
+    coordinator: SolarOptimizerCoordinator = SolarOptimizerCoordinator.get_coordinator()
+
+    side_effects = create_side_effects(-900, 2000)
+    with patch("homeassistant.core.StateMachine.get", side_effect=side_effects.get_side_effects()):
+        await coordinator._async_update_data()  # pylint: disable=protected-access
+
+    response = await hass.services.async_call(DOMAIN, SERVICE_GET_CAPTURED_CYCLES, {}, blocking=True, return_response=True)
+    cycles = response["cycles"]
+    assert len(cycles) == 1
+    cycle = cycles[0]
+    assert cycle["seed"] is not None
+    assert [eqt["unique_id"] for eqt in cycle["equipements"]] == ["equipement_a", "equipement_b", "equipement_c"]
+
+    for _ in range(3):
+        result = replay_cycle(cycle)
+        assert result["same_result"] is True
+
+    # The cycles are saved in a file and replayed offline
+    cycles_file = tmp_path / "cycles.json"
+    cycles_file.write_text(json.dumps(response), encoding="utf-8")
+    assert replay_main([str(cycles_file), "--repeat", "2"]) == 0
+
+
+async def test_input_snapshot(hass: HomeAssistant, init_solar_optimizer_central_config):
+    """The entities of a cycle are read once in a snapshot and the powers are converted to W"""
+    await create_test_device(hass, "Equipement A")
+    coordinator: SolarOptimizerCoordinator = SolarOptimizerCoordinator.get_coordinator()
+
+    side_effects = create_side_effects(500, 0)
+    side_effects.add_or_update_side_effect(
+        "sensor.fake_power_production",
+        State("sensor.fake_power_production", 2, {"device_class": "power", "unit_of_measurement": "kW"}),
+    )
+    with patch("homeassistant.core.StateMachine.get", side_effect=side_effects.get_side_effects()) as mock_get:
+        calculated_data = await coordinator._async_update_data()
+
+    assert calculated_data["power_production_brut"] == 2000
+    assert calculated_data["power_consumption"] == 500
+    assert calculated_data["sell_cost"] == 1
+    assert calculated_data["battery_soc"] == 50
+    read_entity_ids = [call.args[0] for call in mock_get.call_args_list]
+    for entity_id in create_side_effects(0, 0)._current_side_effects:  # pylint: disable=protected-access
+        assert read_entity_ids.count(entity_id) == 1
+
+    # The snapshot cannot be modified and the missing entities are not available
+    with patch("homeassistant.core.StateMachine.get", side_effect=side_effects.get_side_effects()):
+        snapshot = InputSnapshot(hass, ["sensor.fake_power_production", "sensor.fake_power_production", None], ["sensor.fake_power_production"])
+    assert snapshot.entity_ids == ("sensor.fake_power_production",)
+    assert snapshot.get_float("sensor.fake_power_production") == 2
+    assert snapshot.get_power("sensor.fake_power_production") == 2000
+    assert snapshot.get_float("sensor.other") is None
+    with pytest.raises(AttributeError):
+        snapshot.other = 1
+    with pytest.raises(TypeError):
+        snapshot._values["sensor.other"] = 1  # pylint: disable=protected-access
+
+
+async def test_shared_on_time_ticker(hass: HomeAssistant, init_solar_optimizer_central_config):
+    """One ticker updates the on time of all the devices and writes only the sensors which have changed"""
+    device_a = await create_test_device(hass, "Equipement A")
+    device_b = await create_test_device(hass, "Equipement B")
+    coordinator: SolarOptimizerCoordinator = SolarOptimizerCoordinator.get_coordinator()
+    assert coordinator.on_time_sensors_count == 2
+
+    sensor_a = search_entity(hass, "sensor.on_time_today_solar_optimizer_equipement_a", SENSOR_DOMAIN)
+    sensor_b = search_entity(hass, "sensor.on_time_today_solar_optimizer_equipement_b", SENSOR_DOMAIN)
+
+    # A becomes on, B stays off
+    now = dt_util.now()
+    device_a._set_now(now)  # pylint: disable=protected-access
+    device_b._set_now(now)  # pylint: disable=protected-access
+    hass.states.async_set("input_boolean.fake_equipement_a", STATE_ON)
+    await hass.async_block_till_done()
+    assert sensor_a.last_datetime_on == now
+
+    device_a._set_now(now + timedelta(seconds=60))  # pylint: disable=protected-access
+    # fmt:off
+    with patch.object(sensor_a, "async_write_ha_state") as mock_write_a, \
+         patch.object(sensor_b, "async_write_ha_state") as mock_write_b:
+    # fmt:on
+        async_fire_time_changed(hass, dt_util.utcnow() + timedelta(minutes=1, seconds=1))
+        await hass.async_block_till_done()
+        assert mock_write_a.call_count == 1
+        assert mock_write_b.call_count == 0
+        assert sensor_a.state == 60
+        assert device_a._on_time_sec == 60  # pylint: disable=protected-access
+
+        # The reset at raz_time writes only the sensors which are not already reset
+        coordinator._async_on_raz_time()  # pylint: disable=protected-access
+        assert mock_write_a.call_count == 2
+        assert mock_write_b.call_count == 0
+        assert sensor_a.state == 0
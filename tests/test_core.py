@@ -0,0 +1,77 @@
+""" Unit tests of the optimization core. They do not need Home Assistant """
+import ast
+import dataclasses
+from pathlib import Path
+
+import pytest
+
+from custom_components.solar_optimizer.core import (
+    ALGORITHM_MODE_EXACT,
+    DeviceSnapshot,
+    GridSnapshot,
+    SimulatedAnnealingAlgorithm,
+    solve,
+)
+
+CORE_DIR = Path(__file__).parent.parent / "custom_components" / "solar_optimizer" / "core"
+
+
+def test_core_does_not_import_home_assistant():
+    """The modules of the core only import the standard library and the core itself"""
+    for module in CORE_DIR.glob("*.py"):
+        for node in ast.walk(ast.parse(module.read_text(encoding="utf-8"))):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom):
+                # a relative import must stay in the core package
+                assert node.level <= 1, f"{module.name} imports outside of the core"
+                names = [node.module or ""]
+            else:
+                continue
+            assert not any(name.startswith("homeassistant") for name in names), f"{module.name} imports Home Assistant"
+
+
+def test_solve():
+    """The solver finds the devices which use the surplus from plain snapshots"""
+    devices = [
+        DeviceSnapshot("A", "a", 1000),
+        DeviceSnapshot("B", "b", 500, is_active=True, current_power=500),
+        DeviceSnapshot("C", "c", 2000),
+        DeviceSnapshot("Power", "power", 2000, power_min=100, power_step=100),
+        DeviceSnapshot("Disabled", "disabled", 300, is_enabled=False),
+    ]
+    # 500 W are consumed by B and 1800 W are given back to the grid
+    grid = GridSnapshot(power_consumption=-1800, power_production=3000, sell_cost=1, buy_cost=1)
+
+    result = solve(SimulatedAnnealingAlgorithm(1000, 0.1, 0.99, 1000, mode=ALGORITHM_MODE_EXACT), devices, grid)
+
+    assert [eqt["unique_id"] for eqt in result.best_solution] == ["a", "b", "c", "power"]
+    assert result.best_objective == 0
+    assert result.total_power == 2300
+    assert result.iterations == 0
+
+    # The annealing is seeded: the same seed gives the same result
+    algo = SimulatedAnnealingAlgorithm(1000, 0.1, 0.99, 1000)
+    first = solve(algo, devices, grid, seed=3)
+    assert first == solve(algo, devices, grid, seed=3)
+    assert first.iterations > 0
+
+
+def test_solve_incomplete_inputs():
+    """Without the costs, there is no solution"""
+    grid = GridSnapshot(power_consumption=-1000, power_production=2000, sell_cost=None, buy_cost=1)
+    result = solve(SimulatedAnnealingAlgorithm(1000, 0.1, 0.99, 1000), [DeviceSnapshot("A", "a", 1000)], grid)
+    assert (result.best_solution, result.best_objective, result.total_power) == ([], -1, -1)
+
+
+def test_snapshots():
+    """The snapshots are immutable and give the equipment dict of the algorithm"""
+    device = DeviceSnapshot("A", "a", 1000, is_active=True, current_power=1000, is_usable=False)
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        device.power_max = 10
+    # active but not usable (and not waiting): the device should be stopped
+    assert device.to_equipement()["state"] is False
+    assert device.can_change_power is False
+    assert DeviceSnapshot.from_device(device) is device
+
+    assert GridSnapshot(-500, 1000, 1, 1, battery_charge_power=200).consumption_with_battery == -300
@@ -79,3 +79,49 @@ async def test_set_enable(
     assert device_switch.state == "off"
     # The enable state should be False
     assert device_switch.get_attr_extra_state_attributes.get("is_enabled") is True
+
+
+async def test_enable_state_change_signal(
+    hass: HomeAssistant,
+    init_solar_optimizer_central_config,
+):
+    """The entities of the device are signaled directly. The bus event is fired only if it is configured"""
+    entry_a = MockConfigEntry(
+        domain=DOMAIN,
+        title="Equipement A",
+        unique_id="eqtAUniqueId",
+        data={
+            CONF_NAME: "Equipement A",
+            CONF_DEVICE_TYPE: CONF_DEVICE,
+            CONF_ENTITY_ID: "input_boolean.fake_device_a",
+            CONF_POWER_MAX: 1000,
+            CONF_CHECK_USABLE_TEMPLATE: "{{ True }}",
+            CONF_DURATION_MIN: 0.3,
+            CONF_DURATION_STOP_MIN: 0.1,
+            CONF_ACTION_MODE: CONF_ACTION_MODE_ACTION,
+            CONF_ACTIVATION_SERVICE: "input_boolean/turn_on",
+            CONF_DEACTIVATION_SERVICE: "input_boolean/turn_off",
+        },
+    )
+    device = await create_managed_device(hass, entry_a, "equipement_a")
+    enable_switch = search_entity(hass, "switch.enable_solar_optimizer_equipement_a", SWITCH_DOMAIN)
+    device_switch = search_entity(hass, "switch.solar_optimizer_equipement_a", SWITCH_DOMAIN)
+
+    events = []
+    hass.bus.async_listen(EVENT_TYPE_SOLAR_OPTIMIZER_ENABLE_STATE_CHANGE, events.append)
+
+    # set_enable is called outside of the enable switch
+    device.set_enable(False)
+    await hass.async_block_till_done()
+    assert enable_switch.state == "off"
+    assert device_switch.get_attr_extra_state_attributes.get("is_enabled") is False
+    assert events == []
+
+    coordinator: SolarOptimizerCoordinator = SolarOptimizerCoordinator.get_coordinator()
+    coordinator._publish_enable_state_events = True  # pylint: disable=protected-access
+    device.set_enable(True)
+    await hass.async_block_till_done()
+    assert enable_switch.state == "on"
+    assert len(events) == 1
+    assert events[0].data["device_unique_id"] == "equipement_a"
+    assert events[0].data["is_enabled"] is True
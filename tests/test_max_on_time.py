@@ -2,7 +2,7 @@
 
 # pylint: disable=protected-access
 
-# from unittest.mock import patch
+from unittest.mock import patch
 from datetime import timedelta
 
 
@@ -143,7 +143,7 @@ async def test_max_on_time_calculation(
     assert device_on_time_sensor.state == 13
 
     #
-    # 6. reactivate and call on_update_on_time
+    # 6. reactivate and tick the on time
     #
     # Change now
     now = now + timedelta(minutes=1)
@@ -155,25 +155,31 @@ async def test_max_on_time_calculation(
     assert device_on_time_sensor.state == 13
 
     #
-    # 7. Simulate the call to the periodic _on_update_on_time
+    # 7. Simulate the periodic tick of the coordinator
     #
     # Change now
     now = now + timedelta(seconds=55)
     device._set_now(now)
 
-    await device_on_time_sensor._on_update_on_time()
+    coordinator: SolarOptimizerCoordinator = SolarOptimizerCoordinator.get_coordinator()
+    with patch.object(device_on_time_sensor, "async_write_ha_state") as mock_write:
+        coordinator._async_on_time_tick()
+        assert mock_write.call_count == 1
+        # the time has not changed: the sensor is not written again
+        coordinator._async_on_time_tick()
+        assert mock_write.call_count == 1
     await hass.async_block_till_done()
 
     assert device_on_time_sensor.last_datetime_on == now
     assert device_on_time_sensor.state == 68  # 55+13
 
     #
-    # 8. Call _at_midnight to reset the counter
+    # 8. Simulate the reset of the counters at raz_time
     # Change now
     now = now + timedelta(hours=1)
     device._set_now(now)
 
-    await device_on_time_sensor._on_midnight()
+    coordinator._async_on_raz_time()
     await hass.async_block_till_done()
 
     assert device_on_time_sensor.last_datetime_on == now
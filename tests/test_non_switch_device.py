@@ -73,6 +73,7 @@ async def test_climate_device(
                         target= {
                             "entity_id": "climate.fake_device_a",
                         },
+                        blocking=True,
                     ),
                 ]
             )
@@ -94,6 +95,7 @@ async def test_climate_device(
                         target= {
                             "entity_id": "climate.fake_device_a",
                         },
+                        blocking=True,
                     ),
                 ]
             )
@@ -158,6 +160,7 @@ async def test_humidifier_device(
                         target= {
                             "entity_id": "humidifier.fake_device_a",
                         },
+                        blocking=True,
                     ),
                 ]
             )
@@ -177,6 +180,7 @@ async def test_humidifier_device(
                         target= {
                             "entity_id": "humidifier.fake_device_a",
                         },
+                        blocking=True,
                     ),
                 ]
             )
@@ -242,6 +246,7 @@ async def test_fan_device(
                         target= {
                             "entity_id": "fan.fake_device_a",
                         },
+                        blocking=True,
                     ),
                 ]
             )
@@ -261,6 +266,7 @@ async def test_fan_device(
                         target= {
                             "entity_id": "fan.fake_device_a",
                         },
+                        blocking=True,
                     ),
                 ]
             )
@@ -326,6 +332,7 @@ async def test_light_device(
                         target= {
                             "entity_id": "light.fake_device_a",
                         },
+                        blocking=True,
                     ),
                 ]
             )
@@ -345,6 +352,7 @@ async def test_light_device(
                         target= {
                             "entity_id": "light.fake_device_a",
                         },
+                        blocking=True,
                     ),
                 ]
             )
@@ -412,6 +420,7 @@ async def test_select_device(
                         target= {
                             "entity_id": "select.fake_device_a",
                         },
+                        blocking=True,
                     ),
                 ]
             )
@@ -433,6 +442,7 @@ async def test_select_device(
                         target= {
                             "entity_id": "select.fake_device_a",
                         },
+                        blocking=True,
                     ),
                 ]
             )
@@ -494,6 +504,7 @@ async def test_button_device(
                         target= {
                             "entity_id": "button.fake_device_a",
                         },
+                        blocking=True,
                     ),
                 ]
             )
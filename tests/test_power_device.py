@@ -8,7 +8,7 @@ from homeassistant.components.select import DOMAIN as SELECT_DOMAIN
 
 
 from .commons import *  # pylint: disable=wildcard-import, unused-wildcard-import
-from custom_components.solar_optimizer.managed_device import ACTION_ACTIVATE, ACTION_DEACTIVATE, ACTION_CHANGE_POWER
+from custom_components.solar_optimizer.managed_device import ACTION_ACTIVATE, ACTION_DEACTIVATE, ACTION_CHANGE_POWER, parse_service_action
 
 async def test_power_device(
     hass: HomeAssistant,
@@ -494,6 +494,7 @@ async def test_light_power_device(
                         target= {
                             "entity_id": "light.fake_device_a",
                         },
+                        blocking=True,
                     ),
                 ]
             )
@@ -513,6 +514,7 @@ async def test_light_power_device(
                         target= {
                             "entity_id": "light.fake_device_a",
                         },
+                        blocking=True,
                     ),
                 ]
             )
@@ -532,6 +534,7 @@ async def test_light_power_device(
                         target= {
                             "entity_id": "light.fake_device_a",
                         },
+                        blocking=True,
                     ),
                 ]
             )
@@ -551,11 +554,66 @@ async def test_light_power_device(
                         target= {
                             "entity_id": "light.fake_device_a",
                         },
+                        blocking=True,
                     ),
                 ]
             )
 
 
+async def test_light_power_device_refresh_cycle(
+    hass: HomeAssistant,
+    init_solar_optimizer_central_config,
+):
+    """A full refresh cycle with a light whose power is given by its brightness attribute (the state is 'on')"""
+    entry_a = MockConfigEntry(
+        domain=DOMAIN,
+        title="Equipement A",
+        unique_id="eqtAUniqueId",
+        data={
+            CONF_NAME: "Equipement A",
+            CONF_DEVICE_TYPE: CONF_POWERED_DEVICE,
+            CONF_ENTITY_ID: "light.fake_device_a",
+            CONF_POWER_MAX: 1000,
+            CONF_CHECK_USABLE_TEMPLATE: "{{ True }}",
+            CONF_DURATION_MIN: 0.3,
+            CONF_DURATION_STOP_MIN: 0.1,
+            CONF_ACTION_MODE: CONF_ACTION_MODE_ACTION,
+            CONF_ACTIVATION_SERVICE: "light/turn_on",
+            CONF_DEACTIVATION_SERVICE: "light/turn_off",
+            CONF_POWER_MIN: 100,
+            CONF_POWER_STEP: 4,
+            CONF_POWER_ENTITY_ID: "light.fake_device_a",
+            CONF_DURATION_POWER_MIN: 0.25,
+            CONF_CHANGE_POWER_SERVICE: "light/turn_on/brightness",
+            CONF_CONVERT_POWER_DIVIDE_FACTOR: 4,
+        },
+    )
+    device = await create_managed_device(hass, entry_a, "equipement_a")
+
+    hass.states.async_set("light.fake_device_a", STATE_ON, {"brightness": 100})
+    for entity_id, value in (
+        ("sensor.fake_power_consumption", 0),
+        ("sensor.fake_power_production", 1000),
+        ("sensor.fake_battery_charge_power", 0),
+        ("sensor.fake_battery_soc", 0),
+        ("input_number.fake_sell_cost", 1),
+        ("input_number.fake_buy_cost", 1),
+        ("input_number.fake_sell_tax_percent", 0),
+    ):
+        hass.states.async_set(entity_id, value)
+    await hass.async_block_till_done()
+
+    coordinator = SolarOptimizerCoordinator.get_coordinator()
+    with patch("homeassistant.core.ServiceRegistry.async_call"):
+        calculated_data = await coordinator._async_update_data()  # pylint: disable=protected-access
+
+    assert calculated_data is not None
+    assert calculated_data["power_consumption"] == 0
+    # 100 * 4
+    assert device.current_power == 400
+    assert len(calculated_data["best_solution"]) == 1
+
+
 async def test_fan_power_device(
     hass: HomeAssistant,
     init_solar_optimizer_central_config,
@@ -622,6 +680,7 @@ async def test_fan_power_device(
                         target= {
                             "entity_id": "fan.fake_device_a",
                         },
+                        blocking=True,
                     ),
                 ]
             )
@@ -641,6 +700,7 @@ async def test_fan_power_device(
                         target= {
                             "entity_id": "fan.fake_device_a",
                         },
+                        blocking=True,
                     ),
                 ]
             )
@@ -660,6 +720,7 @@ async def test_fan_power_device(
                         target= {
                             "entity_id": "fan.fake_device_a",
                         },
+                        blocking=True,
                     ),
                 ]
             )
@@ -679,7 +740,49 @@ async def test_fan_power_device(
                         target= {
                             "entity_id": "fan.fake_device_a",
                         },
+                        blocking=True,
                     ),
                 ]
             )
-    
\ No newline at end of file
+    
+
+
+async def test_service_declarations_are_parsed_once(hass: HomeAssistant, init_solar_optimizer_central_config):
+    """The services are parsed when the device is created and an incorrect declaration is a configuration error"""
+    action = parse_service_action("light/turn_on/brightness", "light.fake_light")
+    assert (action.domain, action.action, action.parameter, action.attribute) == ("light", "turn_on", "brightness", "brightness")
+    assert parse_service_action("input_number/set_value", "input_number.fake").attribute == "value"
+    assert dict(parse_service_action("climate/set_hvac_mode/hvac_mode:heat", "climate.fake").data) == {"hvac_mode": "heat"}
+    assert parse_service_action("", "switch.fake") is None
+    with pytest.raises(TypeError):
+        action.data["brightness"] = 10
+    with pytest.raises(ConfigurationError):
+        parse_service_action("switch.turn_on", "switch.fake")
+
+    config = {
+        CONF_NAME: "Light",
+        CONF_ENTITY_ID: "light.fake_light",
+        CONF_POWER_ENTITY_ID: "light.fake_light",
+        CONF_POWER_MAX: 100,
+        CONF_POWER_MIN: 10,
+        CONF_POWER_STEP: 10,
+        CONF_DURATION_MIN: 1,
+        CONF_ACTION_MODE: CONF_ACTION_MODE_ACTION,
+        CONF_ACTIVATION_SERVICE: "light/turn_on",
+        CONF_DEACTIVATION_SERVICE: "light/turn_off",
+        # the attribute which gives the power of a light is missing
+        CONF_CHANGE_POWER_SERVICE: "light/turn_on",
+    }
+    coordinator = SolarOptimizerCoordinator.get_coordinator()
+    with pytest.raises(ConfigurationError):
+        ManagedDevice(hass, config, coordinator)
+
+    with pytest.raises(ConfigurationError):
+        ManagedDevice(hass, {**config, CONF_CHANGE_POWER_SERVICE: "light/turn_on/brightness", CONF_ACTIVATION_SERVICE: "light"}, coordinator)
+
+    device = ManagedDevice(hass, {**config, CONF_CHANGE_POWER_SERVICE: "light/turn_on/brightness"}, coordinator)
+    device._hass = MagicMock()  # pylint: disable=protected-access
+    device._hass.states.get.return_value = State("light.fake_light", STATE_ON, {"brightness": 5})  # pylint: disable=protected-access
+    with patch.object(ManagedDevice, "is_active", new_callable=PropertyMock, return_value=True):
+        device.set_current_power_with_device_state()
+    assert device.current_power == 5
@@ -0,0 +1,72 @@
+""" Test the accelerated-time simulation """
+from datetime import datetime, timedelta
+
+from benchmarks.simulate import CENTRAL_DEFAULTS, device_entry_data
+from custom_components.solar_optimizer.simulation import Simulation, SeriesPoint, load_series, resample
+
+from .commons import *  # pylint: disable=wildcard-import, unused-wildcard-import
+
+
+def test_load_series(tmp_path):
+    """A simple CSV and a Home Assistant history export give the same series"""
+    simple_file = tmp_path / "series.csv"
+    simple_file.write_text(
+        "time,production,consumption\n"
+        "2024-06-01T12:00:00+00:00,1000,300\n"
+        "2024-06-01T12:10:00+00:00,unavailable,400\n",
+        encoding="utf-8",
+    )
+    history_file = tmp_path / "history.csv"
+    history_file.write_text(
+        "entity_id,state,last_changed\n"
+        "sensor.house,300,2024-06-01T12:00:00Z\n"
+        "sensor.solar,1000,2024-06-01T12:00:00Z\n"
+        "sensor.other,5,2024-06-01T12:05:00Z\n"
+        "sensor.house,400,2024-06-01T12:10:00Z\n",
+        encoding="utf-8",
+    )
+
+    series = load_series(str(simple_file))
+    assert series == load_series(str(history_file), "sensor.solar", "sensor.house")
+    assert [(point.production, point.consumption) for point in series] == [(1000, 300), (1000, 400)]
+
+    points = resample(series, timedelta(minutes=4))
+    assert [point.time.minute for point in points] == [0, 4, 8]
+    assert [point.consumption for point in points] == [300, 300, 300]
+
+
+async def test_simulation(hass: HomeAssistant):
+    """A device is switched on with the solar production and off at night. The report counts the switches and the energies"""
+    assert await async_setup_component(hass, DOMAIN, {DOMAIN: {"algorithm": {"max_iteration_number": 300}}})
+    entries = [
+        CENTRAL_DEFAULTS,
+        device_entry_data({CONF_NAME: "Pool pump", CONF_ENTITY_ID: "switch.pool_pump", CONF_POWER_MAX: 1000}),
+    ]
+    for data in entries:
+        entry = MockConfigEntry(domain=DOMAIN, title=data[CONF_NAME], unique_id=data[CONF_NAME], data=data)
+        await create_managed_device(hass, entry, "pool_pump")
+    await hass.async_block_till_done()
+
+    coordinator = SolarOptimizerCoordinator.get_coordinator()
+    start = datetime(2024, 6, 1, 10, 0, tzinfo=get_tz(hass))
+    series = [
+        SeriesPoint(start, 2000, 300),
+        SeriesPoint(start + timedelta(hours=1), 0, 300),
+        SeriesPoint(start + timedelta(hours=2), 0, 300),
+    ]
+
+    report = await Simulation(hass, coordinator).async_run(series, timedelta(minutes=10))
+
+    assert report["cycles"] == 13
+    assert report["switches"] == {"Pool pump": 2}
+    assert report["on_time_min"] == {"Pool pump": 60}
+    assert hass.states.get("switch.pool_pump").state == STATE_OFF
+    assert report["decisions"][0]["devices"] == {"Pool pump": 1000}
+    assert report["decisions"][-1]["devices"] == {}
+    # 6 cycles of 2000 W of production with 1300 W of consumption, then 7 cycles of 300 W without production
+    assert report["production_kwh"] == 2
+    assert report["self_consumption_kwh"] == 1.3
+    assert report["exported_kwh"] == 0.7
+    assert report["imported_kwh"] == 0.35
+    assert report["self_consumption_ratio"] == 0.65
+    assert report["cpu_ms_per_cycle"]["max"] >= report["cpu_ms_per_cycle"]["mean"] >= 0
@@ -0,0 +1,85 @@
+""" Test the headless solver """
+import json
+
+from custom_components.solar_optimizer.solve import main, read_problems
+
+
+def test_solve_ndjson(tmp_path, capsys):
+    """The problems of a NDJSON file are solved and the solutions are written as NDJSON"""
+    problem = {
+        "id": "noon",
+        "devices": [
+            {"name": "A", "power_max": 1000},
+            {"name": "B", "power_max": 500, "state": True},
+            {"name": "Power", "power_max": 2000, "power_min": 100, "power_step": 100, "priority": 4},
+        ],
+        "power_consumption": -1200,
+        "power_production": 3000,
+        "sell_cost": 1,
+        "buy_cost": 1,
+    }
+    problems_file = tmp_path / "problems.ndjson"
+    problems_file.write_text(
+        "\n".join(
+            [
+                json.dumps(problem),
+                "",
+                json.dumps(dict(problem, id="exact", algorithm={"mode": "exact"})),
+                json.dumps({"id": "broken", "devices": []}),
+            ]
+        ),
+        encoding="utf-8",
+    )
+    solutions_file = tmp_path / "solutions.ndjson"
+
+    # The broken problem gives an error
+    assert main([str(problems_file), "--output", str(solutions_file), "--seed", "1"]) == 1
+    assert "3 problems solved" in capsys.readouterr().err
+
+    solutions = [json.loads(line) for line in solutions_file.read_text(encoding="utf-8").splitlines()]
+    assert [solution["id"] for solution in solutions] == ["noon", "exact", "broken"]
+    assert [solution["index"] for solution in solutions] == [0, 1, 2]
+    for solution in solutions[:2]:
+        # B consumes 500 W and 1200 W are given back: 1700 W could be used
+        assert solution["total_power"] == 1700
+        assert solution["best_objective"] == 0
+        assert solution["solve_ms"] >= 0
+        assert [eqt["unique_id"] for eqt in solution["best_solution"]] == ["A", "B", "Power"]
+    assert solutions[1]["iterations"] == 0
+    # A surplus between the powers of the devices is not a fast path
+    assert solutions[0]["fast_path"] is None
+    assert "KeyError" in solutions[2]["error"]
+
+
+def test_read_problems_json_array():
+    """A JSON array of problems is read"""
+    lines = ["[\n", '  {"id": 1},\n', '  {"id": 2}\n', "]\n"]
+    assert list(read_problems(lines)) == [{"id": 1}, {"id": 2}]
+
+
+def test_read_problems_single_json_problem():
+    """One problem written on several lines is read"""
+    lines = ["{\n", '  "id": 1,\n', '  "devices": []\n', "}\n"]
+    assert list(read_problems(lines)) == [{"id": 1, "devices": []}]
+
+
+def test_solve_invalid_lines(tmp_path, capsys):
+    """A line which is not valid JSON and a problem which is not an object give errors and the other problems are solved"""
+    problem = {"devices": [{"name": "A", "power_max": 1000}], "power_consumption": -1200, "power_production": 3000, "sell_cost": 1, "buy_cost": 1}
+    problems_file = tmp_path / "problems.ndjson"
+    problems_file.write_text(
+        "\n".join(['{"id": "broken", "devices": [', json.dumps(dict(problem, id="ok")), '"not a problem"', json.dumps({"id": "devices", "devices": ["A"]})]),
+        encoding="utf-8",
+    )
+    solutions_file = tmp_path / "solutions.ndjson"
+
+    assert main([str(problems_file), "--output", str(solutions_file)]) == 1
+    assert "4 problems solved" in capsys.readouterr().err
+
+    solutions = [json.loads(line) for line in solutions_file.read_text(encoding="utf-8").splitlines()]
+    assert [solution["index"] for solution in solutions] == [0, 1, 2, 3]
+    assert [solution["id"] for solution in solutions] == [None, "ok", None, "devices"]
+    assert solutions[0]["error"].startswith("ValueError: line 1: ")
+    assert solutions[1]["total_power"] == 1000
+    assert solutions[2]["error"] == "TypeError: a problem should be a JSON object, not str"
+    assert solutions[3]["error"].startswith("AttributeError")
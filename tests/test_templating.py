@@ -91,4 +91,112 @@ async def tests_device_with_template(
     assert device.power_max == power_max_value
     assert device.battery_soc_threshold == battery_soc_threshold_value
     assert device.max_on_time_per_day_sec == max_on_time_per_day_min_value * 60
-    assert device.min_on_time_per_day_sec == min_on_time_per_day_min_value * 60
\ No newline at end of file
+    assert device.min_on_time_per_day_sec == min_on_time_per_day_min_value * 60
+
+async def test_templates_rendered_once_per_cycle(hass: HomeAssistant, init_solar_optimizer_central_config):
+    """During a refresh cycle each template is rendered at most once"""
+    entry_a = MockConfigEntry(
+        domain=DOMAIN,
+        title="Equipement A",
+        unique_id="eqtAUniqueId",
+        data={
+            CONF_NAME: "Equipement A",
+            CONF_DEVICE_TYPE: CONF_DEVICE,
+            CONF_ENTITY_ID: "input_boolean.fake_device_a",
+            CONF_POWER_MAX: "{{ 1000 }}",
+            CONF_CHECK_USABLE_TEMPLATE: "{{ True }}",
+            CONF_DURATION_MIN: 0.3,
+            CONF_DURATION_STOP_MIN: 0.1,
+            CONF_ACTION_MODE: CONF_ACTION_MODE_ACTION,
+            CONF_ACTIVATION_SERVICE: "input_boolean/turn_on",
+            CONF_DEACTIVATION_SERVICE: "input_boolean/turn_off",
+            CONF_BATTERY_SOC_THRESHOLD: "{{ 30 }}",
+            CONF_MAX_ON_TIME_PER_DAY_MIN: "{{ 10 }}",
+        },
+    )
+    device = await create_managed_device(hass, entry_a, "equipement_a")
+    device.set_battery_soc(50)
+
+    with patch.object(Template, "async_render", autospec=True, side_effect=Template.async_render) as mock_render:
+        device.start_render_cycle()
+        for _ in range(3):
+            assert device.is_active is False
+            assert device.is_usable is True
+            assert device.power_max == 1000
+        # power_max, battery_soc_threshold and max_on_time_per_day_min. The results of check_active and
+        # check_usable are tracked
+        assert mock_render.call_count == 3
+
+        # Outside of a cycle, the templates are rendered at each access
+        device.end_render_cycle()
+        assert device.power_max == 1000
+        assert device.power_max == 1000
+        assert mock_render.call_count == 5
+
+
+async def test_tracked_templates_index(hass: HomeAssistant, init_solar_optimizer_central_config):
+    """The results of check_usable and check_active are updated when their entities change and a high
+    priority device which becomes usable triggers a refresh"""
+    entry_a = MockConfigEntry(
+        domain=DOMAIN,
+        title="Equipement A",
+        unique_id="eqtAUniqueId",
+        data={
+            CONF_NAME: "Equipement A",
+            CONF_DEVICE_TYPE: CONF_DEVICE,
+            CONF_ENTITY_ID: "input_boolean.fake_device_a",
+            CONF_POWER_MAX: 1000,
+            CONF_CHECK_USABLE_TEMPLATE: "{{ is_state('input_boolean.fake_usable', 'on') }}",
+            CONF_DURATION_MIN: 0.3,
+            CONF_DURATION_STOP_MIN: 0.1,
+            CONF_ACTION_MODE: CONF_ACTION_MODE_ACTION,
+            CONF_ACTIVATION_SERVICE: "input_boolean/turn_on",
+            CONF_DEACTIVATION_SERVICE: "input_boolean/turn_off",
+        },
+    )
+    device = await create_managed_device(hass, entry_a, "equipement_a")
+    coordinator: SolarOptimizerCoordinator = SolarOptimizerCoordinator.get_coordinator()
+    assert coordinator.usable_device_ids == frozenset()
+    assert coordinator.active_device_ids == frozenset()
+
+    with patch.object(Template, "async_render", autospec=True, side_effect=Template.async_render) as mock_render:
+        assert device.is_active is False
+        assert device.is_template_usable is False
+        assert mock_render.call_count == 0
+
+    # The device becomes active
+    hass.states.async_set("input_boolean.fake_device_a", STATE_ON)
+    await hass.async_block_till_done()
+    assert device.is_active is True
+    assert coordinator.active_device_ids == {"equipement_a"}
+
+    # The device becomes usable. Without refresh_on_usable_priority there is no refresh
+    with patch.object(coordinator, "async_refresh") as mock_refresh:
+        hass.states.async_set("input_boolean.fake_usable", STATE_ON)
+        await hass.async_block_till_done()
+        assert device.is_template_usable is True
+        assert coordinator.usable_device_ids == {"equipement_a"}
+        assert mock_refresh.call_count == 0
+
+    # A high priority device which becomes usable refreshes the calculation
+    coordinator._refresh_on_usable_priority = PRIORITY_MAP[PRIORITY_HIGH]  # pylint: disable=protected-access
+    with patch.object(ManagedDevice, "priority", new=1):
+        hass.states.async_set("input_boolean.fake_usable", STATE_OFF)
+        await hass.async_block_till_done()
+        assert coordinator.usable_device_ids == frozenset()
+
+        with patch.object(coordinator, "async_refresh") as mock_refresh:
+            hass.states.async_set("input_boolean.fake_usable", STATE_ON)
+            await hass.async_block_till_done()
+            assert mock_refresh.call_count == 1
+            assert coordinator.usable_refreshes == 1
+            # it is not a consumption or production event
+            assert coordinator.events_received == 0
+            assert coordinator.events_executed == 0
+
+    # The tracking is stopped when the device is removed
+    coordinator.remove_device("equipement_a")
+    hass.states.async_set("input_boolean.fake_device_a", STATE_OFF)
+    await hass.async_block_till_done()
+    assert coordinator.active_device_ids == frozenset()
+    coordinator._usable_debouncer.async_cancel()  # pylint: disable=protected-access